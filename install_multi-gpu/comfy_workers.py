@@ -0,0 +1,324 @@
+import os
+import re
+import sys
+import shutil
+import tempfile
+import subprocess
+
+DEFAULT_BASE_PORT = 3000
+DEFAULT_COMFYUI_DIR = os.path.expanduser('~/ComfyUI')
+DEFAULT_USER = os.getenv('SUDO_USER') or os.getenv('USER') or 'ubuntu'
+# The Flask training service nginx also routes to; workers must not collide with it
+TRAINING_PORT = 5000
+# Browsers get this cookie (API clients can send the X-ComfyUI-Worker header instead)
+# so the websocket, /prompt and /history of one session reach the same worker
+WORKER_COOKIE = 'comfyui_worker'
+
+# Rendered file names, relative to the output directory
+UNIT_FILE = 'comfyui-worker@.service'
+NGINX_FILE = 'nginx-comfyui.conf'
+ENV_DIR = 'comfyui'
+
+def print_usage():
+    print("Usage: python3 comfy_workers.py render <domain> <output_dir> [--gpus N] [--base-port PORT] [--comfyui-dir DIR] [--user USER]")
+    print("       python3 comfy_workers.py validate <output_dir>")
+    print("  render:       Write a systemd template unit, one env file per GPU and the nginx site to output_dir")
+    print("  validate:     Check rendered files for consistency, and with `nginx -t` when nginx is installed")
+    print("  --gpus N:     Optional - Number of workers (default: GPUs reported by nvidia-smi)")
+    print("  --base-port:  Optional - Port of worker 0; worker i listens on base+i (default 3000)")
+    print("  --comfyui-dir Optional - ComfyUI checkout with its venv (default ~/ComfyUI)")
+    print("  --user USER:  Optional - User the workers run as (default the invoking user)")
+    sys.exit(1)
+
+class ConfigError(Exception):
+    """A rendered configuration is inconsistent"""
+
+def detect_gpus():
+    """Number of GPUs nvidia-smi reports, or 1 without one"""
+    try:
+        output = subprocess.run(['nvidia-smi', '--query-gpu=index', '--format=csv,noheader'],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return 1
+    return max(1, len([line for line in output.splitlines() if line.strip()]))
+
+def worker_ports(gpus, base_port=DEFAULT_BASE_PORT):
+    return [base_port + index for index in range(gpus)]
+
+def render_unit(comfyui_dir, user):
+    """systemd template unit; instance %i is the GPU index"""
+    return f"""[Unit]
+Description=ComfyUI worker on GPU %i
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+Type=simple
+User={user}
+WorkingDirectory={comfyui_dir}
+# CUDA_VISIBLE_DEVICES and COMFYUI_PORT
+EnvironmentFile=/etc/{ENV_DIR}/worker-%i.env
+# ComfyUI empties its temp directory on startup, so each worker gets its own
+ExecStartPre=/bin/mkdir -p {comfyui_dir}/workers/%i
+ExecStart={comfyui_dir}/venv/bin/python main.py --listen 127.0.0.1 --port ${{COMFYUI_PORT}} --temp-directory {comfyui_dir}/workers/%i
+Restart=on-failure
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+def render_env(index, port):
+    return f"CUDA_VISIBLE_DEVICES={index}\nCOMFYUI_PORT={port}\n"
+
+def serving_pattern(port):
+    """Map pattern for the last server in $upstream_addr, e.g. after a failed first attempt"""
+    return f'"~(^|\\s)127\\.0\\.0\\.1:{port}$"'
+
+def render_nginx(domain, ports):
+    """Site config: least_conn upstream, per-worker sticky upstreams and /healthz"""
+    servers = '\n'.join(f"    server 127.0.0.1:{port} max_fails=2 fail_timeout=10s;" for port in ports)
+    sticky = []
+    for index, port in enumerate(ports):
+        # Pinned to one worker, failing over to the others if it is down
+        backups = '\n'.join(f"    server 127.0.0.1:{other} backup;" for other in ports if other != port)
+        sticky.append(f"upstream comfyui_w{index} {{\n    server 127.0.0.1:{port} max_fails=2 fail_timeout=10s;\n"
+                      + (backups + '\n' if backups else '') + "}")
+    requested = '\n'.join(f"    w{index} comfyui_w{index};" for index in range(len(ports)))
+    serving = '\n'.join(f"    {serving_pattern(port)} w{index};" for index, port in enumerate(ports))
+    healthz = '\n'.join(f"""
+    location = /healthz/w{index} {{
+        proxy_pass http://127.0.0.1:{port}/system_stats;
+        proxy_connect_timeout 2s;
+        proxy_read_timeout 5s;
+    }}""" for index, port in enumerate(ports))
+    nl = '\n'
+    return f"""map $http_upgrade $connection_upgrade {{
+    default upgrade;
+    '' close;
+}}
+
+upstream comfyui {{
+    least_conn;
+{servers}
+}}
+
+{(nl + nl).join(sticky)}
+
+# Worker a session is pinned to: X-ComfyUI-Worker header, else the {WORKER_COOKIE} cookie
+map $http_x_comfyui_worker $comfyui_requested_worker {{
+    default $http_x_comfyui_worker;
+    '' $cookie_{WORKER_COOKIE};
+}}
+
+map $comfyui_requested_worker $comfyui_backend {{
+    default comfyui;
+{requested}
+}}
+
+# Worker that answered, handed back to the client to stick to. $upstream_addr
+# lists every server tried ("a, b" after a retry), so match the last one
+map $upstream_addr $comfyui_worker_id {{
+    default '';
+{serving}
+}}
+
+server {{
+    listen 80;
+    server_name {domain};
+
+    # Configuration for the main application
+    location / {{
+        proxy_pass http://$comfyui_backend;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection $connection_upgrade;
+        proxy_set_header Host $host;
+        proxy_cache_bypass $http_upgrade;
+        proxy_read_timeout 3600s;
+        client_max_body_size 100M;
+        add_header Set-Cookie "{WORKER_COOKIE}=$comfyui_worker_id; Path=/; SameSite=Lax" always;
+        add_header X-ComfyUI-Worker $comfyui_worker_id always;
+    }}
+
+    # 200 while at least one worker answers
+    location = /healthz {{
+        proxy_pass http://comfyui/system_stats;
+        proxy_next_upstream error timeout http_502 http_503 http_504;
+        proxy_connect_timeout 2s;
+        proxy_read_timeout 5s;
+    }}
+{healthz}
+
+    # Configuration for the /extract_embeddings endpoint
+    location /training {{
+        proxy_pass http://localhost:{TRAINING_PORT};
+        proxy_http_version 1.1;
+        proxy_read_timeout 3000s;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection $connection_upgrade;
+        proxy_set_header Host $host;
+        proxy_cache_bypass $http_upgrade;
+        client_max_body_size 100M;
+    }}
+}}
+"""
+
+def render(domain, output_dir, gpus, base_port=DEFAULT_BASE_PORT, comfyui_dir=DEFAULT_COMFYUI_DIR, user=DEFAULT_USER):
+    """Write the unit, env files and nginx site to output_dir, returning the written paths"""
+    ports = worker_ports(gpus, base_port)
+    if TRAINING_PORT in ports:
+        raise ConfigError(f"Worker ports {ports[0]}-{ports[-1]} overlap the training service on {TRAINING_PORT}")
+    os.makedirs(os.path.join(output_dir, ENV_DIR), exist_ok=True)
+    files = {UNIT_FILE: render_unit(comfyui_dir, user), NGINX_FILE: render_nginx(domain, ports)}
+    for index, port in enumerate(ports):
+        files[os.path.join(ENV_DIR, f"worker-{index}.env")] = render_env(index, port)
+    written = []
+    for name, content in files.items():
+        path = os.path.join(output_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        written.append(path)
+    return written
+
+def read_env(path):
+    env = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.strip().partition('=')
+            if key:
+                env[key] = value
+    return env
+
+def check_braces(text, name):
+    depth = 0
+    for number, line in enumerate(text.splitlines(), 1):
+        # Ignore braces inside quoted strings
+        line = re.sub(r'"[^"]*"', '""', line.split('#', 1)[0])
+        depth += line.count('{') - line.count('}')
+        if depth < 0:
+            raise ConfigError(f"{name}:{number}: unbalanced '}}'")
+    if depth:
+        raise ConfigError(f"{name}: {depth} unclosed '{{'")
+
+def nginx_test(site_path):
+    """Run `nginx -t` on the site inside a minimal main config; None when nginx is not installed"""
+    nginx = shutil.which('nginx')
+    if nginx is None:
+        return None
+    with tempfile.TemporaryDirectory() as prefix:
+        main_conf = os.path.join(prefix, 'nginx.conf')
+        with open(main_conf, 'w') as f:
+            f.write(f"pid {prefix}/nginx.pid;\nerror_log stderr;\nevents {{}}\n"
+                    f"http {{\n    access_log off;\n    include {os.path.abspath(site_path)};\n}}\n")
+        result = subprocess.run([nginx, '-t', '-q', '-p', prefix, '-e', 'stderr', '-c', main_conf],
+                                capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ConfigError(f"nginx -t failed:\n{result.stderr.strip()}")
+    return True
+
+def validate(output_dir):
+    """Check a rendered directory, returning a list of human-readable checks that passed"""
+    unit_path = os.path.join(output_dir, UNIT_FILE)
+    nginx_path = os.path.join(output_dir, NGINX_FILE)
+    env_dir = os.path.join(output_dir, ENV_DIR)
+    for path in (unit_path, nginx_path, env_dir):
+        if not os.path.exists(path):
+            raise ConfigError(f"Missing {path}")
+
+    with open(unit_path) as f:
+        unit = f.read()
+    for required in ('ExecStart=', 'EnvironmentFile=', '${COMFYUI_PORT}', '[Install]'):
+        if required not in unit:
+            raise ConfigError(f"{UNIT_FILE} lacks {required}")
+
+    envs = {}
+    for name in os.listdir(env_dir):
+        match = re.fullmatch(r'worker-(\d+)\.env', name)
+        if match:
+            envs[int(match.group(1))] = read_env(os.path.join(env_dir, name))
+    if not envs or sorted(envs) != list(range(len(envs))):
+        raise ConfigError(f"Worker env files must be numbered 0..N-1, found {sorted(envs)}")
+    ports = []
+    for index, env in sorted(envs.items()):
+        if env.get('CUDA_VISIBLE_DEVICES') != str(index):
+            raise ConfigError(f"worker-{index}.env pins CUDA_VISIBLE_DEVICES={env.get('CUDA_VISIBLE_DEVICES')}")
+        ports.append(int(env.get('COMFYUI_PORT', 0)))
+    if ports != list(range(ports[0], ports[0] + len(ports))):
+        raise ConfigError(f"Worker ports are not consecutive: {ports}")
+    if TRAINING_PORT in ports:
+        raise ConfigError(f"Worker port collides with the training service on {TRAINING_PORT}")
+
+    with open(nginx_path) as f:
+        site = f.read()
+    check_braces(site, NGINX_FILE)
+    upstream = re.search(r'upstream comfyui \{(.*?)\}', site, re.S)
+    if not upstream or 'least_conn;' not in upstream.group(1):
+        raise ConfigError("nginx site lacks the least_conn comfyui upstream")
+    balanced = [int(port) for port in re.findall(r'server 127\.0\.0\.1:(\d+)', upstream.group(1))]
+    if balanced != ports:
+        raise ConfigError(f"comfyui upstream serves {balanced}, workers listen on {ports}")
+    for index in range(len(ports)):
+        if f"upstream comfyui_w{index} " not in site or f"location = /healthz/w{index} " not in site:
+            raise ConfigError(f"nginx site lacks the sticky upstream or health check of worker {index}")
+        if f"{serving_pattern(ports[index])} w{index};" not in site:
+            raise ConfigError(f"nginx site does not map the address of worker {index} back to w{index}")
+    for required in ('location = /healthz ', f'$cookie_{WORKER_COOKIE}', 'proxy_pass http://$comfyui_backend;'):
+        if required not in site:
+            raise ConfigError(f"nginx site lacks {required}")
+
+    checks = [f"{len(ports)} workers on ports {ports[0]}-{ports[-1]}, one GPU each",
+              "nginx upstream, sticky maps and health checks consistent"]
+    if nginx_test(nginx_path):
+        checks.append("nginx -t passed")
+    else:
+        checks.append("nginx not installed, nginx -t skipped")
+    return checks
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ('render', 'validate'):
+        print_usage()
+    command = args.pop(0)
+
+    gpus = None
+    base_port = DEFAULT_BASE_PORT
+    comfyui_dir = DEFAULT_COMFYUI_DIR
+    user = DEFAULT_USER
+    positional = []
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--gpus':
+                gpus = int(args.pop(0))
+            elif arg == '--base-port':
+                base_port = int(args.pop(0))
+            elif arg == '--comfyui-dir':
+                comfyui_dir = os.path.abspath(os.path.expanduser(args.pop(0)))
+            elif arg == '--user':
+                user = args.pop(0)
+            elif arg.startswith('--'):
+                print_usage()
+            else:
+                positional.append(arg)
+    except (IndexError, ValueError):
+        print_usage()
+    if len(positional) != (2 if command == 'render' else 1):
+        print_usage()
+
+    try:
+        if command == 'render':
+            domain, output_dir = positional
+            gpus = gpus or detect_gpus()
+            for path in render(domain, output_dir, gpus, base_port, comfyui_dir, user):
+                print(f"Wrote {path}")
+        else:
+            output_dir = positional[0]
+        for check in validate(output_dir):
+            print(f"OK: {check}")
+    except (OSError, ValueError, ConfigError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
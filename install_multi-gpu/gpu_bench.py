@@ -0,0 +1,373 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import socket
+import hashlib
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+NCCL_TESTS_REPO = 'https://github.com/NVIDIA/nccl-tests.git'
+# Branch or tag of nccl-tests to build; part of the cache key
+NCCL_TESTS_REF = os.getenv('NCCL_TESTS_REF', 'master')
+CUDA_HOME = os.getenv('CUDA_HOME', '/usr/local/cuda-12.8')
+NCCL_HOME = os.getenv('NCCL_HOME', '/opt/nccl/build')
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.cache/nccl-tests')
+# Point several hosts at a shared directory to compare them against each other
+DEFAULT_RESULTS_DIR = os.getenv('GPU_BENCH_DIR', os.path.expanduser('~/gpu-bench-results'))
+# Same environment as verify_nccl.sh
+NCCL_ENV = {'NCCL_P2P_LEVEL': 'NVL', 'NCCL_IB_DISABLE': '1', 'NCCL_ALGO': 'Ring'}
+DEFAULT_PYTHON = os.path.expanduser('~/diffusers/venv/bin/python')
+# A host is flagged when a metric is worse than this percentile of the other hosts...
+DEFAULT_PERCENTILE = 10
+# ...provided there are at least this many other hosts to compare with
+MIN_FLEET_SIZE = 3
+
+# Metric name -> True if higher is better
+METRICS = {
+    'nccl_avg_busbw': True,
+    'nccl_peak_busbw': True,
+    'nccl_small_latency_us': False,
+    'torch_matmul_tflops_min': True,
+    'torch_all_reduce_peak_busbw': True,
+}
+
+def print_usage():
+    print("Usage: python3 gpu_bench.py run [--gpus N] [--skip-nccl] [--skip-torch] [--rebuild] [--python PATH] [--results-dir DIR] [--percentile P]")
+    print("       python3 gpu_bench.py parse <nccl|torch> <output_file>")
+    print("       python3 gpu_bench.py compare [host] [--results-dir DIR] [--percentile P]")
+    print("  run:           Benchmark this host, save the results under results-dir/<host>/ and compare with the fleet")
+    print("  parse:         Print the JSON parsed from captured all_reduce_perf or torch_bench.py output")
+    print("  compare:       Compare a host's latest results (default this host) with other hosts with the same GPUs")
+    print("  --gpus N:      Optional - GPUs to use (default: all reported by nvidia-smi)")
+    print("  --rebuild:     Optional - Rebuild the cached nccl-tests binaries")
+    print("  --python PATH: Optional - Python with PyTorch for torch_bench.py (default ~/diffusers/venv/bin/python)")
+    print("  --results-dir: Optional - Where per-host results are kept (default $GPU_BENCH_DIR or ~/gpu-bench-results)")
+    print("  --percentile:  Optional - Flag metrics worse than this fleet percentile (default 10)")
+    print("Exit codes: 0 ok, 1 error, 3 host below the fleet")
+    sys.exit(1)
+
+class BenchError(Exception):
+    """A benchmark could not be built, run or parsed"""
+
+def _number(token):
+    try:
+        return float(token)
+    except ValueError:
+        # #wrong is N/A with -c 0
+        return None
+
+def parse_nccl(output):
+    """Parse nccl-tests (e.g. all_reduce_perf) output into a dict
+
+    Rows hold size, count, type, redop and the out-of-place/in-place time
+    (us), algbw and busbw (GB/s). Works with and without the root column.
+    """
+    rows = []
+    devices = []
+    avg_busbw = None
+    out_of_bounds = None
+    for line in output.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith('#'):
+            device = re.search(r'Rank\s+(\d+).*?on\s+(\S+)\s+device\s+(\d+)\s+\[([^\]]+)\]\s+(.+)$', stripped)
+            if device:
+                devices.append({'rank': int(device.group(1)), 'host': device.group(2), 'device': int(device.group(3)),
+                                'bus_id': device.group(4), 'name': device.group(5).strip()})
+            average = re.search(r'Avg bus bandwidth\s*:\s*([\d.]+)', stripped)
+            if average:
+                avg_busbw = float(average.group(1))
+            bounds = re.search(r'Out of bounds values\s*:\s*(\d+)', stripped)
+            if bounds:
+                out_of_bounds = int(bounds.group(1))
+            continue
+        tokens = stripped.split()
+        if len(tokens) < 12 or not tokens[0].isdigit() or not tokens[1].isdigit():
+            continue
+        values = tokens[-8:]
+        row = {'size': int(tokens[0]), 'count': int(tokens[1]), 'type': tokens[2], 'redop': tokens[3]}
+        for prefix, (elapsed, algbw, busbw, wrong) in (('out_of_place', values[:4]), ('in_place', values[4:])):
+            row[prefix] = {'time_us': _number(elapsed), 'algbw': _number(algbw), 'busbw': _number(busbw),
+                           'wrong': _number(wrong)}
+        rows.append(row)
+    if not rows:
+        raise BenchError("No nccl-tests result rows found")
+    busbws = [row[prefix]['busbw'] for row in rows for prefix in ('out_of_place', 'in_place')
+              if row[prefix]['busbw'] is not None]
+    smallest = min(rows, key=lambda row: row['size'])
+    return {
+        'rows': rows,
+        'devices': devices,
+        'avg_busbw': avg_busbw,
+        'peak_busbw': max(busbws) if busbws else None,
+        'small_latency_us': smallest['out_of_place']['time_us'],
+        'out_of_bounds': out_of_bounds,
+    }
+
+def parse_torch(output):
+    """Parse the BENCH lines printed by torch_bench.py"""
+    matmul = []
+    all_reduce = []
+    for line in output.splitlines():
+        if 'BENCH ' not in line:
+            continue
+        # torchrun may prefix lines with the rank
+        try:
+            record = json.loads(line.split('BENCH ', 1)[1])
+        except ValueError:
+            continue
+        if record.get('kind') == 'matmul':
+            matmul.append(record)
+        elif record.get('kind') == 'all_reduce':
+            all_reduce.append(record)
+    if not matmul and not all_reduce:
+        raise BenchError("No torch_bench.py results found")
+    matmul.sort(key=lambda record: record['rank'])
+    tflops = [record['tflops'] for record in matmul]
+    return {
+        'matmul': matmul,
+        'all_reduce': all_reduce,
+        'matmul_tflops_min': min(tflops) if tflops else None,
+        'matmul_tflops_mean': sum(tflops) / len(tflops) if tflops else None,
+        'all_reduce_peak_busbw': max((record['busbw'] for record in all_reduce), default=None),
+    }
+
+def detect_gpus():
+    try:
+        output = subprocess.run(['nvidia-smi', '--query-gpu=index', '--format=csv,noheader'],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise BenchError(f"Could not query GPUs with nvidia-smi: {e}")
+    return len([line for line in output.splitlines() if line.strip()])
+
+def toolchain_key():
+    """Hash of what the nccl-tests binaries depend on"""
+    digest = hashlib.sha256(f"{NCCL_TESTS_REF}\0{CUDA_HOME}\0{NCCL_HOME}".encode())
+    nvcc = os.path.join(CUDA_HOME, 'bin', 'nvcc')
+    if os.path.exists(nvcc):
+        digest.update(subprocess.run([nvcc, '--version'], capture_output=True, text=True).stdout.encode())
+    library = os.path.join(NCCL_HOME, 'lib', 'libnccl.so')
+    if os.path.exists(library):
+        stat = os.stat(os.path.realpath(library))
+        digest.update(f"{os.path.realpath(library)}\0{stat.st_size}\0{stat.st_mtime}".encode())
+    return digest.hexdigest()[:16]
+
+def nccl_tests_binary(name='all_reduce_perf', cache_dir=DEFAULT_CACHE_DIR, rebuild=False):
+    """Path of a built nccl-tests binary, building it only when the toolchain changed"""
+    build_dir = os.path.join(cache_dir, toolchain_key())
+    binary = os.path.join(build_dir, 'build', name)
+    if os.path.exists(binary) and not rebuild:
+        return binary
+    staging = f"{build_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    print(f"Building nccl-tests {NCCL_TESTS_REF} into {build_dir}...")
+    try:
+        subprocess.run(['git', 'clone', '--depth', '1', '--branch', NCCL_TESTS_REF, NCCL_TESTS_REPO, staging],
+                       check=True)
+        subprocess.run(['make', f"-j{os.cpu_count() or 1}", f"CUDA_HOME={CUDA_HOME}", f"NCCL_HOME={NCCL_HOME}"],
+                       cwd=staging, check=True)
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.replace(staging, build_dir)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise BenchError(f"Failed to build nccl-tests: {e}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return binary
+
+def run_nccl(gpus, cache_dir=DEFAULT_CACHE_DIR, rebuild=False):
+    binary = nccl_tests_binary(cache_dir=cache_dir, rebuild=rebuild)
+    env = dict(os.environ, **NCCL_ENV)
+    env['LD_LIBRARY_PATH'] = f"{NCCL_HOME}/lib:{CUDA_HOME}/lib64:{env.get('LD_LIBRARY_PATH', '')}"
+    command = [binary, '-b', '8', '-e', '4G', '-f', '2', '-g', str(gpus)]
+    print(f"Running {' '.join(command)}...")
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise BenchError(f"all_reduce_perf exited with {result.returncode}: {result.stderr.strip()[-2000:]}")
+    parsed = parse_nccl(result.stdout)
+    parsed['command'] = command
+    return parsed, result.stdout
+
+def run_torch(gpus, python=DEFAULT_PYTHON):
+    command = [python, '-m', 'torch.distributed.run', f"--nproc_per_node={gpus}",
+               os.path.join(SCRIPT_DIR, 'torch_bench.py')]
+    print(f"Running {' '.join(command)}...")
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise BenchError(f"torch_bench.py exited with {result.returncode}: {result.stderr.strip()[-2000:]}")
+    return parse_torch(result.stdout), result.stdout
+
+def metrics(result):
+    """Flatten a saved result into the METRICS compared across the fleet"""
+    nccl = result.get('nccl') or {}
+    torch = result.get('torch') or {}
+    values = {
+        'nccl_avg_busbw': nccl.get('avg_busbw'),
+        'nccl_peak_busbw': nccl.get('peak_busbw'),
+        'nccl_small_latency_us': nccl.get('small_latency_us'),
+        'torch_matmul_tflops_min': torch.get('matmul_tflops_min'),
+        'torch_all_reduce_peak_busbw': torch.get('all_reduce_peak_busbw'),
+    }
+    return {name: value for name, value in values.items() if value is not None}
+
+def fleet_key(result):
+    """(GPU count, device name) of a saved result; only hosts sharing it are compared"""
+    nccl = result.get('nccl') or {}
+    torch = result.get('torch') or {}
+    names = [device['name'] for device in nccl.get('devices', [])] or \
+        [record['device'] for record in torch.get('matmul', []) if record.get('device')]
+    return result.get('gpus'), names[0] if names else None
+
+def save_result(result, results_dir, raw_outputs=None):
+    """Write results_dir/<host>/<timestamp>.json (and the raw outputs next to it)"""
+    host_dir = os.path.join(results_dir, result['host'])
+    os.makedirs(host_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(result['time']))
+    path = os.path.join(host_dir, f"{stamp}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    for name, output in (raw_outputs or {}).items():
+        with open(os.path.join(host_dir, f"{stamp}.{name}.log"), 'w') as f:
+            f.write(output)
+    return path
+
+def latest_results(results_dir):
+    """{host: latest saved result} for every host under results_dir"""
+    latest = {}
+    if not os.path.isdir(results_dir):
+        return latest
+    for host in sorted(os.listdir(results_dir)):
+        host_dir = os.path.join(results_dir, host)
+        if not os.path.isdir(host_dir):
+            continue
+        runs = sorted(name for name in os.listdir(host_dir) if name.endswith('.json'))
+        if runs:
+            with open(os.path.join(host_dir, runs[-1])) as f:
+                latest[host] = json.load(f)
+    return latest
+
+def percentile(values, p):
+    """Linear-interpolated percentile of a non-empty list"""
+    values = sorted(values)
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def compare(host, latest, p=DEFAULT_PERCENTILE, min_fleet=MIN_FLEET_SIZE):
+    """Compare a host's metrics with the other hosts', returning one dict per metric
+
+    The fleet is the other hosts with the same GPU count and device name, so
+    an 8x A100 is never judged against 2x A10s. A higher-is-better metric
+    is flagged below the p-th percentile of the fleet, a lower-is-better one
+    (latency) above the (100-p)-th.
+    """
+    own = metrics(latest[host])
+    key = fleet_key(latest[host])
+    others = [metrics(result) for other, result in latest.items() if other != host and fleet_key(result) == key]
+    comparisons = []
+    for name, higher_is_better in METRICS.items():
+        if name not in own:
+            continue
+        fleet = [values[name] for values in others if name in values]
+        entry = {'metric': name, 'value': own[name], 'fleet_size': len(fleet), 'flagged': False}
+        if len(fleet) >= min_fleet:
+            entry['fleet_median'] = percentile(fleet, 50)
+            if higher_is_better:
+                entry['threshold'] = percentile(fleet, p)
+                entry['flagged'] = own[name] < entry['threshold']
+            else:
+                entry['threshold'] = percentile(fleet, 100 - p)
+                entry['flagged'] = own[name] > entry['threshold']
+        comparisons.append(entry)
+    return comparisons
+
+def print_comparison(host, comparisons, p, key=None):
+    print("")
+    group = f" of {key[0]}x {key[1] or 'unknown GPU'}" if key else ""
+    print(f"{host} against the fleet{group} (flagged when worse than p{p:g} of the other hosts):")
+    for entry in comparisons:
+        if 'threshold' not in entry:
+            print(f"  {entry['metric']:<30}{entry['value']:>12.2f}  (only {entry['fleet_size']} other hosts, not compared)")
+            continue
+        state = 'BELOW FLEET' if entry['flagged'] else 'ok'
+        print(f"  {entry['metric']:<30}{entry['value']:>12.2f}  threshold {entry['threshold']:>10.2f}"
+              f"  median {entry['fleet_median']:>10.2f}  {state}")
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ('run', 'parse', 'compare'):
+        print_usage()
+    command = args.pop(0)
+
+    gpus = None
+    skip_nccl = False
+    skip_torch = False
+    rebuild = False
+    python = DEFAULT_PYTHON
+    results_dir = DEFAULT_RESULTS_DIR
+    p = DEFAULT_PERCENTILE
+    positional = []
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--gpus':
+                gpus = int(args.pop(0))
+            elif arg == '--skip-nccl':
+                skip_nccl = True
+            elif arg == '--skip-torch':
+                skip_torch = True
+            elif arg == '--rebuild':
+                rebuild = True
+            elif arg == '--python':
+                python = args.pop(0)
+            elif arg == '--results-dir':
+                results_dir = args.pop(0)
+            elif arg == '--percentile':
+                p = float(args.pop(0))
+            elif arg.startswith('--'):
+                print_usage()
+            else:
+                positional.append(arg)
+    except (IndexError, ValueError):
+        print_usage()
+
+    try:
+        if command == 'parse':
+            if len(positional) != 2 or positional[0] not in ('nccl', 'torch'):
+                print_usage()
+            with open(positional[1]) as f:
+                output = f.read()
+            parsed = parse_nccl(output) if positional[0] == 'nccl' else parse_torch(output)
+            print(json.dumps(parsed, indent=2))
+            sys.exit(0)
+
+        host = positional[0] if positional else socket.gethostname()
+        if command == 'run':
+            gpus = gpus or detect_gpus()
+            result = {'host': host, 'time': time.time(), 'gpus': gpus}
+            raw_outputs = {}
+            if not skip_nccl:
+                result['nccl'], raw_outputs['nccl'] = run_nccl(gpus, rebuild=rebuild)
+            if not skip_torch:
+                result['torch'], raw_outputs['torch'] = run_torch(gpus, python)
+            print(f"Results saved to {save_result(result, results_dir, raw_outputs)}")
+
+        latest = latest_results(results_dir)
+        if host not in latest:
+            print(f"No results for {host} in {results_dir}")
+            sys.exit(1)
+    except (OSError, ValueError, BenchError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    comparisons = compare(host, latest, p)
+    print_comparison(host, comparisons, p, fleet_key(latest[host]))
+    sys.exit(3 if any(entry['flagged'] for entry in comparisons) else 0)
+
+if __name__ == "__main__":
+    main()
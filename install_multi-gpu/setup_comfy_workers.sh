@@ -0,0 +1,90 @@
+#!/bin/bash
+# Step 6: Run one ComfyUI worker per GPU behind nginx
+# Usage: setup_comfy_workers.sh <domain> [--gpus N] [--base-port PORT] [--comfyui-dir DIR]
+# Replaces the single-process site written by install_scripts/nginx-setup-20250205.sh
+set -e
+
+DOMAIN="${1}"
+if [ -z "$DOMAIN" ]; then
+    echo "Error: Domain is required"
+    echo "Usage: $0 <domain> [--gpus N] [--base-port PORT] [--comfyui-dir DIR]"
+    exit 1
+fi
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+
+# Worker 0 listens on the base port (default 3000, as in comfy_workers.py)
+BASE_PORT=3000
+ARGS=("${@:2}")
+for ((i = 0; i < ${#ARGS[@]}; i++)); do
+    if [ "${ARGS[$i]}" = "--base-port" ]; then
+        BASE_PORT="${ARGS[$((i + 1))]}"
+    fi
+done
+
+# Log file
+LOG_FILE=comfy_workers_setup.log
+echo "Starting ComfyUI worker setup at $(date)" | tee -a $LOG_FILE
+
+# Render and validate everything before touching the live configuration;
+# the workers run as the invoking user, also under sudo (see comfy_workers.py)
+RENDER_DIR=$(mktemp -d)
+trap 'rm -rf "$RENDER_DIR"' EXIT
+echo "Rendering worker and nginx configuration..." | tee -a $LOG_FILE
+python3 "$SCRIPT_DIR/comfy_workers.py" render "$DOMAIN" "$RENDER_DIR" "${@:2}" | tee -a $LOG_FILE
+test ${PIPESTATUS[0]} -eq 0
+echo "" | tee -a $LOG_FILE
+
+# Stop a ComfyUI started by hand on the worker 0 port
+if pgrep -f "main.py --port $BASE_PORT( |\$)" > /dev/null; then
+    echo "Stopping manually started ComfyUI on port $BASE_PORT..." | tee -a $LOG_FILE
+    pkill -f "main.py --port $BASE_PORT( |\$)" || true
+fi
+
+echo "Installing worker units..." | tee -a $LOG_FILE
+sudo mkdir -p /etc/comfyui
+sudo rm -f /etc/comfyui/worker-*.env
+sudo cp "$RENDER_DIR"/comfyui/worker-*.env /etc/comfyui/
+sudo cp "$RENDER_DIR/comfyui-worker@.service" /etc/systemd/system/
+sudo systemctl daemon-reload
+WORKERS=$(ls "$RENDER_DIR"/comfyui/worker-*.env | wc -l)
+# Disable workers left over from a machine with more GPUs
+for unit in $(systemctl list-units --all --plain --no-legend 'comfyui-worker@*' | awk '{print $1}'); do
+    index=${unit#comfyui-worker@}
+    index=${index%.service}
+    if [ "$index" -ge "$WORKERS" ]; then
+        sudo systemctl disable --now "$unit" | tee -a $LOG_FILE
+    fi
+done
+for ((i = 0; i < WORKERS; i++)); do
+    sudo systemctl enable "comfyui-worker@$i" | tee -a $LOG_FILE
+    sudo systemctl restart "comfyui-worker@$i"
+done
+echo "" | tee -a $LOG_FILE
+
+echo "Installing nginx site..." | tee -a $LOG_FILE
+sudo cp /etc/nginx/sites-available/myapp /etc/nginx/sites-available/myapp.bak 2>/dev/null || true
+sudo cp "$RENDER_DIR/nginx-comfyui.conf" /etc/nginx/sites-available/myapp
+sudo ln -sf /etc/nginx/sites-available/myapp /etc/nginx/sites-enabled/
+sudo nginx -t || {
+    echo "Nginx configuration test failed, restoring the previous site" | tee -a $LOG_FILE
+    sudo cp /etc/nginx/sites-available/myapp.bak /etc/nginx/sites-available/myapp 2>/dev/null
+    exit 1
+}
+sudo systemctl reload nginx
+echo "" | tee -a $LOG_FILE
+
+echo "Waiting for workers to answer..." | tee -a $LOG_FILE
+for ((i = 0; i < WORKERS; i++)); do
+    for attempt in $(seq 1 60); do
+        if curl -sf -o /dev/null -H "Host: $DOMAIN" "http://127.0.0.1/healthz/w$i"; then
+            echo "Worker $i ready" | tee -a $LOG_FILE
+            break
+        fi
+        if [ "$attempt" -eq 60 ]; then
+            echo "Warning: worker $i not answering, check: journalctl -u comfyui-worker@$i" | tee -a $LOG_FILE
+        fi
+        sleep 5
+    done
+done
+
+echo "ComfyUI worker setup completed at $(date): $WORKERS workers behind http://$DOMAIN" | tee -a $LOG_FILE
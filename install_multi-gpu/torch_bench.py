@@ -0,0 +1,54 @@
+import os
+import json
+import torch
+from torch import distributed as dist
+
+# Run under torchrun by gpu_bench.py; every result is printed as one `BENCH {json}` line
+MATMUL_SIZE = 8192
+ALL_REDUCE_BYTES = (1 << 20, 1 << 24, 1 << 28, 1 << 30)
+
+def emit(**fields):
+    print('BENCH ' + json.dumps(fields), flush=True)
+
+def timed(fn, iterations, warmup=3):
+    """Mean milliseconds per call, measured with CUDA events"""
+    for _ in range(warmup):
+        fn()
+    torch.cuda.synchronize()
+    start = torch.cuda.Event(enable_timing=True)
+    end = torch.cuda.Event(enable_timing=True)
+    start.record()
+    for _ in range(iterations):
+        fn()
+    end.record()
+    torch.cuda.synchronize()
+    return start.elapsed_time(end) / iterations
+
+def main():
+    dist.init_process_group(backend='nccl')
+    rank = dist.get_rank()
+    world_size = dist.get_world_size()
+    torch.cuda.set_device(int(os.environ.get('LOCAL_RANK', rank)))
+
+    n = MATMUL_SIZE
+    a = torch.randn(n, n, device='cuda', dtype=torch.bfloat16)
+    b = torch.randn(n, n, device='cuda', dtype=torch.bfloat16)
+    ms = timed(lambda: torch.matmul(a, b), 20)
+    emit(kind='matmul', rank=rank, device=torch.cuda.get_device_name(), dtype='bfloat16', n=n, ms=ms,
+         tflops=2 * n ** 3 / (ms / 1e3) / 1e12)
+    del a, b
+
+    for size in ALL_REDUCE_BYTES:
+        tensor = torch.ones(size // 4, device='cuda', dtype=torch.float32)
+        ms = timed(lambda: dist.all_reduce(tensor), 10)
+        algbw = size / (ms / 1e3) / 1e9
+        if rank == 0:
+            # Same bus bandwidth definition as nccl-tests, comparable across GPU counts
+            emit(kind='all_reduce', bytes=size, world_size=world_size, ms=ms, algbw=algbw,
+                 busbw=algbw * 2 * (world_size - 1) / world_size)
+        del tensor
+
+    dist.destroy_process_group()
+
+if __name__ == "__main__":
+    main()
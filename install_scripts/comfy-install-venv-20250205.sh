@@ -9,9 +9,12 @@ handle_error() {
     exit 1
 }
 
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+
 echo "Installing system dependencies..."
-sudo apt-get update || handle_error "Failed to update package lists"
-sudo apt-get install -y python3-pip python3.10-dev unzip || handle_error "Failed to install system dependencies"
+# setup_runner.py may run other apt stages concurrently, so wait for the dpkg lock
+sudo apt-get -o DPkg::Lock::Timeout=1800 update || handle_error "Failed to update package lists"
+sudo apt-get -o DPkg::Lock::Timeout=1800 install -y python3-pip python3.10-dev unzip || handle_error "Failed to install system dependencies"
 
 echo "Installing virtualenv..."
 python3 -m pip install --no-cache-dir virtualenv || handle_error "Failed to install virtualenv"
@@ -35,8 +38,19 @@ echo "Cloning additional custom nodes..."
 git clone git@github.com:ltdrdata/ComfyUI-Manager.git || handle_error "Failed to clone ComfyUI-Manager"
 git clone git@github.com:M1kep/ComfyLiterals.git || handle_error "Failed to clone ComfyLiterals"
 
-echo "Setting up Python virtual environment..."
 cd .. || handle_error "Failed to return to ComfyUI directory"
+
+# Restore a prebuilt environment when a snapshot lockfile is available
+# (created with: python3 env_snapshot.py freeze). Set COMFY_ENV_LOCK to its path.
+if [ -n "$COMFY_ENV_LOCK" ] && [ -f "$COMFY_ENV_LOCK" ]; then
+    echo "Restoring Python virtual environment from snapshot $COMFY_ENV_LOCK..."
+    python3 "$SCRIPT_DIR/env_snapshot.py" thaw "$COMFY_ENV_LOCK" --venv "$HOME/ComfyUI/venv" --comfyui-dir "$HOME/ComfyUI" \
+        || handle_error "Failed to restore environment snapshot"
+    echo "ComfyUI setup completed successfully!"
+    exit 0
+fi
+
+echo "Setting up Python virtual environment..."
 python3 -m virtualenv venv || handle_error "Failed to create virtual environment"
 source venv/bin/activate || handle_error "Failed to activate virtual environment"
 
@@ -0,0 +1,478 @@
+import sys
+import os
+import json
+import time
+import hashlib
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from model_cache import ModelCache, parse_size
+from timeline import record_event
+
+# Declarative list of model files, see models.json
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models.json')
+DEFAULT_JOBS = 4
+CHUNK_SIZE = 1024 * 1024
+MAX_RETRIES = 3
+RETRY_DELAY = 5
+
+def print_usage():
+    print("Usage: python3 download_models.py [manifest.json] [--jobs N] [--max-bandwidth RATE] [--models-dir DIR] [--cache-dir DIR] [--cache-max-size SIZE] [--report PATH] [--update-manifest] [--strict]")
+    print("  manifest.json:     Optional - Model manifest (default models.json next to this script)")
+    print("  --jobs N:          Optional - Files downloaded concurrently, one connection each (default 4)")
+    print("  --max-bandwidth:   Optional - Total download rate across all files, e.g. 200M or 1G bytes/s")
+    print("  --models-dir DIR:  Optional - Override the manifest's models_dir")
+    print("  --cache-dir DIR:   Optional - Shared content-addressed cache to install from and add to (default $MODEL_CACHE_DIR)")
+    print("  --cache-max-size:  Optional - Evict least recently used cache objects beyond SIZE after downloading, e.g. 200G")
+    print("  --report PATH:     Optional - Write the per-file report as JSON")
+    print("  --update-manifest: Optional - Record size/sha256 of files that have none in the manifest")
+    print("  --strict:          Optional - Refuse manifest entries without a pinned sha256 instead of warning")
+    sys.exit(1)
+
+class DownloadError(Exception):
+    """Raised when a file cannot be downloaded or fails verification"""
+    pass
+
+class BandwidthLimiter:
+    """Token bucket shared by all download threads; rate=None disables it"""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """Block until amount bytes may be transferred"""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Allow at most one second of burst
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            deficit = -self.tokens
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+
+class ModelFile:
+    """One manifest entry"""
+
+    def __init__(self, entry, models_dir, s3_bucket=None):
+        self.entry = entry
+        self.url = entry.get('url')
+        self.s3_key = entry.get('s3_key')
+        self.s3_bucket = entry.get('s3_bucket', s3_bucket)
+        self.auth = entry.get('auth')
+        self.size = entry.get('size')
+        self.sha256 = entry.get('sha256')
+        # Filled in by remote_size(); False until asked
+        self.remote_size = False
+        self.dest = os.path.join(os.path.expanduser(models_dir), entry['dest'])
+        if not self.url and not self.s3_key:
+            raise ValueError(f"Manifest entry for {entry['dest']} needs a url or s3_key")
+
+    @property
+    def part_path(self):
+        return self.dest + '.part'
+
+    @property
+    def stamp_path(self):
+        # Hidden sidecar recording a verified download, so reruns skip re-hashing
+        directory, name = os.path.split(self.dest)
+        return os.path.join(directory, f".{name}.sha256")
+
+    @property
+    def source(self):
+        return self.url or f"s3://{self.s3_bucket}/{self.s3_key}"
+
+def load_manifest(path, models_dir=None):
+    """Load a manifest, returning (manifest dict, list of ModelFile)"""
+    with open(path) as f:
+        manifest = json.load(f)
+    models_dir = models_dir or manifest.get('models_dir', '~/ComfyUI/models')
+    files = [ModelFile(entry, models_dir, manifest.get('s3_bucket')) for entry in manifest['files']]
+    return manifest, files
+
+def read_stamp(model):
+    """Return the recorded (sha256, size, mtime) of a verified file, or None"""
+    try:
+        with open(model.stamp_path) as f:
+            stamp = json.load(f)
+        return stamp['sha256'], stamp['size'], stamp['mtime']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def write_stamp(model, sha256):
+    stat = os.stat(model.dest)
+    with open(model.stamp_path, 'w') as f:
+        json.dump({'sha256': sha256, 'size': stat.st_size, 'mtime': stat.st_mtime}, f)
+
+def hash_file(path, digest=None):
+    """Feed a file into digest (a new sha256 by default) and return it"""
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest
+
+def remote_size(model):
+    """Size the server reports for the model, from a HEAD request; None if unknown
+
+    Used when the manifest pins no size. The answer is remembered on the
+    ModelFile, so a file costs at most one HEAD per run.
+    """
+    if model.remote_size is not False:
+        return model.remote_size
+    size = None
+    try:
+        if model.url:
+            request = urllib.request.Request(model.url, headers=request_headers(model), method='HEAD')
+            with urllib.request.urlopen(request, timeout=60) as response:
+                length = response.headers.get('Content-Length')
+                size = int(length) if length else None
+        else:
+            import boto3
+            size = boto3.client('s3').head_object(Bucket=model.s3_bucket, Key=model.s3_key)['ContentLength']
+    except Exception as e:
+        print(f"Warning: could not determine the size of {model.source}: {e}")
+    model.remote_size = size
+    return size
+
+def expected_size(model):
+    return model.size if model.size is not None else remote_size(model)
+
+def check_existing(model):
+    """Decide whether an existing destination file can be kept
+
+    Returns (True, sha256 or None) to keep it, (False, reason) to download
+    it again. A matching stamp avoids reading the file; a size mismatch
+    (against the manifest, or the server's Content-Length when the manifest
+    pins none) catches truncated files without reading them either.
+    """
+    if not os.path.isfile(model.dest):
+        return False, "missing"
+    stat = os.stat(model.dest)
+    size = expected_size(model)
+    if size is not None and stat.st_size != size:
+        return False, f"size {stat.st_size} != expected {size}"
+
+    stamp = read_stamp(model)
+    if stamp and stamp[1] == stat.st_size and stamp[2] == stat.st_mtime:
+        if model.sha256 is None or stamp[0] == model.sha256:
+            return True, stamp[0]
+        return False, "sha256 mismatch"
+
+    if model.sha256 is None:
+        if stat.st_size == 0:
+            return False, "empty"
+        # Nothing else to verify against
+        return True, None
+
+    sha256 = hash_file(model.dest).hexdigest()
+    if sha256 != model.sha256:
+        return False, "sha256 mismatch"
+    write_stamp(model, sha256)
+    return True, sha256
+
+def resolve_url(model):
+    """Return an HTTP(S) URL for the model, presigning S3 objects"""
+    if model.url:
+        return model.url
+    try:
+        import boto3
+        return boto3.client('s3').generate_presigned_url(
+            'get_object', Params={'Bucket': model.s3_bucket, 'Key': model.s3_key}, ExpiresIn=3600)
+    except ImportError:
+        result = subprocess.run(
+            ['aws', 's3', 'presign', model.source, '--expires-in', '3600'],
+            capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+
+def request_headers(model):
+    headers = {}
+    if model.auth == 'hf':
+        token = os.getenv('HF_TOKEN')
+        if not token:
+            raise DownloadError(f"HF_TOKEN is required for {model.source}")
+        headers['Authorization'] = f"Bearer {token}"
+    return headers
+
+def response_total(response, offset):
+    """Full size of the file being received, from Content-Range or Content-Length"""
+    content_range = response.headers.get('Content-Range')
+    if response.status == 206 and content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1].strip()
+        if total.isdigit():
+            return int(total)
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit():
+        return offset + int(length)
+    return None
+
+def fetch(model, limiter, url=None):
+    """Download model into its .part file, resuming where a previous attempt stopped
+
+    The sha256 is computed while streaming; bytes already in the .part file
+    are hashed once before the transfer resumes. A body shorter than the
+    Content-Length (or Content-Range total) raises DownloadError, keeping
+    the .part file to resume from. Returns (sha256, size, bytes transferred).
+    """
+    url = url or resolve_url(model)
+    os.makedirs(os.path.dirname(model.dest), exist_ok=True)
+
+    digest = hashlib.sha256()
+    offset = 0
+    if os.path.exists(model.part_path):
+        offset = os.path.getsize(model.part_path)
+        size = expected_size(model)
+        if size is not None and offset > size:
+            os.remove(model.part_path)
+            offset = 0
+        else:
+            hash_file(model.part_path, digest)
+
+    headers = request_headers(model)
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=600)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset and offset == expected_size(model):
+            # The previous attempt already received every byte
+            return digest.hexdigest(), offset, 0
+        raise
+
+    transferred = 0
+    with response:
+        if offset and response.status != 206:
+            # Server ignored the range request, start over
+            offset = 0
+            digest = hashlib.sha256()
+        total = response_total(response, offset)
+        with open(model.part_path, 'ab' if offset else 'wb') as f:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                limiter.consume(len(chunk))
+                digest.update(chunk)
+                f.write(chunk)
+                offset += len(chunk)
+                transferred += len(chunk)
+    if total is not None and offset != total:
+        raise DownloadError(f"connection closed after {offset} of {total} bytes")
+    return digest.hexdigest(), offset, transferred
+
+def cached_object(model, cache):
+    """sha256 of the cache object to install for model, or None"""
+    if model.sha256:
+        return model.sha256 if cache.has(model.sha256) else None
+    sha256 = cache.lookup(model.source)
+    if sha256 is None:
+        return None
+    # The source is not pinned and may have changed upstream since it was cached
+    size = expected_size(model)
+    if size is not None and os.path.getsize(cache.object_path(sha256)) != size:
+        return None
+    return sha256
+
+def download(model, limiter, cache=None):
+    """Make sure one model file is present and verified, returning a result dict
+
+    With a cache, files are installed from it when present: by the pinned
+    sha256, or else by the sha256 their source had when last downloaded
+    (provided its size still matches what the server reports). Every
+    downloaded or verified file is added to it.
+    """
+    result = {'dest': model.dest, 'source': model.source, 'status': None,
+              'bytes': 0, 'seconds': 0.0, 'sha256': None, 'error': None}
+    start_time = time.time()
+
+    keep, detail = check_existing(model)
+    if keep:
+        state = 'verified' if detail else 'unverified, no sha256 pinned'
+        print(f"File already exists ({state}), skipping: {model.dest}")
+        result.update(status='present', sha256=detail, verified=detail is not None)
+        if cache and detail and not os.path.islink(model.dest):
+            cache.put(model.dest, detail)
+            cache.remember(model.source, detail)
+        return result
+    if detail != "missing":
+        print(f"Existing file will be downloaded again ({detail}): {model.dest}")
+
+    cached = cached_object(model, cache) if cache else None
+    if cached:
+        method = cache.install(cached, model.dest)
+        write_stamp(model, cached)
+        print(f"Installed from cache ({method}): {model.dest}")
+        result.update(status='cached', sha256=cached, verified=model.sha256 is not None,
+                      seconds=time.time() - start_time)
+        return result
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            print(f"Downloading {model.source} -> {model.dest} (Attempt {attempt} of {MAX_RETRIES})")
+            sha256, size, transferred = fetch(model, limiter)
+            result['bytes'] += transferred
+
+            if model.size is not None and size != model.size:
+                raise DownloadError(f"size {size} != expected {model.size}")
+            if model.sha256 is not None and sha256 != model.sha256:
+                # A corrupt .part must not be resumed
+                os.remove(model.part_path)
+                raise DownloadError(f"sha256 {sha256} != expected {model.sha256}")
+
+            os.replace(model.part_path, model.dest)
+            write_stamp(model, sha256)
+            if cache:
+                cache.put(model.dest, sha256)
+                cache.remember(model.source, sha256)
+            result.update(status='downloaded', sha256=sha256, verified=model.sha256 is not None)
+            print(f"Download completed successfully to: {model.dest}")
+            break
+        except Exception as e:
+            result['error'] = str(e)
+            if attempt < MAX_RETRIES:
+                print(f"Download failed ({e}), retrying in {RETRY_DELAY} seconds... (Attempt {attempt} of {MAX_RETRIES})")
+                time.sleep(RETRY_DELAY)
+    else:
+        result['status'] = 'failed'
+        print(f"Error: Failed to download after {MAX_RETRIES} attempts: {model.source}")
+
+    if result['status'] != 'failed':
+        result['error'] = None
+    result['seconds'] = time.time() - start_time
+    return result
+
+def download_all(models, jobs=DEFAULT_JOBS, max_bandwidth=None, cache=None):
+    """Download models concurrently with a global connection and bandwidth budget"""
+    limiter = BandwidthLimiter(max_bandwidth)
+
+    def run(model):
+        start_time = time.time()
+        result = download(model, limiter, cache)
+        record_event('model', os.path.basename(model.dest), start_time, result['status'], bytes=result['bytes'])
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(run, models))
+
+def print_report(results, total_time):
+    """Print one line per file and a summary"""
+    print("")
+    print("Model download report:")
+    for result in results:
+        verified = '' if result['status'] == 'failed' else (' verified' if result.get('verified') else ' unverified')
+        line = f"  {result['status'].upper():<11}{result['dest']}  {result['bytes'] / 1024 ** 2:.1f} MiB in {result['seconds']:.1f}s{verified}"
+        if result['error']:
+            line += f"  ({result['error']})"
+        print(line)
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    total_bytes = sum(result['bytes'] for result in results)
+    print(f"{len(results) - failed}/{len(results)} files OK, {total_bytes / 1024 ** 3:.2f} GiB downloaded in {total_time:.1f}s")
+
+def update_manifest(path, manifest, models, results):
+    """Record size/sha256 observed for entries that have none"""
+    changed = False
+    for model, result in zip(models, results):
+        if result['status'] == 'failed' or not result['sha256']:
+            continue
+        if model.entry.get('sha256') is None:
+            model.entry['sha256'] = result['sha256']
+            changed = True
+        if model.entry.get('size') is None:
+            model.entry['size'] = os.path.getsize(model.dest)
+            changed = True
+    if changed:
+        with open(path, 'w') as f:
+            json.dump(manifest, f, indent=4)
+            f.write('\n')
+        print(f"Updated manifest with observed sizes and hashes: {path}")
+
+def check_pinned(models, strict=False):
+    """Warn about (or with strict, reject) manifest entries that pin no sha256
+
+    Such files are only checked against the size the server reports, so a
+    corrupt or substituted file goes unnoticed. Returns False to abort.
+    """
+    unpinned = [os.path.basename(model.dest) for model in models if not model.sha256]
+    if not unpinned:
+        return True
+    hint = "run once with --update-manifest on a trusted machine to pin them"
+    if strict:
+        print(f"Error: {len(unpinned)} manifest entries have no sha256 ({', '.join(unpinned)}); {hint}")
+        return False
+    print(f"Warning: {len(unpinned)} manifest entries have no sha256 and cannot be verified "
+          f"({', '.join(unpinned)}); {hint}")
+    return True
+
+def main():
+    args = sys.argv[1:]
+    manifest_path = DEFAULT_MANIFEST
+    jobs = DEFAULT_JOBS
+    max_bandwidth = None
+    models_dir = None
+    report_path = None
+    record = False
+    strict = False
+    cache_dir = os.getenv('MODEL_CACHE_DIR')
+    cache_max_size = None
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--jobs':
+                jobs = int(args.pop(0))
+            elif arg == '--max-bandwidth':
+                max_bandwidth = parse_size(args.pop(0))
+            elif arg == '--models-dir':
+                models_dir = args.pop(0)
+            elif arg == '--cache-dir':
+                cache_dir = args.pop(0)
+            elif arg == '--cache-max-size':
+                cache_max_size = parse_size(args.pop(0))
+            elif arg == '--report':
+                report_path = args.pop(0)
+            elif arg == '--update-manifest':
+                record = True
+            elif arg == '--strict':
+                strict = True
+            elif arg.startswith('--'):
+                print_usage()
+            else:
+                manifest_path = arg
+    except (IndexError, ValueError) as e:
+        print(f"Invalid arguments: {e}")
+        print_usage()
+
+    try:
+        manifest, models = load_manifest(manifest_path, models_dir)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: Failed to load manifest {manifest_path}: {e}")
+        sys.exit(1)
+    if not check_pinned(models, strict):
+        sys.exit(1)
+
+    cache = ModelCache(cache_dir) if cache_dir else None
+
+    start_time = time.time()
+    results = download_all(models, jobs=jobs, max_bandwidth=max_bandwidth, cache=cache)
+    print_report(results, time.time() - start_time)
+
+    if cache and cache_max_size is not None:
+        evicted = cache.gc(cache_max_size)
+        if evicted:
+            print(f"Evicted {len(evicted)} least recently used objects from {cache.root}")
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    if record:
+        update_manifest(manifest_path, manifest, models, results)
+
+    sys.exit(1 if any(result['status'] == 'failed' for result in results) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import sys
+import os
+import json
+import time
+import shutil
+import hashlib
+import platform
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_VENV = os.path.expanduser('~/ComfyUI/venv')
+DEFAULT_COMFYUI_DIR = os.path.expanduser('~/ComfyUI')
+DEFAULT_REPOS_FILE = os.path.join(SCRIPT_DIR, 'repos.txt')
+DEFAULT_OUTPUT_DIR = os.path.expanduser('~/comfyui-env-snapshots')
+CHUNK_SIZE = 1024 * 1024
+
+# Run with the venv's interpreter to list what is installed in it. The hash of
+# each distribution's RECORD covers the hashes of every file it installed.
+LIST_PACKAGES_SCRIPT = """
+import json, hashlib, importlib.metadata
+packages = []
+for dist in importlib.metadata.distributions():
+    record = dist.read_text('RECORD') or ''
+    packages.append({'name': dist.metadata['Name'], 'version': dist.version,
+                     'record_sha256': hashlib.sha256(record.encode()).hexdigest()})
+print(json.dumps(packages))
+"""
+
+# Run with the venv's interpreter to check installed files against the sizes and
+# hashes in their RECORD. Scripts in bin/ are skipped: relocate() rewrites them.
+CHECK_FILES_SCRIPT = """
+import os, sys, json, base64, hashlib, importlib.metadata
+quick = sys.argv[1] == 'size'
+bin_dir = os.path.join(sys.prefix, 'bin') + os.sep
+changed = {}
+for dist in importlib.metadata.distributions():
+    for file in dist.files or []:
+        if file.hash is None or file.hash.mode != 'sha256':
+            continue
+        path = os.path.abspath(str(dist.locate_file(file)))
+        if path.startswith(bin_dir):
+            continue
+        try:
+            if file.size is not None and os.path.getsize(path) != file.size:
+                raise ValueError
+            if not quick:
+                digest = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(chunk)
+                if base64.urlsafe_b64encode(digest.digest()).rstrip(b'=').decode() != file.hash.value:
+                    raise ValueError
+        except (OSError, ValueError):
+            changed.setdefault(dist.metadata['Name'], []).append(str(file))
+print(json.dumps(changed))
+"""
+
+def print_usage():
+    print("Usage: python3 env_snapshot.py <freeze|thaw|verify> [lockfile] [options]")
+    print("  freeze:              Capture the ComfyUI venv as a lockfile plus archive")
+    print("  thaw LOCKFILE:       Restore the venv from the archive (or offline from --wheelhouse) and verify it")
+    print("  verify LOCKFILE:     Compare the venv against the lockfile and re-hash the installed files")
+    print("  --venv DIR:          Optional - Virtual environment (default ~/ComfyUI/venv)")
+    print("  --comfyui-dir DIR:   Optional - ComfyUI checkout used for the pinned commit (default ~/ComfyUI)")
+    print("  --repos PATH:        Optional - Custom node pins (default repos.txt next to this script)")
+    print("  --output-dir DIR:    Optional - For freeze, where to write the snapshot (default ~/comfyui-env-snapshots)")
+    print("  --wheelhouse DIR:    Optional - For freeze, also build wheels into DIR; for thaw, install offline from DIR")
+    print("  --force:             Optional - For thaw, ignore a ComfyUI commit / repos.txt mismatch")
+    print("  --quick:             Optional - For thaw and verify, only compare installed file sizes, not hashes")
+    sys.exit(1)
+
+class SnapshotError(Exception):
+    """Raised when a snapshot cannot be created, restored or verified"""
+    pass
+
+def normalize_name(name):
+    return name.lower().replace('_', '-').replace('.', '-')
+
+def venv_python(venv):
+    return os.path.join(venv, 'bin', 'python')
+
+def list_packages(venv):
+    """Return {normalized name: package dict} for a venv"""
+    result = subprocess.run([venv_python(venv), '-c', LIST_PACKAGES_SCRIPT],
+                            capture_output=True, text=True, check=True)
+    return {normalize_name(package['name']): package for package in json.loads(result.stdout)}
+
+def changed_files(venv, quick=False):
+    """Return {package name: [files whose size or hash differs from RECORD]} for a venv"""
+    result = subprocess.run([venv_python(venv), '-c', CHECK_FILES_SCRIPT, 'size' if quick else 'hash'],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+def python_version(venv):
+    result = subprocess.run([venv_python(venv), '-c', 'import sys; print(sys.version.split()[0])'],
+                            capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+def comfyui_commit(comfyui_dir):
+    try:
+        return subprocess.run(['git', '-C', comfyui_dir, 'rev-parse', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def read_pins(repos_file):
+    """Return the (url, commit) pins of repos.txt"""
+    pins = []
+    if not os.path.isfile(repos_file):
+        return pins
+    with open(repos_file) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                url, _, commit = line.partition(',')
+                pins.append([url.strip(), commit.strip()])
+    return pins
+
+def fingerprint(commit, pins, version):
+    """Identify the inputs a snapshot was built for"""
+    data = json.dumps({'comfyui_commit': commit, 'repos': pins, 'python': version}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+def compression():
+    """Return (tar compression program, archive suffix), preferring fast multithreaded tools"""
+    if shutil.which('zstd'):
+        return 'zstd -T0', '.tar.zst'
+    if shutil.which('pigz'):
+        return 'pigz', '.tar.gz'
+    return 'gzip', '.tar.gz'
+
+def create_archive(venv, archive_path, program):
+    """Stream a tar of the venv to archive_path, hashing it on the way; returns sha256"""
+    digest = hashlib.sha256()
+    parent, name = os.path.split(os.path.abspath(venv))
+    tmp = archive_path + '.tmp'
+    process = subprocess.Popen(['tar', '-I', program, '-C', parent, '-cf', '-', name], stdout=subprocess.PIPE)
+    with open(tmp, 'wb') as f:
+        for chunk in iter(lambda: process.stdout.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    if process.wait() != 0:
+        os.remove(tmp)
+        raise SnapshotError(f"tar failed while archiving {venv}")
+    os.replace(tmp, archive_path)
+    return digest.hexdigest()
+
+def extract_archive(archive_path, expected_sha256, program, dest_dir):
+    """Extract archive_path into dest_dir, verifying its sha256 while streaming"""
+    digest = hashlib.sha256()
+    os.makedirs(dest_dir, exist_ok=True)
+    process = subprocess.Popen(['tar', '-I', program, '-C', dest_dir, '-xf', '-'], stdin=subprocess.PIPE)
+    with open(archive_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            process.stdin.write(chunk)
+    process.stdin.close()
+    if process.wait() != 0:
+        raise SnapshotError(f"tar failed while extracting {archive_path}")
+    if digest.hexdigest() != expected_sha256:
+        raise SnapshotError(f"Archive {archive_path} does not match the lockfile sha256")
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def relocate(venv, old_path, new_path):
+    """Rewrite scripts in bin/ of venv that embed old_path to use new_path"""
+    if old_path == new_path:
+        return
+    bin_dir = os.path.join(venv, 'bin')
+    for name in os.listdir(bin_dir):
+        path = os.path.join(bin_dir, name)
+        if os.path.islink(path) or not os.path.isfile(path) or os.path.getsize(path) > CHUNK_SIZE:
+            continue
+        with open(path, 'rb') as f:
+            content = f.read()
+        if b'\0' in content or old_path.encode() not in content:
+            continue
+        with open(path, 'wb') as f:
+            f.write(content.replace(old_path.encode(), new_path.encode()))
+
+def build_wheels(venv, packages, wheelhouse):
+    """Build/download a wheel for every locked package into wheelhouse; returns {name: (file, sha256)}"""
+    os.makedirs(wheelhouse, exist_ok=True)
+    requirements = [f"{package['name']}=={package['version']}" for package in packages.values()]
+    subprocess.run([venv_python(venv), '-m', 'pip', 'wheel', '--no-deps', '-w', wheelhouse, *requirements], check=True)
+    wheels = {}
+    for filename in os.listdir(wheelhouse):
+        if filename.endswith('.whl'):
+            name = normalize_name(filename.split('-')[0])
+            wheels[name] = (filename, sha256_file(os.path.join(wheelhouse, filename)))
+    return wheels
+
+def freeze(venv, comfyui_dir, repos_file, output_dir, wheelhouse=None):
+    """Write a lockfile and archive for venv, returning the lockfile path"""
+    if not os.path.isfile(venv_python(venv)):
+        raise SnapshotError(f"No virtual environment at {venv}")
+    commit = comfyui_commit(comfyui_dir)
+    pins = read_pins(repos_file)
+    version = python_version(venv)
+    packages = list_packages(venv)
+    snapshot_id = fingerprint(commit, pins, version)
+
+    os.makedirs(output_dir, exist_ok=True)
+    program, suffix = compression()
+    archive_name = f"comfyui-env-{snapshot_id[:12]}{suffix}"
+    print(f"Archiving {venv} ({len(packages)} packages) to {archive_name}...")
+    archive_sha256 = create_archive(venv, os.path.join(output_dir, archive_name), program)
+
+    if wheelhouse:
+        print(f"Building wheels into {wheelhouse}...")
+        for name, (filename, sha256) in build_wheels(venv, packages, wheelhouse).items():
+            if name in packages:
+                packages[name]['wheel'] = filename
+                packages[name]['wheel_sha256'] = sha256
+
+    lock = {
+        'fingerprint': snapshot_id,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': version,
+        'platform': platform.platform(),
+        'venv_path': os.path.abspath(venv),
+        'comfyui_commit': commit,
+        'repos': pins,
+        'archive': {'file': archive_name, 'sha256': archive_sha256, 'compression': program},
+        'packages': [packages[name] for name in sorted(packages)],
+    }
+    lock_path = os.path.join(output_dir, f"comfyui-env-{snapshot_id[:12]}.lock.json")
+    with open(lock_path, 'w') as f:
+        json.dump(lock, f, indent=2)
+    return lock_path
+
+def verify(lock, venv, quick=False):
+    """Return a list of differences between venv and lock (empty if identical)
+
+    Besides versions and RECORD hashes, every installed file is checked
+    against its RECORD entry, catching files modified or truncated after
+    install. quick compares sizes only.
+    """
+    installed = list_packages(venv)
+    locked = {normalize_name(package['name']): package for package in lock['packages']}
+    problems = []
+    for name, package in locked.items():
+        current = installed.get(name)
+        if current is None:
+            problems.append(f"missing {package['name']}=={package['version']}")
+        elif current['version'] != package['version']:
+            problems.append(f"{package['name']} is {current['version']}, locked {package['version']}")
+        elif current['record_sha256'] != package['record_sha256']:
+            problems.append(f"{package['name']} files differ from the locked install")
+    for name, package in installed.items():
+        if name not in locked:
+            problems.append(f"unexpected {package['name']}=={package['version']}")
+    for name, files in sorted(changed_files(venv, quick).items()):
+        shown = ', '.join(files[:3]) + (f" and {len(files) - 3} more" if len(files) > 3 else '')
+        problems.append(f"{name}: {len(files)} installed files do not match RECORD ({shown})")
+    return problems
+
+def install_from_wheelhouse(lock, venv, wheelhouse):
+    """Create venv and install every locked wheel offline, checking wheel hashes"""
+    missing = [package['name'] for package in lock['packages'] if 'wheel_sha256' not in package]
+    if missing:
+        raise SnapshotError(f"Lockfile has no wheel hashes for: {', '.join(missing)}")
+    subprocess.run([sys.executable, '-m', 'venv', venv], check=True)
+    requirements_path = os.path.join(venv, 'requirements.lock.txt')
+    with open(requirements_path, 'w') as f:
+        for package in lock['packages']:
+            f.write(f"{package['name']}=={package['version']} --hash=sha256:{package['wheel_sha256']}\n")
+    subprocess.run([venv_python(venv), '-m', 'pip', 'install', '--no-index', '--no-deps', '--require-hashes',
+                    '--find-links', wheelhouse, '-r', requirements_path], check=True)
+
+def thaw(lock_path, venv, comfyui_dir, repos_file, wheelhouse=None, force=False, quick=False):
+    """Restore venv from a snapshot and verify it against the lockfile"""
+    with open(lock_path) as f:
+        lock = json.load(f)
+
+    base_version = platform.python_version()
+    if lock['python'].rsplit('.', 1)[0] != base_version.rsplit('.', 1)[0]:
+        raise SnapshotError(f"Snapshot was taken with Python {lock['python']}, this machine has {base_version}")
+    commit = comfyui_commit(comfyui_dir)
+    pins = read_pins(repos_file)
+    if (commit and commit != lock['comfyui_commit']) or pins != lock['repos']:
+        message = "Snapshot was built for a different ComfyUI commit or repos.txt pins"
+        if not force:
+            raise SnapshotError(message + " (use --force to restore anyway)")
+        print(f"Warning: {message}")
+
+    venv = os.path.abspath(venv)
+    staging = f"{venv}.thaw-{os.getpid()}"
+    try:
+        if wheelhouse:
+            restored = os.path.join(staging, 'venv')
+            install_from_wheelhouse(lock, restored, wheelhouse)
+            built_at = restored
+        else:
+            archive_path = os.path.join(os.path.dirname(os.path.abspath(lock_path)), lock['archive']['file'])
+            extract_archive(archive_path, lock['archive']['sha256'], lock['archive']['compression'], staging)
+            restored = os.path.join(staging, os.path.basename(lock['venv_path']))
+            built_at = lock['venv_path']
+        relocate(restored, built_at, venv)
+        if os.path.exists(venv):
+            shutil.rmtree(venv)
+        os.replace(restored, venv)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    problems = verify(lock, venv, quick)
+    if wheelhouse:
+        # Wheel installs write fresh RECORD files; versions are what must match
+        problems = [problem for problem in problems if 'files differ' not in problem]
+    return problems
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ('freeze', 'thaw', 'verify'):
+        print_usage()
+    command = args.pop(0)
+
+    lock_path = None
+    venv = DEFAULT_VENV
+    comfyui_dir = DEFAULT_COMFYUI_DIR
+    repos_file = DEFAULT_REPOS_FILE
+    output_dir = DEFAULT_OUTPUT_DIR
+    wheelhouse = None
+    force = False
+    quick = False
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--venv':
+                venv = args.pop(0)
+            elif arg == '--comfyui-dir':
+                comfyui_dir = args.pop(0)
+            elif arg == '--repos':
+                repos_file = args.pop(0)
+            elif arg == '--output-dir':
+                output_dir = args.pop(0)
+            elif arg == '--wheelhouse':
+                wheelhouse = args.pop(0)
+            elif arg == '--force':
+                force = True
+            elif arg == '--quick':
+                quick = True
+            elif arg.startswith('--') or lock_path:
+                print_usage()
+            else:
+                lock_path = arg
+    except IndexError:
+        print_usage()
+    if command != 'freeze' and not lock_path:
+        print_usage()
+
+    start_time = time.time()
+    try:
+        if command == 'freeze':
+            lock_path = freeze(venv, comfyui_dir, repos_file, output_dir, wheelhouse)
+            print(f"Snapshot written to {lock_path} in {time.time() - start_time:.1f}s")
+            sys.exit(0)
+        if command == 'thaw':
+            problems = thaw(lock_path, venv, comfyui_dir, repos_file, wheelhouse, force, quick)
+        else:
+            with open(lock_path) as f:
+                problems = verify(json.load(f), venv, quick)
+    except (OSError, ValueError, KeyError, SnapshotError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if problems:
+        print(f"Environment at {venv} does not match {lock_path}:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print(f"Environment at {venv} matches {lock_path} ({time.time() - start_time:.1f}s)")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -18,26 +18,8 @@ echo "Domain: $DOMAIN"
 # Set DEBIAN_FRONTEND to noninteractive for all apt operations
 export DEBIAN_FRONTEND=noninteractive
 
-# Install NVIDIA drivers with non-interactive flags
-echo "Step 1: Installing NVIDIA drivers..."
-bash nvidia-setup-20250205.sh --silent
-
-# Setup nginx with non-interactive mode
-echo "Step 2: Setting up nginx..."
-bash nginx-setup-20250205.sh "$DOMAIN" --non-interactive
-
-# Setup Flask Training (includes Python dependencies)
-echo "Step 3: Setting up Flask Training..."
-bash flask-training-setup.sh --yes
-
-# Setup ComfyUI
-echo "Step 4: Installing ComfyUI..."
-bash comfy-install-venv-20250205.sh --non-interactive
-
-echo "Step 5: Installing ComfyUI nodes..."
-bash comfy-nodes-install.sh --yes
-
-# Download models
-echo "Step 6: Downloading models..."
-bash download-comfyui-models.sh --no-prompt
-
+# Run the steps (nvidia, nginx, flask-training, comfyui, nodes, models) through the
+# step runner: independent steps run concurrently, steps whose inputs are unchanged
+# since they last completed are skipped (stamps in ~/.setup-stamps, --force to rerun),
+# and a timeline is recorded in ~/setup-timelines (see setup_runner.py)
+python3 "$(dirname "$0")/setup_runner.py" "$DOMAIN" "${@:2}"
@@ -0,0 +1,337 @@
+import sys
+import os
+import re
+import time
+import shutil
+import subprocess
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from packaging.requirements import Requirement, InvalidRequirement
+    from packaging.specifiers import SpecifierSet
+    from packaging.utils import canonicalize_name
+    from packaging.version import Version, InvalidVersion
+except ImportError:
+    # pip always vendors packaging, and this runs inside the ComfyUI venv
+    from pip._vendor.packaging.requirements import Requirement, InvalidRequirement
+    from pip._vendor.packaging.specifiers import SpecifierSet
+    from pip._vendor.packaging.utils import canonicalize_name
+    from pip._vendor.packaging.version import Version, InvalidVersion
+
+from timeline import record_event
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REPOS_FILE = os.path.join(SCRIPT_DIR, 'repos.txt')
+DEFAULT_CLONE_DIR = os.path.expanduser('~/ComfyUI/custom_nodes')
+# Persistent pip cache (downloaded and locally built wheels) shared by every install
+DEFAULT_PIP_CACHE_DIR = os.getenv('PIP_CACHE_DIR', os.path.expanduser('~/.cache/comfyui-pip'))
+DEFAULT_JOBS = 8
+
+def print_usage():
+    print("Usage: python install_nodes.py [repos.txt] [--clone-dir DIR] [--jobs N] [--pip-cache-dir DIR] [--wheelhouse DIR] [--ignore-conflicts] [--no-install]")
+    print("  repos.txt:          Optional - Lines of <git url>,<commit> (default repos.txt next to this script)")
+    print("  --clone-dir DIR:    Optional - Custom nodes directory (default ~/ComfyUI/custom_nodes)")
+    print("  --jobs N:           Optional - Repositories fetched concurrently (default 8)")
+    print("  --pip-cache-dir:    Optional - Persistent pip wheel cache (default $PIP_CACHE_DIR or ~/.cache/comfyui-pip)")
+    print("  --wheelhouse DIR:   Optional - Directory of prebuilt wheels to prefer")
+    print("  --ignore-conflicts: Optional - Install even if node requirements conflict")
+    print("  --no-install:       Optional - Only fetch repositories, skip requirements and install.py")
+    sys.exit(1)
+
+class NodeRepo:
+    """One line of repos.txt"""
+
+    def __init__(self, url, commit=None, clone_dir=DEFAULT_CLONE_DIR):
+        self.url = url
+        self.commit = commit or None
+        self.name = re.sub(r'\.git$', '', url.rstrip('/').split('/')[-1])
+        self.path = os.path.join(clone_dir, self.name)
+
+    @property
+    def requirements_path(self):
+        return os.path.join(self.path, 'requirements.txt')
+
+def read_repos(path, clone_dir=DEFAULT_CLONE_DIR):
+    """Parse repos.txt into NodeRepo entries"""
+    repos = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            url, _, commit = line.partition(',')
+            repos.append(NodeRepo(url.strip(), commit.strip(), clone_dir))
+    return repos
+
+def git(*args, cwd=None):
+    """Run git non-interactively, returning stdout; raises CalledProcessError on failure"""
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    env.setdefault('GIT_SSH_COMMAND', 'ssh -o BatchMode=yes')
+    result = subprocess.run(['git', *args], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+def current_commit(repo):
+    """Return HEAD of an existing checkout, or None"""
+    if not os.path.isdir(os.path.join(repo.path, '.git')):
+        return None
+    try:
+        return git('rev-parse', 'HEAD', cwd=repo.path)
+    except subprocess.CalledProcessError:
+        return None
+
+def fetch_repo(repo):
+    """Bring one repository to its pinned commit, returning (status, message)
+
+    A checkout already at the commit is left alone. Otherwise only that
+    commit is fetched with --depth 1, falling back to a full fetch for
+    servers that refuse to serve a commit by its ID.
+    """
+    start_time = time.time()
+    head = current_commit(repo)
+    if head and repo.commit and head.startswith(repo.commit):
+        return 'skipped', f"already at {repo.commit[:12]}"
+
+    try:
+        if head is None:
+            if os.path.exists(repo.path):
+                shutil.rmtree(repo.path)
+            if not repo.commit:
+                git('clone', '--depth', '1', repo.url, repo.path)
+                return 'cloned', f"default branch in {time.time() - start_time:.1f}s"
+            os.makedirs(repo.path)
+            git('init', '-q', cwd=repo.path)
+            git('remote', 'add', 'origin', repo.url, cwd=repo.path)
+        else:
+            git('remote', 'set-url', 'origin', repo.url, cwd=repo.path)
+            if not repo.commit:
+                git('pull', '--ff-only', cwd=repo.path)
+                return 'updated', f"default branch in {time.time() - start_time:.1f}s"
+
+        try:
+            git('fetch', '--depth', '1', 'origin', repo.commit, cwd=repo.path)
+            target = 'FETCH_HEAD'
+        except subprocess.CalledProcessError:
+            shallow = os.path.exists(os.path.join(repo.path, '.git', 'shallow'))
+            git('fetch', *(['--unshallow'] if shallow else []), 'origin', cwd=repo.path)
+            target = repo.commit
+        git('checkout', '-q', '--force', target, cwd=repo.path)
+    except subprocess.CalledProcessError as e:
+        detail = (e.stderr or '').strip()
+        return 'failed', detail.splitlines()[-1] if detail else str(e)
+    return 'fetched', f"{repo.commit[:12]} in {time.time() - start_time:.1f}s"
+
+def fetch_all(repos, jobs=DEFAULT_JOBS):
+    """Fetch repositories in parallel, returning {repo name: (status, message)}"""
+    def run(repo):
+        start_time = time.time()
+        status, message = fetch_repo(repo)
+        record_event('repo', repo.name, start_time, status)
+        print(f"[{status.upper()}] {repo.name}: {message}")
+        return repo.name, (status, message)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return dict(executor.map(run, repos))
+
+def read_requirements(path):
+    """Split a requirements file into (parsed requirements, pass-through lines)"""
+    requirements = []
+    passthrough = []
+    with open(path) as f:
+        for line in f:
+            line = line.split(' #', 1)[0].strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith(('-r ', '-c ')):
+                # Nested files are relative to the file that includes them
+                option, nested = line.split(None, 1)
+                passthrough.append(f"{option} {os.path.join(os.path.dirname(path), nested)}")
+                continue
+            if line.startswith('-') or '://' in line:
+                # Options, editable installs and direct URLs are passed to pip unchanged
+                passthrough.append(line)
+                continue
+            try:
+                requirements.append(Requirement(line))
+            except InvalidRequirement:
+                passthrough.append(line)
+    return requirements, passthrough
+
+def merge_requirements(repos):
+    """Merge the requirements of all node repos
+
+    Returns (merged requirement lines, pass-through lines, conflicts), where
+    conflicts is a list of human readable descriptions.
+    """
+    groups = {}
+    passthrough = []
+    for repo in repos:
+        if not os.path.isfile(repo.requirements_path):
+            continue
+        requirements, lines = read_requirements(repo.requirements_path)
+        for line in lines:
+            if line not in passthrough:
+                passthrough.append(line)
+        for requirement in requirements:
+            key = (canonicalize_name(requirement.name), str(requirement.marker or ''))
+            groups.setdefault(key, []).append((repo.name, requirement))
+
+    merged = []
+    conflicts = []
+    for (name, marker), entries in sorted(groups.items()):
+        extras = set()
+        specifier = entries[0][1].specifier
+        for _, requirement in entries:
+            extras |= requirement.extras
+            specifier &= requirement.specifier
+
+        conflict = find_conflict(entries)
+        if conflict:
+            wanted = ', '.join(f"{repo_name} wants {requirement}" for repo_name, requirement in entries)
+            conflicts.append(f"{name}: {conflict} ({wanted})")
+
+        line = name + (f"[{','.join(sorted(extras))}]" if extras else '') + str(specifier)
+        if marker:
+            line += f" ; {marker}"
+        merged.append(line)
+    return merged, passthrough, conflicts
+
+def candidate_versions(specifier):
+    """Versions at and just around every bound of a specifier set
+
+    Any non-empty range the bounds carve out contains one of these, so a set
+    none of them satisfies allows no version at all. Returns None when a
+    bound is not a version (e.g. ===foo), which is left to pip.
+    """
+    candidates = set()
+    for spec in specifier:
+        try:
+            version = Version(spec.version[:-2] if spec.version.endswith('.*') else spec.version)
+        except InvalidVersion:
+            return None
+        epoch = f"{version.epoch}!" if version.epoch else ''
+        release = version.release
+        candidates.add(version)
+        candidates.add(Version(epoch + '.'.join(map(str, release + (0, 0, 1)))))
+        if any(release):
+            last = max(index for index, part in enumerate(release) if part)
+            below = release[:last] + (release[last] - 1, 999999999)
+            candidates.add(Version(epoch + '.'.join(map(str, below))))
+    return candidates
+
+def satisfiable(specifier):
+    """Whether any version satisfies a specifier set, True when unknown"""
+    candidates = candidate_versions(specifier)
+    if candidates is None or not len(specifier):
+        return True
+    return any(specifier.contains(version, prereleases=True) for version in candidates)
+
+def find_conflict(entries):
+    """Return a description if the requirements on one package allow no common version"""
+    combined = SpecifierSet()
+    for _, requirement in entries:
+        combined &= requirement.specifier
+    if satisfiable(combined):
+        return None
+    # Name the first two repos that cannot be satisfied together
+    for (first_repo, first), (second_repo, second) in combinations(entries, 2):
+        if not satisfiable(first.specifier & second.specifier):
+            return (f"{first.specifier} from {first_repo} and {second.specifier} from {second_repo} "
+                    f"allow no common version")
+    return f"no version satisfies {combined}"
+
+def install_requirements(merged, passthrough, pip_cache_dir=DEFAULT_PIP_CACHE_DIR, wheelhouse=None, requirements_path=None):
+    """Install the merged requirements in a single pip resolution"""
+    requirements_path = requirements_path or os.path.join(DEFAULT_CLONE_DIR, '.merged-requirements.txt')
+    with open(requirements_path, 'w') as f:
+        f.write('# Generated by install_nodes.py from custom node requirements.txt files\n')
+        for line in passthrough + merged:
+            f.write(line + '\n')
+
+    command = [sys.executable, '-m', 'pip', 'install', '--no-input', '--cache-dir', pip_cache_dir, '-r', requirements_path]
+    if wheelhouse and os.path.isdir(wheelhouse):
+        command += ['--find-links', wheelhouse]
+    print(f"Installing {len(merged)} merged requirements: {' '.join(command)}")
+    start_time = time.time()
+    ok = subprocess.run(command).returncode == 0
+    record_event('pip', 'merged-requirements', start_time, 'ok' if ok else 'failed', requirements=len(merged))
+    return ok
+
+def run_install_scripts(repos):
+    """Run install.py of each repo that has one, returning the names that failed"""
+    failed = []
+    for repo in repos:
+        script = os.path.join(repo.path, 'install.py')
+        if os.path.isfile(script):
+            print(f"Running install.py in {repo.name}...")
+            start_time = time.time()
+            ok = subprocess.run([sys.executable, 'install.py'], cwd=repo.path).returncode == 0
+            record_event('install.py', repo.name, start_time, 'ok' if ok else 'failed')
+            if not ok:
+                print(f"Warning: Failed to run install.py in {repo.name}")
+                failed.append(repo.name)
+    return failed
+
+def main():
+    args = sys.argv[1:]
+    repos_file = DEFAULT_REPOS_FILE
+    clone_dir = DEFAULT_CLONE_DIR
+    jobs = DEFAULT_JOBS
+    pip_cache_dir = DEFAULT_PIP_CACHE_DIR
+    wheelhouse = None
+    ignore_conflicts = False
+    install = True
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--clone-dir':
+                clone_dir = args.pop(0)
+            elif arg == '--jobs':
+                jobs = int(args.pop(0))
+            elif arg == '--pip-cache-dir':
+                pip_cache_dir = args.pop(0)
+            elif arg == '--wheelhouse':
+                wheelhouse = args.pop(0)
+            elif arg == '--ignore-conflicts':
+                ignore_conflicts = True
+            elif arg == '--no-install':
+                install = False
+            elif arg.startswith('--'):
+                print_usage()
+            else:
+                repos_file = arg
+    except (IndexError, ValueError) as e:
+        print(f"Invalid arguments: {e}")
+        print_usage()
+
+    os.makedirs(clone_dir, exist_ok=True)
+    repos = read_repos(repos_file, clone_dir)
+    start_time = time.time()
+    results = fetch_all(repos, jobs)
+    failed = [name for name, (status, _) in results.items() if status == 'failed']
+    print(f"Fetched {len(repos) - len(failed)}/{len(repos)} repositories in {time.time() - start_time:.1f}s")
+    if not install:
+        sys.exit(1 if failed else 0)
+
+    installed = [repo for repo in repos if repo.name not in failed]
+    merged, passthrough, conflicts = merge_requirements(installed)
+    if conflicts:
+        print("Conflicting custom node requirements:")
+        for conflict in conflicts:
+            print(f"  {conflict}")
+        if not ignore_conflicts:
+            print("Error: Resolve the conflicts above (or rerun with --ignore-conflicts)")
+            sys.exit(2)
+
+    if merged or passthrough:
+        requirements_path = os.path.join(clone_dir, '.merged-requirements.txt')
+        if not install_requirements(merged, passthrough, pip_cache_dir, wheelhouse, requirements_path):
+            print("Error: Failed to install merged custom node requirements")
+            sys.exit(1)
+
+    run_install_scripts(installed)
+    print(f"All repositories processed in {time.time() - start_time:.1f}s.")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import sys
+import os
+import time
+import errno
+import shutil
+import fcntl
+import hashlib
+import threading
+
+# Point this at an attached/shared disk to reuse weights across VMs and ComfyUI trees
+DEFAULT_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', os.path.expanduser('~/.cache/comfyui-models'))
+
+# Linux ioctl to clone a file's extents (btrfs, xfs with reflink=1, ...)
+FICLONE = 0x40049409
+
+# Ways of materialising a cached object at a destination, in order of preference
+INSTALL_METHODS = ('reflink', 'hardlink', 'symlink', 'copy')
+
+def print_usage():
+    print("Usage: python3 model_cache.py <stats|ls|gc> [--cache-dir DIR] [--max-size SIZE]")
+    print("  stats:            Show number of objects and total size")
+    print("  ls:               List objects by last use, most recent first")
+    print("  gc:               Remove temporary files and evict least recently used objects")
+    print("  --cache-dir DIR:  Optional - Cache location (default $MODEL_CACHE_DIR or ~/.cache/comfyui-models)")
+    print("  --max-size SIZE:  Optional - For gc, evict until the cache is at most SIZE, e.g. 200G")
+    sys.exit(1)
+
+def parse_size(value):
+    """Parse a size such as 500M, 200G or 1T"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    value = value.strip().upper().rstrip('B')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def reflink(src, dest):
+    """Clone src to dest sharing extents; raises OSError where unsupported"""
+    with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+        try:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dest_file.close()
+            os.remove(dest)
+            raise
+
+def link_file(src, dest, methods=INSTALL_METHODS):
+    """Materialise src at dest with the first method that works, returning its name
+
+    dest is replaced atomically, so a reader never sees a partial file.
+    """
+    # Unique per thread as well, downloads install from a thread pool
+    tmp = f"{dest}.tmp-{os.getpid()}-{threading.get_ident()}"
+    last_error = None
+    for method in methods:
+        try:
+            if method == 'reflink':
+                reflink(src, tmp)
+            elif method == 'hardlink':
+                os.link(src, tmp)
+            elif method == 'symlink':
+                os.symlink(os.path.abspath(src), tmp)
+            else:
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, dest)
+            return method
+        except OSError as e:
+            last_error = e
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+    raise last_error
+
+class ModelCache:
+    """Content-addressed store of model files keyed by sha256
+
+    objects/<aa>/<sha256> holds the data; access/<sha256> is an empty marker
+    whose mtime records the last use. The marker is kept separate because
+    hardlinked installs share the object's own mtime. links/<sha256> lists
+    the destinations the object was symlinked to, so gc keeps it alive.
+    sources/<sha256 of url> holds the sha256 a source was last verified to
+    have, so entries without a pinned hash are found in the cache too.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        self.root = os.path.expanduser(root)
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.access_dir = os.path.join(self.root, 'access')
+        self.links_dir = os.path.join(self.root, 'links')
+        self.sources_dir = os.path.join(self.root, 'sources')
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def has(self, sha256):
+        return os.path.isfile(self.object_path(sha256))
+
+    def touch(self, sha256):
+        """Record a use of an object for LRU eviction"""
+        os.makedirs(self.access_dir, exist_ok=True)
+        marker = os.path.join(self.access_dir, sha256)
+        with open(marker, 'a'):
+            os.utime(marker)
+
+    def last_used(self, sha256):
+        try:
+            return os.path.getmtime(os.path.join(self.access_dir, sha256))
+        except OSError:
+            return os.path.getmtime(self.object_path(sha256))
+
+    def put(self, path, sha256):
+        """Add a file whose sha256 is already known (e.g. verified while downloading)"""
+        if self.has(sha256):
+            self.touch(sha256)
+            return self.object_path(sha256)
+        object_path = self.object_path(sha256)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        # The cache must hold real data, never a symlink back into a ComfyUI tree
+        link_file(path, object_path, methods=('reflink', 'hardlink', 'copy'))
+        self.touch(sha256)
+        return object_path
+
+    def source_path(self, source):
+        return os.path.join(self.sources_dir, hashlib.sha256(source.encode()).hexdigest())
+
+    def remember(self, source, sha256):
+        """Record the sha256 computed while downloading source"""
+        os.makedirs(self.sources_dir, exist_ok=True)
+        path = self.source_path(source)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp, 'w') as f:
+            f.write(sha256 + '\n')
+        os.replace(tmp, path)
+
+    def lookup(self, source):
+        """sha256 of a cached object last downloaded from source, or None"""
+        try:
+            with open(self.source_path(source)) as f:
+                sha256 = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return sha256 if sha256 and self.has(sha256) else None
+
+    def install(self, sha256, dest, methods=INSTALL_METHODS):
+        """Materialise a cached object at dest, returning the method used"""
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        method = link_file(self.object_path(sha256), dest, methods)
+        if method == 'symlink':
+            self.add_link(sha256, dest)
+        self.touch(sha256)
+        return method
+
+    def add_link(self, sha256, dest):
+        """Record a symlink install of an object"""
+        os.makedirs(self.links_dir, exist_ok=True)
+        with open(os.path.join(self.links_dir, sha256), 'a') as f:
+            f.write(os.path.abspath(dest) + '\n')
+
+    def live_links(self, sha256):
+        """Recorded destinations that are still symlinks to the object"""
+        try:
+            with open(os.path.join(self.links_dir, sha256)) as f:
+                dests = set(line.strip() for line in f if line.strip())
+        except FileNotFoundError:
+            return []
+        target = os.path.abspath(self.object_path(sha256))
+        return sorted(dest for dest in dests
+                      if os.path.islink(dest) and os.path.abspath(os.readlink(dest)) == target)
+
+    def is_referenced(self, sha256):
+        """Whether a ComfyUI tree still uses the object, through a symlink or a hardlink
+
+        Evicting a symlinked object would break the install, evicting a
+        hardlinked one frees no space.
+        """
+        try:
+            if os.stat(self.object_path(sha256)).st_nlink > 1:
+                return True
+        except FileNotFoundError:
+            return False
+        return bool(self.live_links(sha256))
+
+    def entries(self):
+        """Return [(sha256, size, last used)] for every object"""
+        entries = []
+        if not os.path.isdir(self.objects_dir):
+            return entries
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                if '.tmp-' in name:
+                    continue
+                entries.append((name, os.path.getsize(os.path.join(prefix_dir, name)), self.last_used(name)))
+        return entries
+
+    def total_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def remove(self, sha256):
+        for path in (self.object_path(sha256), os.path.join(self.access_dir, sha256),
+                     os.path.join(self.links_dir, sha256)):
+            try:
+                os.remove(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def gc(self, max_size=None, tmp_age=3600):
+        """Remove stale temporary files and orphan markers, then evict LRU objects
+
+        Returns a list of evicted sha256s. Objects still symlinked or
+        hardlinked into a ComfyUI tree are never evicted.
+        """
+        now = time.time()
+        if os.path.isdir(self.objects_dir):
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                for name in os.listdir(prefix_dir):
+                    path = os.path.join(prefix_dir, name)
+                    if '.tmp-' in name and now - os.path.getmtime(path) > tmp_age:
+                        os.remove(path)
+        if os.path.isdir(self.access_dir):
+            for name in os.listdir(self.access_dir):
+                if not self.has(name):
+                    os.remove(os.path.join(self.access_dir, name))
+        if os.path.isdir(self.sources_dir):
+            for name in os.listdir(self.sources_dir):
+                path = os.path.join(self.sources_dir, name)
+                if '.tmp-' in name:
+                    if now - os.path.getmtime(path) > tmp_age:
+                        os.remove(path)
+                    continue
+                with open(path) as f:
+                    if not self.has(f.read().strip()):
+                        os.remove(path)
+        if os.path.isdir(self.links_dir):
+            for name in os.listdir(self.links_dir):
+                if not self.has(name) or not self.live_links(name):
+                    os.remove(os.path.join(self.links_dir, name))
+
+        evicted = []
+        if max_size is None:
+            return evicted
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for sha256, size, _ in entries:
+            if total <= max_size:
+                break
+            if self.is_referenced(sha256):
+                continue
+            self.remove(sha256)
+            evicted.append(sha256)
+            total -= size
+        return evicted
+
+def main():
+    args = sys.argv[1:]
+    cache_dir = DEFAULT_CACHE_DIR
+    max_size = None
+    command = None
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--cache-dir':
+                cache_dir = args.pop(0)
+            elif arg == '--max-size':
+                max_size = parse_size(args.pop(0))
+            elif command is None and not arg.startswith('--'):
+                command = arg
+            else:
+                print_usage()
+    except (IndexError, ValueError) as e:
+        print(f"Invalid arguments: {e}")
+        print_usage()
+
+    if command not in ('stats', 'ls', 'gc'):
+        print_usage()
+
+    cache = ModelCache(cache_dir)
+    if command == 'stats':
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        print(f"{cache.root}: {len(entries)} objects, {total / 1024 ** 3:.2f} GiB")
+    elif command == 'ls':
+        for sha256, size, last_used in sorted(cache.entries(), key=lambda entry: -entry[2]):
+            used = time.strftime('%Y-%m-%d %H:%M', time.localtime(last_used))
+            print(f"{sha256}  {size / 1024 ** 2:>10.1f} MiB  last used {used}")
+    else:
+        before = cache.total_size()
+        evicted = cache.gc(max_size)
+        after = cache.total_size()
+        print(f"Evicted {len(evicted)} objects, {(before - after) / 1024 ** 3:.2f} GiB freed, {after / 1024 ** 3:.2f} GiB in cache")
+
+if __name__ == "__main__":
+    main()
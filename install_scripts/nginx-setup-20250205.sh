@@ -1,5 +1,8 @@
 #!/bin/bash
 
+# Stop at the first failing command, so setup_runner.py does not record a failed install as done
+set -e
+
 # Set non-interactive frontend
 export DEBIAN_FRONTEND=noninteractive
 
@@ -14,8 +17,9 @@ if [ -z "$SERVER_NAME" ]; then
 fi
 
 # Install Nginx with non-interactive flags
-sudo DEBIAN_FRONTEND=noninteractive apt-get update -y
-sudo DEBIAN_FRONTEND=noninteractive apt-get install -y nginx
+# setup_runner.py may run other apt stages concurrently, so wait for the dpkg lock
+sudo DEBIAN_FRONTEND=noninteractive apt-get -o DPkg::Lock::Timeout=1800 update -y
+sudo DEBIAN_FRONTEND=noninteractive apt-get -o DPkg::Lock::Timeout=1800 install -y nginx
 
 # Start and enable Nginx
 sudo systemctl start nginx
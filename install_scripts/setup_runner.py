@@ -0,0 +1,456 @@
+import sys
+import os
+import json
+import time
+import socket
+import hashlib
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from timeline import EVENTS_ENV, read_events
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TIMELINE_DIR = os.path.expanduser('~/setup-timelines')
+# Completion stamps, one JSON file per step holding the hash of its inputs
+DEFAULT_STAMP_DIR = os.path.expanduser('~/.setup-stamps')
+DEFAULT_JOBS = 4
+# A step is flagged when it is this much slower than the baseline...
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+# ...and by at least this many seconds, so short steps do not flap
+MIN_REGRESSION_SECONDS = 5.0
+
+class Step:
+    """One stage of full-setup.sh
+
+    A step starts once all of its deps have completed, never at the same time
+    as another step holding one of its resources, and is skipped when a
+    stamp shows it already completed with the same inputs: its script and
+    arguments, the files listed in inputs (relative to this directory,
+    environment variables expanded) and the input hashes of its deps.
+
+    Only steps with a check are stamped: a shell command run after the
+    script exits 0 that confirms its work is really there. A failing check
+    fails the step; a step without one runs every time.
+    """
+
+    def __init__(self, name, script, args=(), deps=(), resources=(), inputs=(), check=None):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.deps = list(deps)
+        self.resources = set(resources)
+        self.inputs = list(inputs)
+        self.check = check
+
+    def command(self, domain, stub_dir=None):
+        """The command to run; with stub_dir, the script of the same name there (or a no-op)"""
+        args = [arg.format(domain=domain) for arg in self.args]
+        if stub_dir is not None:
+            stub = os.path.join(stub_dir, self.script)
+            return ['bash', stub, *args] if os.path.isfile(stub) else ['true']
+        return ['bash', os.path.join(SCRIPT_DIR, self.script), *args]
+
+    def input_hash(self, domain, stub_dir, dep_hashes):
+        digest = hashlib.sha256()
+        command = self.command(domain, stub_dir)
+        digest.update(json.dumps(command).encode())
+        script = command[1] if len(command) > 1 else None
+        for path in [script] + [os.path.expandvars(path) for path in self.inputs]:
+            if path is None or '$' in path:
+                # Unset environment variable
+                continue
+            path = os.path.join(SCRIPT_DIR, path)
+            digest.update(path.encode())
+            try:
+                with open(path, 'rb') as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+            except OSError:
+                digest.update(b'missing')
+        for dep_hash in dep_hashes:
+            digest.update(dep_hash.encode())
+        return digest.hexdigest()
+
+# The apt-heavy stages share the dpkg lock; comfyui and models only call apt
+# briefly and wait for the lock instead (every script passes
+# DPkg::Lock::Timeout). ComfyUI must be cloned before its custom_nodes and
+# models directories are filled. flask-training has nothing to check, so it
+# is never stamped.
+STEPS = [
+    Step('nvidia', 'nvidia-setup-20250205.sh', ['--silent'], resources=['apt'],
+         check='command -v nvidia-smi && dpkg-query -W cuda'),
+    Step('nginx', 'nginx-setup-20250205.sh', ['{domain}', '--non-interactive'], resources=['apt'],
+         check='sudo nginx -t'),
+    Step('flask-training', 'flask-training-setup.sh', ['--yes'], resources=['apt']),
+    Step('comfyui', 'comfy-install-venv-20250205.sh', ['--non-interactive'],
+         inputs=['env_snapshot.py', '$COMFY_ENV_LOCK'],
+         check='test -x "$HOME/ComfyUI/venv/bin/python" && test -f "$HOME/ComfyUI/main.py"'),
+    Step('nodes', 'comfy-nodes-install.sh', ['--yes'], deps=['comfyui'],
+         inputs=['install_nodes.py', 'timeline.py', 'repos.txt'],
+         check='test -d "$HOME/ComfyUI/custom_nodes/ComfyUI-Manager"'),
+    # download_models.py exits non-zero unless every file is complete and verified
+    Step('models', 'download-comfyui-models.sh', ['--no-prompt'], deps=['comfyui'],
+         inputs=['download_models.py', 'model_cache.py', 'timeline.py', 'models.json'],
+         check='test -d "$HOME/ComfyUI/models"'),
+]
+
+def print_usage():
+    print("Usage: python3 setup_runner.py <domain> [--only STEP,...] [--jobs N] [--force] [--output FILE] [--baseline FILE] [--stub-dir DIR] [--fail-on-regression]")
+    print("       python3 setup_runner.py --report TIMELINE [--baseline FILE] [--folded FILE]")
+    print("  domain:               Domain name passed to the nginx step")
+    print(f"  --only STEP,...:      Optional - Run only these steps ({', '.join(step.name for step in STEPS)})")
+    print("  --jobs N:             Optional - Independent steps run concurrently (default 4)")
+    print("  --force:              Optional - Run steps even if their completion stamp is current")
+    print("  --stamp-dir DIR:      Optional - Completion stamps (default ~/.setup-stamps)")
+    print("  --output FILE:        Optional - Timeline JSON (default ~/setup-timelines/<timestamp>.json)")
+    print("  --folded FILE:        Optional - Also write folded stacks (flamegraph.pl/speedscope input)")
+    print("  --baseline FILE:      Optional - Timeline to compare against")
+    print("  --threshold PCT:      Optional - Slowdown that counts as a regression (default 20)")
+    print("  --min-delta S:        Optional - Ignore slowdowns smaller than S seconds (default 5)")
+    print("  --fail-on-regression: Optional - Exit with status 3 if a step regressed")
+    print("  --stub-dir DIR:       Optional - Run DIR/<script> instead of each step script (missing ones are no-ops), for CI")
+    print("  --report TIMELINE:    Optional - Summarise an existing timeline instead of running")
+    sys.exit(1)
+
+def network_rx_bytes():
+    """Bytes received on all non-loopback interfaces, or None off Linux"""
+    try:
+        with open('/proc/net/dev') as f:
+            lines = f.readlines()[2:]
+    except OSError:
+        return None
+    total = 0
+    for line in lines:
+        interface, _, counters = line.partition(':')
+        if interface.strip() != 'lo':
+            total += int(counters.split()[0])
+    return total
+
+def prefix_output(stream, name):
+    for line in stream:
+        print(f"[{name}] {line.rstrip()}", flush=True)
+
+def run_step(step, domain, origin, stub_dir=None, env=None):
+    """Run one step, returning its timeline entry
+
+    Resource usage comes from wait4() on the step's process, so it covers
+    the step and everything it waited for, and stays correct when steps
+    run concurrently.
+    """
+    events_file = tempfile.NamedTemporaryFile(prefix=f'setup-{step.name}-', suffix='.jsonl', delete=False)
+    events_file.close()
+    step_env = dict(env or os.environ, **{EVENTS_ENV: events_file.name})
+    command = step.command(domain, stub_dir)
+    rx_before = network_rx_bytes()
+    start_time = time.time()
+    try:
+        process = subprocess.Popen(command, cwd=SCRIPT_DIR, env=step_env, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, text=True, errors='replace')
+        # Concurrent steps share the terminal, so every line is labelled
+        reader = threading.Thread(target=prefix_output, args=(process.stdout, step.name), daemon=True)
+        reader.start()
+        _, wait_status, usage = os.wait4(process.pid, 0)
+        process.returncode = exit_status = os.waitstatus_to_exitcode(wait_status)
+        # A daemon started by the step may keep the pipe open
+        reader.join(5)
+    except OSError as e:
+        print(f"Error: Could not run step {step.name}: {e}")
+        exit_status, usage = 127, None
+    end_time = time.time()
+    rx_after = network_rx_bytes()
+
+    items = []
+    for event in read_events(events_file.name):
+        event['start'] -= origin
+        event['end'] -= origin
+        items.append(event)
+    os.remove(events_file.name)
+
+    entry = {
+        'name': step.name,
+        'command': command,
+        'start': start_time - origin,
+        'end': end_time - origin,
+        'wall': end_time - start_time,
+        'exit_status': exit_status,
+        'status': 'ok' if exit_status == 0 else 'failed',
+        'net_rx_bytes': rx_after - rx_before if rx_before is not None else None,
+        'items': sorted(items, key=lambda item: item['start']),
+    }
+    if usage is not None:
+        entry.update(cpu_user=usage.ru_utime, cpu_system=usage.ru_stime, max_rss_kb=usage.ru_maxrss,
+                     block_in=usage.ru_inblock, block_out=usage.ru_oublock)
+    if exit_status == 0:
+        entry['checked'] = check_step(step, stub_dir, step_env)
+        if entry['checked'] is False:
+            entry.update(status='failed', reason=f"exited 0 but check failed: {step.check}")
+    return entry
+
+def check_step(step, stub_dir=None, env=None):
+    """Run a step's check: True if it passed, False if it failed, None without one
+
+    Stub runs have nothing real to check and count as passed.
+    """
+    if step.check is None:
+        return None
+    if stub_dir is not None:
+        return True
+    result = subprocess.run(['bash', '-c', step.check], cwd=SCRIPT_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+def read_stamp(stamp_dir, name):
+    try:
+        with open(os.path.join(stamp_dir, f"{name}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_stamp(stamp_dir, name, input_hash, entry):
+    os.makedirs(stamp_dir, exist_ok=True)
+    path = os.path.join(stamp_dir, f"{name}.json")
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'input_hash': input_hash, 'completed': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                   'wall': entry['wall']}, f)
+    os.replace(path + '.tmp', path)
+
+def placeholder_entry(step, origin, status, reason):
+    """Timeline entry of a step that did not run"""
+    now = time.time() - origin
+    return {'name': step.name, 'command': [], 'start': now, 'end': now, 'wall': 0.0, 'exit_status': None,
+            'status': status, 'reason': reason, 'net_rx_bytes': None, 'items': []}
+
+def run_steps(steps, domain, stub_dir=None, jobs=DEFAULT_JOBS, stamp_dir=DEFAULT_STAMP_DIR, force=False):
+    """Run steps as a dependency graph and return the timeline
+
+    Ready steps run concurrently up to jobs. A failed step skips the steps
+    that depend on it, but independent ones carry on. Each completed step
+    whose check passed writes a stamp, so a rerun resumes after the last
+    failure. Deps outside
+    `steps` (see --only) are taken as done, with the hash from their stamp.
+    """
+    origin = time.time()
+    timeline = {
+        'host': socket.gethostname(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(origin)),
+        'mode': 'stub' if stub_dir is not None else 'real',
+        'steps': [],
+    }
+    selected = {step.name for step in steps}
+    hashes = {}
+    states = {}
+    running = {}
+    busy = set()
+
+    def dep_hash(name):
+        if name in hashes:
+            return hashes[name]
+        return (read_stamp(stamp_dir, name) or {}).get('input_hash', '')
+
+    def finish(step, entry):
+        states[step.name] = entry['status']
+        timeline['steps'].append(entry)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        while len(states) < len(steps):
+            for step in steps:
+                if step.name in states or step in running.values():
+                    continue
+                deps = [dep for dep in step.deps if dep in selected]
+                failed = [dep for dep in deps if states.get(dep) in ('failed', 'skipped')]
+                if failed:
+                    print(f"=== {step.name} skipped, {', '.join(failed)} did not complete")
+                    finish(step, placeholder_entry(step, origin, 'skipped', f"{', '.join(failed)} did not complete"))
+                    continue
+                if not all(dep in states for dep in deps):
+                    continue
+                if step.name not in hashes:
+                    hashes[step.name] = step.input_hash(domain, stub_dir, [dep_hash(dep) for dep in step.deps])
+                    stamp = read_stamp(stamp_dir, step.name)
+                    if not force and stamp and stamp.get('input_hash') == hashes[step.name]:
+                        print(f"=== {step.name} already completed at {stamp.get('completed')} with the same inputs, skipping")
+                        finish(step, placeholder_entry(step, origin, 'cached', f"completed at {stamp.get('completed')}"))
+                        continue
+                if len(running) >= max(1, jobs) or busy & step.resources:
+                    continue
+                busy |= step.resources
+                print(f"=== {step.name}: {' '.join(step.command(domain, stub_dir))}")
+                running[executor.submit(run_step, step, domain, origin, stub_dir)] = step
+
+            if not running:
+                if len(states) < len(steps):
+                    # Only possible with a dependency cycle
+                    for step in steps:
+                        if step.name not in states:
+                            finish(step, placeholder_entry(step, origin, 'skipped', 'dependency cycle'))
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                busy -= step.resources
+                entry = future.result()
+                if entry['status'] == 'ok' and entry.get('checked'):
+                    write_stamp(stamp_dir, step.name, hashes[step.name], entry)
+                print(f"=== {step.name} finished with status {entry['exit_status']} in {entry['wall']:.1f}s")
+                if entry.get('reason'):
+                    print(f"=== {step.name} failed: {entry['reason']}")
+                finish(step, entry)
+
+    timeline['steps'].sort(key=lambda entry: entry['start'])
+    timeline['total_seconds'] = time.time() - origin
+    timeline['ok'] = all(state in ('ok', 'cached') for state in states.values())
+    return timeline
+
+def folded_stacks(timeline):
+    """Collapsed stacks ("setup;step;item milliseconds") for flamegraph.pl or speedscope
+
+    A step's own frame holds the wall time not covered by its items. Items
+    that ran concurrently can cover more than the step's wall time, in which
+    case the self time is zero.
+    """
+    lines = []
+    for step in timeline['steps']:
+        covered = 0.0
+        for item in step['items']:
+            label = f"{item['kind']}:{item['name']}".replace(';', '_').replace(' ', '_')
+            lines.append(f"setup;{step['name']};{label} {int(item['wall'] * 1000)}")
+            covered += item['wall']
+        lines.append(f"setup;{step['name']} {int(max(0.0, step['wall'] - covered) * 1000)}")
+    return lines
+
+def format_bytes(value):
+    if value is None:
+        return '-'
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if value < 1024 or unit == 'GiB':
+            return f"{value:.0f}{unit}" if unit == 'B' else f"{value:.1f}{unit}"
+        value /= 1024
+
+def print_summary(timeline, width=40):
+    """Print each step as a bar proportional to its wall time, with its slowest items"""
+    total = sum(step['wall'] for step in timeline['steps']) or 1.0
+    print(f"\nSetup timeline for {timeline['host']} ({timeline['mode']}), {timeline['total_seconds']:.1f}s total:")
+    for step in timeline['steps']:
+        bar = '#' * max(1, int(width * step['wall'] / total))
+        cpu = step.get('cpu_user', 0) + step.get('cpu_system', 0)
+        status = step.get('status', 'ok' if step['exit_status'] == 0 else 'failed')
+        if status == 'failed':
+            status = f"exit {step['exit_status']}"
+        elif status != 'ok':
+            status = f"{status}, {step.get('reason')}"
+        print(f"  {step['name']:<15} {step['wall']:>8.1f}s {bar:<{width}} cpu {cpu:.1f}s, "
+              f"rx {format_bytes(step['net_rx_bytes'])}, {status}")
+        for item in sorted(step['items'], key=lambda item: -item['wall'])[:5]:
+            print(f"      {item['kind']}:{item['name']:<40} {item['wall']:>8.1f}s {item['status']}")
+
+def compare(timeline, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD, min_seconds=MIN_REGRESSION_SECONDS):
+    """Print per-step wall time against a baseline, returning the names of regressed steps"""
+    base_steps = {step['name']: step for step in baseline['steps']}
+    regressed = []
+    print(f"\nCompared with baseline from {baseline.get('started', '?')} on {baseline.get('host', '?')}:")
+    for step in timeline['steps']:
+        base = base_steps.get(step['name'])
+        if step.get('status', 'ok') != 'ok' or (base and base.get('status', 'ok') != 'ok'):
+            # Cached, skipped or failed steps say nothing about speed
+            continue
+        if base is None:
+            print(f"  {step['name']:<15} {step['wall']:>8.1f}s  (not in baseline)")
+            continue
+        delta = step['wall'] - base['wall']
+        ratio = delta / base['wall'] if base['wall'] else 0.0
+        flag = ''
+        if ratio > threshold and delta > min_seconds:
+            flag = '  REGRESSION'
+            regressed.append(step['name'])
+        print(f"  {step['name']:<15} {step['wall']:>8.1f}s vs {base['wall']:>8.1f}s  {ratio:+7.1%}{flag}")
+    return regressed
+
+def main():
+    args = sys.argv[1:]
+    domain = None
+    only = None
+    output = None
+    folded = None
+    baseline_path = None
+    threshold = DEFAULT_REGRESSION_THRESHOLD
+    min_seconds = MIN_REGRESSION_SECONDS
+    fail_on_regression = False
+    stub_dir = None
+    report = None
+    jobs = DEFAULT_JOBS
+    force = False
+    stamp_dir = DEFAULT_STAMP_DIR
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--only':
+                only = args.pop(0).split(',')
+            elif arg == '--jobs':
+                jobs = int(args.pop(0))
+            elif arg == '--force':
+                force = True
+            elif arg == '--stamp-dir':
+                stamp_dir = args.pop(0)
+            elif arg == '--output':
+                output = args.pop(0)
+            elif arg == '--folded':
+                folded = args.pop(0)
+            elif arg == '--baseline':
+                baseline_path = args.pop(0)
+            elif arg == '--threshold':
+                threshold = float(args.pop(0)) / 100
+            elif arg == '--min-delta':
+                min_seconds = float(args.pop(0))
+            elif arg == '--fail-on-regression':
+                fail_on_regression = True
+            elif arg == '--stub-dir':
+                stub_dir = os.path.abspath(args.pop(0))
+            elif arg == '--report':
+                report = args.pop(0)
+            elif domain is None and not arg.startswith('--'):
+                domain = arg
+            else:
+                print_usage()
+    except (IndexError, ValueError) as e:
+        print(f"Invalid arguments: {e}")
+        print_usage()
+
+    if report:
+        with open(report) as f:
+            timeline = json.load(f)
+    else:
+        if domain is None:
+            print_usage()
+        steps = STEPS
+        if only:
+            unknown = set(only) - {step.name for step in STEPS}
+            if unknown:
+                print(f"Error: Unknown steps: {', '.join(sorted(unknown))}")
+                sys.exit(1)
+            steps = [step for step in STEPS if step.name in only]
+        timeline = run_steps(steps, domain, stub_dir, jobs, stamp_dir, force)
+        output = output or os.path.join(DEFAULT_TIMELINE_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(timeline, f, indent=2)
+        print(f"Timeline written to {output}")
+
+    print_summary(timeline)
+    if folded:
+        with open(folded, 'w') as f:
+            f.write('\n'.join(folded_stacks(timeline)) + '\n')
+        print(f"Folded stacks written to {folded}")
+
+    regressed = []
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressed = compare(timeline, json.load(f), threshold, min_seconds)
+
+    if not timeline.get('ok', True):
+        sys.exit(1)
+    if regressed and fail_on_regression:
+        sys.exit(3)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os
+import json
+import time
+import threading
+
+# Set by setup_runner.py for each step; sub-items (repos, model files) are appended as JSON lines
+EVENTS_ENV = 'SETUP_TIMELINE_EVENTS'
+
+_lock = threading.Lock()
+
+def record_event(kind, name, start_time, status, **fields):
+    """Append a sub-item event for the setup profiler, if one is listening
+
+    start_time is a time.time() value; the event ends now. Does nothing
+    when the script runs outside setup_runner.py.
+    """
+    path = os.getenv(EVENTS_ENV)
+    if not path:
+        return
+    end_time = time.time()
+    event = dict(fields, kind=kind, name=name, start=start_time, end=end_time,
+                 wall=end_time - start_time, status=status)
+    with _lock, open(path, 'a') as f:
+        f.write(json.dumps(event) + '\n')
+
+def read_events(path):
+    """Read the events written by record_event"""
+    events = []
+    if not os.path.exists(path):
+        return events
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # A step killed mid-write leaves a partial last line
+                    continue
+    return events
@@ -0,0 +1,340 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from cloud_providers import CloudProvider, AWSProvider, AzureProvider, StatusCache
+from readiness import SETTLE_SECONDS, Backoff, ProbeFailed, ReadinessResult, service_probes, wait_until_ready
+from instrumentation import instrument, record_readiness, record_start_requested
+from governor import get_governor
+
+logger = logging.getLogger(__name__)
+
+class AsyncCloudProvider(ABC):
+    """Base class for asyncio-native cloud providers
+
+    Mirrors CloudProvider with coroutine methods. Every method accepts a
+    timeout in seconds and can be cancelled by cancelling the awaiting task.
+    """
+
+    # States from which an instance will not reach running without intervention
+    running_failure_states = ()
+
+    # Label used in logs and metrics
+    provider_name = None
+
+    @abstractmethod
+    async def start_instance(self, instance_id, timeout=None, **kwargs):
+        """Start an instance"""
+        pass
+
+    @abstractmethod
+    async def stop_instance(self, instance_id, timeout=None, **kwargs):
+        """Stop an instance"""
+        pass
+
+    @abstractmethod
+    async def check_instance_status(self, instance_id, timeout=None, **kwargs):
+        """Check the status of an instance; max_age=0 bypasses any status cache"""
+        pass
+
+    async def wait_for_status(self, instance_id, state, timeout=300, failure_states=(), **kwargs):
+        """Poll with adaptive backoff until the instance reaches state
+
+        Returns True once it does, False on timeout or when a failure state
+        is observed.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        backoff = Backoff()
+        while True:
+            try:
+                status = await self.check_instance_status(instance_id, max_age=0, **kwargs)
+                if status == state:
+                    return True
+                if status in failure_states:
+                    logger.warning(f"Instance {instance_id} entered state {status} while waiting for {state}")
+                    return False
+            except Exception as e:
+                logger.warning(f"Error checking status of {instance_id} while waiting: {e}")
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(backoff.next(), remaining))
+
+    async def wait_for_ready(self, instance_id, timeout=300, host=None, training=False, probes=None,
+                             settle=SETTLE_SECONDS, **kwargs):
+        """Async counterpart of CloudProvider.wait_for_ready
+
+        The power state phase is polled natively on the event loop; service
+        probes (TCP/HTTP) run in the default executor afterwards.
+        """
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        result = ReadinessResult()
+        backoff = Backoff()
+
+        while True:
+            try:
+                status = await self.check_instance_status(instance_id, max_age=0, **kwargs)
+                if status == 'running':
+                    result.phases.append(('cloud:running', loop.time() - start_time))
+                    break
+                if status in self.running_failure_states:
+                    result.failed_phase = 'cloud:running'
+                    result.error = ProbeFailed(f"Instance {instance_id} entered state {status} while waiting for running")
+                    result.elapsed = loop.time() - start_time
+                    return result
+            except Exception as e:
+                result.error = e
+            remaining = timeout - (loop.time() - start_time)
+            if remaining <= 0:
+                result.failed_phase = 'cloud:running'
+                result.elapsed = loop.time() - start_time
+                return result
+            await asyncio.sleep(min(backoff.next(), remaining))
+
+        phases = service_probes(host, training, probes, settle)
+        if phases:
+            offset = loop.time() - start_time
+            services = await loop.run_in_executor(
+                None, functools.partial(wait_until_ready, phases, timeout=max(0, timeout - offset)))
+            result.phases.extend((name, offset + ready_at) for name, ready_at in services.phases)
+            result.failed_phase = services.failed_phase
+            result.error = services.error
+            if not services.ready:
+                result.elapsed = loop.time() - start_time
+                return result
+
+        result.ready = True
+        result.error = None
+        result.elapsed = loop.time() - start_time
+        return result
+
+    async def wait_for_running_status(self, instance_id, timeout=300, **kwargs):
+        """Wait for the instance to be in running state (and ready, if host is given)"""
+        wait_started = time.time()
+        result = await self.wait_for_ready(instance_id, timeout=timeout, **kwargs)
+        record_readiness(self.provider_name, instance_id, result, wait_started)
+        fields = {'fields': {'provider': self.provider_name, 'instance': instance_id, 'ready': result.ready,
+                             'phases': result.phase_durations(), 'elapsed': result.elapsed}}
+        if result.ready:
+            logger.info(f"Instance {instance_id} is ready: {result.summary()}", extra=fields)
+        else:
+            logger.warning(f"Timeout waiting for instance {instance_id} to start: {result.error or result.summary()}",
+                           extra=fields)
+        return result.ready
+
+    async def close(self):
+        """Release network resources held by the provider"""
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+@instrument('azure')
+class AsyncAzureProvider(AsyncCloudProvider):
+    """Azure provider backed by azure.mgmt.compute.aio"""
+
+    provider_name = 'azure'
+
+    def __init__(self, resource_group=None):
+        from azure.identity.aio import ClientSecretCredential
+        from azure.mgmt.compute.aio import ComputeManagementClient
+
+        self.default_resource_group = resource_group or os.getenv('AZURE_RESOURCE_GROUP', 'TRI3D_ML')
+        self.subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
+        self.credential = ClientSecretCredential(
+            os.getenv('AZURE_TENANT_ID'), os.getenv('AZURE_CLIENT_ID'), os.getenv('AZURE_CLIENT_SECRET'))
+        # Retries are left to the governor, shared with the blocking providers of the subscription
+        self.compute_client = ComputeManagementClient(self.credential, self.subscription_id, retry_total=0)
+        self.governor = get_governor('azure', self.subscription_id)
+        self.status_cache = StatusCache()
+
+    async def _run_operation(self, begin, resource_group, instance_id):
+        poller = await begin(resource_group, instance_id)
+        return await poller.result()
+
+    async def check_instance_status(self, instance_id, resource_group=None, timeout=None, max_age=None, **kwargs):
+        """Check the power state of an Azure VM, max_age as for AzureProvider.check_instance_status"""
+        resource_group = resource_group or self.default_resource_group
+        cache_key = AzureProvider._cache_key(resource_group, instance_id)
+        hit, power_state = self.status_cache.lookup(cache_key, max_age)
+        if hit:
+            return power_state
+        vm = await asyncio.wait_for(
+            self.governor.acall('get', self.compute_client.virtual_machines.get, resource_group, instance_id,
+                                expand='instanceView'),
+            timeout)
+        # The instance view, or its statuses, can be missing while a VM is being created
+        power_state = AzureProvider._power_state(vm.instance_view)
+        self.status_cache.set(cache_key, power_state)
+        return power_state
+
+    async def start_instance(self, instance_id, resource_group=None, timeout=None, **kwargs):
+        """Start an Azure VM and await the long-running operation"""
+        resource_group = resource_group or self.default_resource_group
+        vm_status = await self.check_instance_status(instance_id, resource_group, timeout=timeout)
+
+        if vm_status in ['deallocated', 'stopped', 'failed']:
+            logger.info(f"Starting Azure VM: {instance_id}")
+            record_start_requested('azure', instance_id)
+            await asyncio.wait_for(
+                self.governor.acall('start', self._run_operation, self.compute_client.virtual_machines.begin_start,
+                                    resource_group, instance_id, kind='write'),
+                timeout)
+            self.status_cache.invalidate(AzureProvider._cache_key(resource_group, instance_id))
+            logger.info(f"Azure VM {instance_id} started successfully")
+            return True
+        elif vm_status == 'running':
+            logger.info(f"Azure VM {instance_id} is already running.")
+            return True
+        elif vm_status == 'stopping':
+            raise ValueError(f"Azure VM {instance_id} is currently stopping. Please wait for it to fully stop before starting.")
+        else:
+            raise ValueError(f"Azure VM {instance_id} is in a state that cannot be started: {vm_status}")
+
+    async def stop_instance(self, instance_id, resource_group=None, timeout=None, **kwargs):
+        """Stop and deallocate an Azure VM and await the long-running operation"""
+        resource_group = resource_group or self.default_resource_group
+        vm_status = await self.check_instance_status(instance_id, resource_group, timeout=timeout)
+
+        if vm_status == 'running':
+            logger.info(f"Deallocating Azure VM: {instance_id}")
+            await asyncio.wait_for(
+                self.governor.acall('deallocate', self._run_operation,
+                                    self.compute_client.virtual_machines.begin_deallocate,
+                                    resource_group, instance_id, kind='write'),
+                timeout)
+            self.status_cache.invalidate(AzureProvider._cache_key(resource_group, instance_id))
+            logger.info(f"Azure VM {instance_id} deallocated.")
+            return True
+        logger.info(f"Azure VM {instance_id} is not in running state. Current state: {vm_status}")
+        return False
+
+    async def close(self):
+        await self.compute_client.close()
+        await self.credential.close()
+
+class AsyncAWSProvider(AsyncCloudProvider):
+    """AWS provider running the blocking boto3 calls of AWSProvider in an executor
+
+    Each API call is a single short request, so only the waits need to be
+    interruptible; those poll on the event loop and stop at the next tick
+    when cancelled.
+    """
+
+    running_failure_states = AWSProvider.running_failure_states
+    provider_name = 'aws'
+
+    def __init__(self, region=None, profile=None, max_workers=8, provider=None):
+        self.provider = provider or AWSProvider(region=region, profile=profile)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def _call(self, method, *args, timeout=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout)
+
+    async def check_instance_status(self, instance_id, region=None, timeout=None, max_age=None, **kwargs):
+        """Check the status of an AWS EC2 instance, max_age as for AWSProvider.check_instance_status"""
+        return await self._call(self.provider.check_instance_status, instance_id, region, max_age=max_age,
+                                timeout=timeout)
+
+    async def check_instances_status(self, instance_ids, region=None, timeout=None, **kwargs):
+        """Check the status of many AWS EC2 instances in bulk"""
+        return await self._call(self.provider.check_instances_status, instance_ids, region, timeout=timeout)
+
+    async def start_instance(self, instance_id, region=None, timeout=None, **kwargs):
+        """Start an AWS EC2 instance"""
+        return await self._call(self.provider.start_instance, instance_id, region, timeout=timeout)
+
+    async def stop_instance(self, instance_id, region=None, timeout=None, **kwargs):
+        """Stop an AWS EC2 instance"""
+        return await self._call(self.provider.stop_instance, instance_id, region, timeout=timeout)
+
+    async def wait_for_stopped_status(self, instance_id, region=None, timeout=300, **kwargs):
+        """Wait for the AWS EC2 instance to be in stopped state"""
+        return await self.wait_for_status(
+            instance_id, 'stopped', timeout=timeout, failure_states=('pending', 'terminated'), region=region)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+class SyncCloudProvider(CloudProvider):
+    """Blocking facade over an AsyncCloudProvider
+
+    Runs every coroutine on a private event loop so async clients (which are
+    bound to the loop they were first used on) can be reused across calls.
+    The loop runs in a background thread, so calls from several threads
+    (batch_server, the autoscaler) proceed concurrently instead of queueing.
+    Methods not defined here are forwarded the same way, e.g.
+    wait_for_stopped_status.
+    """
+
+    def __init__(self, async_provider):
+        self.async_provider = async_provider
+        self.provider_name = async_provider.provider_name
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=f"{self.provider_name}-provider-loop",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, coro):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            # Interrupted callers (e.g. KeyboardInterrupt) must not leave the operation running
+            future.cancel()
+            raise
+
+    def start_instance(self, instance_id, **kwargs):
+        return self._run(self.async_provider.start_instance(instance_id, **kwargs))
+
+    def stop_instance(self, instance_id, **kwargs):
+        return self._run(self.async_provider.stop_instance(instance_id, **kwargs))
+
+    def check_instance_status(self, instance_id, **kwargs):
+        return self._run(self.async_provider.check_instance_status(instance_id, **kwargs))
+
+    def wait_for_running_status(self, instance_id, **kwargs):
+        return self._run(self.async_provider.wait_for_running_status(instance_id, **kwargs))
+
+    def wait_for_ready(self, instance_id, **kwargs):
+        return self._run(self.async_provider.wait_for_ready(instance_id, **kwargs))
+
+    def __getattr__(self, name):
+        attribute = getattr(self.async_provider, name)
+        if not asyncio.iscoroutinefunction(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def blocking(*args, **kwargs):
+            return self._run(attribute(*args, **kwargs))
+        return blocking
+
+    def close(self):
+        self._run(self.async_provider.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+def get_async_cloud_provider(provider_name, **kwargs):
+    """Factory function to get the appropriate async cloud provider"""
+    providers = {
+        'azure': AsyncAzureProvider,
+        'aws': AsyncAWSProvider
+    }
+
+    if provider_name.lower() not in providers:
+        raise ValueError(f"Unsupported cloud provider: {provider_name}")
+
+    return providers[provider_name.lower()](**kwargs)
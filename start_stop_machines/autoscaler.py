@@ -0,0 +1,311 @@
+import sys
+import logging
+import json
+import time
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+load_dotenv()
+
+from batch_server import Target, build_providers
+from instrumentation import configure_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICY = {
+    'poll_interval': 15,
+    # Start a node when pending jobs per ready node exceed this
+    'scale_up_pending_per_node': 2,
+    # Only consider scaling down while pending jobs are at or below this
+    'scale_down_pending': 0,
+    # A node must be idle this long before it is deallocated
+    'idle_cooldown': 900,
+    # Minimum seconds between two scale-ups, and before a scale-down follows any scaling action
+    'scale_up_cooldown': 120,
+    'scale_down_cooldown': 300,
+    'min_running': 0,
+    'max_running': 8,
+    # Start/stop operations in flight at once
+    'max_concurrent_operations': 2,
+    'http_timeout': 5,
+    'start_timeout': 900,
+}
+
+def print_usage():
+    print("Usage: python autoscaler.py <config.json> [--once] [--dry-run] [--verbose]")
+    print("  config.json: Nodes and policy, see autoscaler.example.json")
+    print("  --once:      Optional - Run a single evaluation and exit")
+    print("  --dry-run:   Optional - Log scaling decisions without starting or stopping anything")
+    print("  --verbose:   Optional - Print per-node status on every poll")
+    sys.exit(1)
+
+def http_get_json(url, timeout):
+    """GET url and decode the JSON body"""
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read().decode() or 'null')
+
+class Node:
+    """A ComfyUI machine managed by the autoscaler"""
+
+    def __init__(self, config):
+        self.target = Target(config['name'], config.get('provider', 'azure'), config.get('location'))
+        self.host = config.get('host')
+        self.port = config.get('port', 80)
+        self.hourly_cost = float(config.get('hourly_cost', 0))
+        # Optional Flask training status endpoint returning JSON with busy/running/active_jobs
+        self.training_status_path = config.get('training_status_path')
+
+        self.power_state = None
+        self.healthy = False
+        self.pending = 0
+        self.running_jobs = 0
+        self.training_busy = False
+        self.idle_since = None
+        # 'starting' or 'stopping' while an operation is in flight
+        self.operation = None
+        # When the node was started, or first seen running without ComfyUI answering
+        self.booting_since = None
+
+    @property
+    def name(self):
+        return self.target.identifier
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def is_running(self):
+        return self.power_state == 'running'
+
+    @property
+    def is_stopped(self):
+        return self.power_state in ('deallocated', 'stopped')
+
+    @property
+    def is_idle(self):
+        return self.is_running and self.healthy and not (self.pending or self.running_jobs or self.training_busy)
+
+class Autoscaler:
+    """Starts and deallocates nodes from ComfyUI queue depth
+
+    Each tick refreshes power states and queues, then takes at most one
+    scaling action. Scale-ups pick the cheapest stopped node, scale-downs the
+    most expensive node idle for longer than idle_cooldown.
+    """
+
+    def __init__(self, nodes, policy=None, providers=None, http_get=http_get_json, clock=time.monotonic,
+                 dry_run=False):
+        self.nodes = nodes
+        self.policy = dict(DEFAULT_POLICY, **(policy or {}))
+        self.providers = providers if providers is not None else build_providers([node.target for node in nodes])
+        self.http_get = http_get
+        self.clock = clock
+        self.dry_run = dry_run
+        self.last_scale_up = None
+        self.last_scale_down = None
+        self.executor = ThreadPoolExecutor(max_workers=self.policy['max_concurrent_operations'])
+        self._lock = threading.Lock()
+
+    def provider(self, node):
+        return self.providers[node.target.group_key()]
+
+    def refresh_power_states(self):
+        """Update power states, with one bulk listing per resource group where supported"""
+        listed = {}
+        for node in self.nodes:
+            provider = self.provider(node)
+            resource_group = node.target.call_kwargs().get('resource_group')
+            key = (node.target.group_key(), resource_group)
+            try:
+                if hasattr(provider, 'list_instance_statuses'):
+                    if key not in listed:
+                        listed[key] = provider.list_instance_statuses(resource_group)
+                    node.power_state = listed[key].get(node.name)
+                else:
+                    node.power_state = provider.check_instance_status(node.name, **node.target.call_kwargs())
+            except Exception as e:
+                print(f"Error checking status of {node.name}: {e}")
+                node.power_state = None
+
+    def refresh_queue(self, node):
+        """Poll ComfyUI /queue and /system_stats (and training status) of a running node"""
+        timeout = self.policy['http_timeout']
+        try:
+            self.http_get(f"{node.base_url}/system_stats", timeout)
+            queue = self.http_get(f"{node.base_url}/queue", timeout) or {}
+            node.pending = len(queue.get('queue_pending', []))
+            node.running_jobs = len(queue.get('queue_running', []))
+            node.training_busy = False
+            if node.training_status_path:
+                training = self.http_get(f"{node.base_url}{node.training_status_path}", timeout) or {}
+                node.training_busy = any(training.get(key) for key in ('busy', 'running', 'active_jobs'))
+            node.healthy = True
+        except Exception as e:
+            logger.debug(f"{node.name} not answering: {e}")
+            node.healthy = False
+            node.pending = node.running_jobs = 0
+            node.training_busy = False
+
+    def refresh(self):
+        self.refresh_power_states()
+        now = self.clock()
+        for node in self.nodes:
+            if node.is_running and node.host:
+                self.refresh_queue(node)
+            else:
+                node.healthy = False
+                node.pending = node.running_jobs = 0
+            if node.is_running and not node.healthy:
+                node.booting_since = node.booting_since if node.booting_since is not None else now
+            elif node.operation != 'starting':
+                node.booting_since = None
+            if node.is_idle:
+                node.idle_since = node.idle_since if node.idle_since is not None else now
+            else:
+                node.idle_since = None
+            logger.debug(f"{node.name}: {node.power_state}, healthy={node.healthy}, "
+                         f"pending={node.pending}, running={node.running_jobs}, training_busy={node.training_busy}, "
+                         f"operation={node.operation}")
+
+    def _in_flight(self):
+        with self._lock:
+            return sum(1 for node in self.nodes if node.operation)
+
+    def _cooled_down(self, last, cooldown, now):
+        return last is None or now - last >= cooldown
+
+    def _booting(self, node, now):
+        """Whether a node is being started or still within start_timeout of coming up"""
+        if node.operation == 'starting':
+            return True
+        return (node.is_running and not node.healthy and node.booting_since is not None
+                and now - node.booting_since < self.policy['start_timeout'])
+
+    def decide(self):
+        """Return ('start', node), ('stop', node) or None for the current state"""
+        policy = self.policy
+        now = self.clock()
+        active = [node for node in self.nodes
+                  if (node.is_running and node.operation != 'stopping') or node.operation == 'starting']
+        ready = [node for node in self.nodes if node.is_running and node.healthy]
+        # Nodes on their way up will take jobs soon, count them so one burst doesn't start every node
+        capacity = len(ready) + sum(1 for node in self.nodes if self._booting(node, now))
+        pending = sum(node.pending for node in self.nodes)
+
+        if self._in_flight() >= policy['max_concurrent_operations']:
+            return None
+
+        stopped = sorted((node for node in self.nodes if node.is_stopped and not node.operation),
+                         key=lambda node: node.hourly_cost)
+        below_min = len(active) < policy['min_running']
+        overloaded = pending > policy['scale_up_pending_per_node'] * max(capacity, 1) or (pending and not capacity)
+        if stopped and len(active) < policy['max_running'] and (below_min or (
+                overloaded and self._cooled_down(self.last_scale_up, policy['scale_up_cooldown'], now))):
+            return 'start', stopped[0]
+
+        if pending > policy['scale_down_pending'] or len(active) <= policy['min_running']:
+            return None
+        if not (self._cooled_down(self.last_scale_up, policy['scale_down_cooldown'], now)
+                and self._cooled_down(self.last_scale_down, policy['scale_down_cooldown'], now)):
+            return None
+        idle = sorted((node for node in self.nodes
+                       if node.is_idle and not node.operation and now - node.idle_since >= policy['idle_cooldown']),
+                      key=lambda node: -node.hourly_cost)
+        if idle:
+            return 'stop', idle[0]
+        return None
+
+    def _start(self, node):
+        try:
+            provider = self.provider(node)
+            kwargs = node.target.call_kwargs()
+            if provider.start_instance(node.name, **kwargs):
+                # With a host, the node only counts once ComfyUI itself answers
+                wait_kwargs = {'host': node.host} if node.host else {}
+                provider.wait_for_running_status(node.name, timeout=self.policy['start_timeout'], **kwargs, **wait_kwargs)
+        except Exception as e:
+            print(f"Error starting {node.name}: {e}")
+        finally:
+            with self._lock:
+                node.operation = None
+
+    def _stop(self, node):
+        try:
+            self.provider(node).stop_instance(node.name, **node.target.call_kwargs())
+        except Exception as e:
+            print(f"Error stopping {node.name}: {e}")
+        finally:
+            with self._lock:
+                node.operation = None
+
+    def act(self, decision):
+        if decision is None:
+            return
+        action, node = decision
+        now = self.clock()
+        pending = sum(n.pending for n in self.nodes)
+        if action == 'start':
+            print(f"Scaling up: starting {node.name} (${node.hourly_cost}/h), {pending} jobs pending")
+            self.last_scale_up = now
+            node.booting_since = now
+        else:
+            print(f"Scaling down: deallocating {node.name}, idle for {now - node.idle_since:.0f}s")
+            self.last_scale_down = now
+        if self.dry_run:
+            return
+        with self._lock:
+            node.operation = 'starting' if action == 'start' else 'stopping'
+        self.executor.submit(self._start if action == 'start' else self._stop, node)
+
+    def tick(self):
+        """Refresh state and take at most one scaling action, returning the decision"""
+        self.refresh()
+        decision = self.decide()
+        self.act(decision)
+        return decision
+
+    def run(self, once=False):
+        while True:
+            started = self.clock()
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Error during autoscaler tick: {e}")
+            if once:
+                self.executor.shutdown(wait=True)
+                return
+            time.sleep(max(0, self.policy['poll_interval'] - (self.clock() - started)))
+
+def load_config(path):
+    """Load nodes and policy from a JSON config file"""
+    with open(path) as f:
+        config = json.load(f)
+    return [Node(node) for node in config['nodes']], config.get('policy', {})
+
+def main():
+    args = sys.argv[1:]
+    once = "--once" in args
+    dry_run = "--dry-run" in args
+    verbose = "--verbose" in args
+    args = [arg for arg in args if arg not in ("--once", "--dry-run", "--verbose")]
+    configure_logging(verbose)
+    if len(args) != 1:
+        print_usage()
+
+    try:
+        nodes, policy = load_config(args[0])
+        autoscaler = Autoscaler(nodes, policy, dry_run=dry_run)
+    except Exception as e:
+        print(f"Error initializing autoscaler: {e}")
+        sys.exit(1)
+
+    print(f"Autoscaler managing {len(nodes)} nodes (dry run: {dry_run})")
+    try:
+        autoscaler.run(once=once)
+    except KeyboardInterrupt:
+        print("Autoscaler stopped")
+
+if __name__ == "__main__":
+    main()
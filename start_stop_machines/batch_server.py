@@ -0,0 +1,379 @@
+import sys
+import os
+import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+load_dotenv()
+
+from cloud_providers import get_cloud_provider
+from instrumentation import configure_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = 'azure'
+DEFAULT_MAX_WORKERS = 16
+# Power state a successful action leaves an instance in, as inventory.py records it
+FINAL_STATES = {
+    ('start', 'azure'): 'running',
+    ('start', 'aws'): 'running',
+    ('stop', 'azure'): 'deallocated',
+    ('stop', 'aws'): 'stopped',
+}
+
+def print_usage():
+    print("Usage: python batch_server.py <start|stop> <target> [<target> ...] [--file PATH] [--select SELECTOR] [--max-workers N] [--timeout S] [--verbose]")
+    print("  target:         identifier[:cloud_provider[:resource_group/region]]")
+    print("                  e.g. a100-node-1:azure:TRI3D_ML or i-0abc123:aws:us-west-2")
+    print("  --file PATH:    Optional - Read additional targets from PATH (one per line, # comments allowed)")
+    print("  --select:       Optional - Add every indexed instance matching SELECTOR (see inventory.py), e.g. gpu=a100,state=deallocated")
+    print("  --max-workers:  Optional - Maximum number of concurrent operations (default 16; AWS regions count once)")
+    print("  --timeout:      Optional - Per-instance timeout in seconds for reaching the target state (default 300)")
+    print("  --verbose:      Optional - Enable verbose debug output")
+    sys.exit(1)
+
+class Target:
+    """A single instance addressed by the batch CLI"""
+
+    def __init__(self, identifier, provider_name=DEFAULT_PROVIDER, location=None):
+        self.identifier = identifier
+        self.provider_name = provider_name.lower()
+        self.location = location or None
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse identifier[:cloud_provider[:resource_group/region]]"""
+        parts = [part.strip() for part in spec.strip().split(':')]
+        if not parts[0] or len(parts) > 3:
+            raise ValueError(f"Invalid target: {spec}")
+        return cls(*parts)
+
+    def group_key(self):
+        """Targets sharing a key are served by one provider client
+
+        Azure clients are subscription-wide, so a single client serves every
+        resource group. AWS clients are bound to a region.
+        """
+        if self.provider_name == 'aws':
+            return (self.provider_name, self.location)
+        return (self.provider_name, None)
+
+    def call_kwargs(self):
+        """Keyword arguments for the CloudProvider methods"""
+        if self.location and self.provider_name == 'azure':
+            return {'resource_group': self.location}
+        # AWS targets use a provider constructed for their region
+        return {}
+
+    def __str__(self):
+        location = f" ({self.location})" if self.location else ""
+        return f"{self.provider_name}:{self.identifier}{location}"
+
+def build_providers(targets):
+    """Create one shared provider per account/region used by the targets"""
+    providers = {}
+    for target in targets:
+        key = target.group_key()
+        if key in providers:
+            continue
+        provider_name, region = key
+        if region:
+            providers[key] = get_cloud_provider(provider_name, region=region)
+        else:
+            providers[key] = get_cloud_provider(provider_name)
+    return providers
+
+def prefetch_statuses(providers, targets):
+    """Prime provider status caches with one list call per resource group
+
+    Only providers with a bulk listing (Azure) are prefetched, and only for
+    resource groups holding more than one target.
+    """
+    groups = {}
+    for target in targets:
+        provider = providers[target.group_key()]
+        if hasattr(provider, 'list_instance_statuses'):
+            key = (target.group_key(), target.call_kwargs().get('resource_group'))
+            groups[key] = groups.get(key, 0) + 1
+
+    for (group_key, resource_group), count in groups.items():
+        if count < 2:
+            continue
+        try:
+            providers[group_key].list_instance_statuses(resource_group)
+        except Exception as e:
+            # Per-instance lookups still work, just without the shortcut
+            print(f"Warning: could not list instance statuses for {resource_group or 'default resource group'}: {e}")
+
+def start_target(provider, target, timeout=300):
+    """Start one instance and wait for it to be running"""
+    kwargs = target.call_kwargs()
+    current_status = provider.check_instance_status(target.identifier, **kwargs)
+    if current_status == 'stopping':
+        raise ValueError(f"Instance {target.identifier} is currently stopping. Please wait for it to fully stop before starting.")
+
+    if not provider.start_instance(target.identifier, **kwargs):
+        return False, f"could not start (status: {current_status})"
+    if not provider.wait_for_running_status(target.identifier, timeout=timeout, **kwargs):
+        return False, "timeout waiting for running state"
+    return True, "running"
+
+def stop_target(provider, target, timeout=300):
+    """Stop one instance, waiting for AWS instances to fully stop"""
+    kwargs = target.call_kwargs()
+    if not provider.stop_instance(target.identifier, **kwargs):
+        status = provider.check_instance_status(target.identifier, **kwargs)
+        if status == FINAL_STATES[('stop', target.provider_name)]:
+            return True, f"already {status}"
+        return False, f"not stopped (status: {status})"
+    if target.provider_name == 'aws':
+        if not provider.wait_for_stopped_status(target.identifier, timeout=timeout, **kwargs):
+            return False, "timeout waiting for stopped state"
+    return True, "stopped"
+
+def start_group(provider, targets, timeout=300):
+    """Start a group of instances through the provider's bulk API"""
+    instance_ids = [target.identifier for target in targets]
+    started = provider.start_instances(instance_ids)
+    running = provider.wait_for_instances_running(
+        [instance_id for instance_id in instance_ids if started.get(instance_id)], timeout=timeout)
+
+    outcomes = {}
+    for instance_id in instance_ids:
+        if not started.get(instance_id):
+            outcomes[instance_id] = (False, "could not start")
+        elif not running.get(instance_id):
+            outcomes[instance_id] = (False, "timeout waiting for running state")
+        else:
+            outcomes[instance_id] = (True, "running")
+    return outcomes
+
+def stop_group(provider, targets, timeout=300):
+    """Stop a group of instances through the provider's bulk API"""
+    instance_ids = [target.identifier for target in targets]
+    stopping = provider.stop_instances(instance_ids)
+    stopped = provider.wait_for_instances_stopped(
+        [instance_id for instance_id in instance_ids if stopping.get(instance_id)], timeout=timeout)
+
+    not_running = [instance_id for instance_id in instance_ids if not stopping.get(instance_id)]
+    statuses = provider.check_instances_status(not_running) if not_running else {}
+    stopped_state = FINAL_STATES[('stop', targets[0].provider_name)]
+
+    outcomes = {}
+    for instance_id in instance_ids:
+        if statuses.get(instance_id) == stopped_state:
+            outcomes[instance_id] = (True, f"already {stopped_state}")
+        elif not stopping.get(instance_id):
+            outcomes[instance_id] = (False, f"not running (status: {statuses.get(instance_id)})")
+        elif not stopped.get(instance_id):
+            outcomes[instance_id] = (False, "timeout waiting for stopped state")
+        else:
+            outcomes[instance_id] = (True, "stopped")
+    return outcomes
+
+def supports_bulk(provider):
+    """Providers exposing list-accepting methods handle a whole group per call"""
+    return all(hasattr(provider, name) for name in (
+        'start_instances', 'stop_instances', 'check_instances_status', 'wait_for_instances_running',
+        'wait_for_instances_stopped'))
+
+def run_batch(action, targets, providers=None, max_workers=DEFAULT_MAX_WORKERS, timeout=300, inventory=None):
+    """Run start/stop concurrently for all targets
+
+    Targets on providers with a bulk API are handled one group per worker,
+    everything else one instance per worker. Each success is recorded in
+    inventory, if given, so later --select runs see the new state. Returns
+    a list of result dicts in the order of targets.
+    """
+    operations = {'start': (start_target, start_group), 'stop': (stop_target, stop_group)}
+    if action not in operations:
+        raise ValueError(f"Unsupported action: {action}")
+    operation, group_operation = operations[action]
+
+    if providers is None:
+        providers = build_providers(targets)
+    prefetch_statuses(providers, targets)
+
+    # Split the targets into units of work
+    units = []
+    groups = {}
+    for target in targets:
+        provider = providers[target.group_key()]
+        if supports_bulk(provider):
+            if target.group_key() not in groups:
+                groups[target.group_key()] = []
+                units.append(groups[target.group_key()])
+            groups[target.group_key()].append(target)
+        else:
+            units.append([target])
+
+    print_lock = threading.Lock()
+
+    def run_unit(unit_targets):
+        start_time = time.time()
+        provider = providers[unit_targets[0].group_key()]
+        try:
+            if supports_bulk(provider):
+                outcomes = group_operation(provider, unit_targets, timeout=timeout)
+            else:
+                target = unit_targets[0]
+                outcomes = {target.identifier: operation(provider, target, timeout=timeout)}
+        except ValueError as ve:
+            outcomes = {target.identifier: (False, f"ERROR: {ve}") for target in unit_targets}
+        except Exception as e:
+            outcomes = {target.identifier: (False, f"Error: {e}") for target in unit_targets}
+        elapsed = time.time() - start_time
+
+        unit_results = []
+        for target in unit_targets:
+            ok, message = outcomes[target.identifier]
+            unit_results.append({
+                'target': target,
+                'ok': ok,
+                'message': message,
+                'elapsed': elapsed,
+            })
+            with print_lock:
+                print(f"[{'OK' if ok else 'FAILED'}] {target}: {message} ({elapsed:.1f}s)")
+                if ok and inventory is not None:
+                    record_state(inventory, action, target, provider)
+        return unit_results
+
+    results = {}
+    workers = max(1, min(max_workers, len(units)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_unit, unit) for unit in units]
+        for future in as_completed(futures):
+            for result in future.result():
+                results[id(result['target'])] = result
+    return [results[id(target)] for target in targets]
+
+def resolve_location(target, provider=None):
+    """The resource group or region a target lives in, defaulting to the provider's"""
+    if target.location:
+        return target.location
+    if target.provider_name == 'azure':
+        return getattr(provider, 'default_resource_group', None) or os.getenv('AZURE_RESOURCE_GROUP', 'TRI3D_ML')
+    return getattr(provider, 'region', None) or os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
+
+def record_state(inventory, action, target, provider=None):
+    """Update the indexed state of a target after a successful action"""
+    state = FINAL_STATES.get((action, target.provider_name))
+    if state is None:
+        return
+    try:
+        inventory.set_state(target.provider_name, resolve_location(target, provider), target.identifier, state)
+    except Exception as e:
+        logger.warning(f"Could not update the inventory for {target}: {e}")
+
+def open_inventory(selectors):
+    """The inventory to keep up to date: always with --select, otherwise only if an index exists"""
+    from inventory import DB_ENV, DEFAULT_DB, Inventory
+    if not selectors and not os.path.exists(os.getenv(DB_ENV, DEFAULT_DB)):
+        return None
+    return Inventory()
+
+def print_report(action, results, total_time):
+    """Print per-instance results and the total wall time"""
+    print("")
+    print(f"Batch {action} summary:")
+    for result in results:
+        state = 'OK' if result['ok'] else 'FAILED'
+        print(f"  {state:<7}{str(result['target']):<50}{result['elapsed']:>8.1f}s  {result['message']}")
+    succeeded = sum(1 for result in results if result['ok'])
+    print(f"{succeeded}/{len(results)} instances succeeded in {total_time:.1f}s total")
+
+def read_targets_file(path):
+    """Read target specs from a file, one per line"""
+    specs = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                specs.append(line)
+    return specs
+
+def select_targets(selectors, inventory):
+    """Targets for the indexed instances matching any of the selectors"""
+    if not selectors:
+        return []
+    targets = {}
+    for selector in selectors:
+        for instance in inventory.select(selector):
+            key = (instance['provider'], instance['location'], instance['identifier'])
+            targets.setdefault(key, Target(instance['identifier'], instance['provider'], instance['location']))
+    return list(targets.values())
+
+def main():
+    args = sys.argv[1:]
+
+    verbose = "--verbose" in args
+    configure_logging(verbose)
+    if verbose:
+        logger.debug(f"Running batch_server.py with arguments: {sys.argv}")
+        logger.debug(f"Current working directory: {os.getcwd()}")
+        args.remove("--verbose")
+
+    specs = []
+    selectors = []
+    max_workers = DEFAULT_MAX_WORKERS
+    timeout = 300
+    positional = []
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--file':
+                specs.extend(read_targets_file(args.pop(0)))
+            elif arg == '--select':
+                selectors.append(args.pop(0))
+            elif arg == '--max-workers':
+                max_workers = int(args.pop(0))
+            elif arg == '--timeout':
+                timeout = int(args.pop(0))
+            else:
+                positional.append(arg)
+    except (IndexError, ValueError, OSError) as e:
+        print(f"Invalid arguments: {e}")
+        print_usage()
+
+    if not positional or positional[0] not in ('start', 'stop'):
+        print_usage()
+    action = positional[0]
+    specs = positional[1:] + specs
+    if not specs and not selectors:
+        print_usage()
+
+    try:
+        inventory = open_inventory(selectors)
+        targets = [Target.parse(spec) for spec in specs]
+        targets.extend(select_targets(selectors, inventory))
+    except ValueError as ve:
+        print(f"ERROR: {ve}")
+        sys.exit(1)
+    if not targets:
+        print("No instances match the selectors; run inventory.py sync to refresh the index")
+        sys.exit(1)
+
+    if verbose:
+        for target in targets:
+            logger.debug(f"Target: {target}")
+
+    start_time = time.time()
+    try:
+        providers = build_providers(targets)
+        if verbose:
+            logger.debug(f"Initialized {len(providers)} provider client(s) for {len(targets)} target(s)")
+        results = run_batch(action, targets, providers, max_workers=max_workers, timeout=timeout, inventory=inventory)
+    except Exception as e:
+        print(f"Error running batch {action}: {e}")
+        if verbose:
+            import traceback
+            logger.debug(f"Exception traceback: {traceback.format_exc()}")
+        sys.exit(1)
+
+    print_report(action, results, time.time() - start_time)
+    sys.exit(0 if all(result['ok'] for result in results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,72 @@
 import os
 import time
 import sys
+import logging
+import threading
 from abc import ABC, abstractmethod
 from dotenv import load_dotenv
 load_dotenv()
 
+from readiness import SETTLE_SECONDS, Backoff, CloudStateProbe, service_probes, wait_until_ready
+from instrumentation import instrument, record_readiness, record_start_requested
+from governor import get_governor
+
+logger = logging.getLogger(__name__)
+
+# EC2 accepts up to 1000 instance IDs per DescribeInstances/StartInstances/StopInstances call
+AWS_MAX_INSTANCE_IDS_PER_CALL = 1000
+
+# Seconds a looked-up power state is reused before the API is asked again
+STATUS_CACHE_TTL = float(os.getenv('CLOUD_STATUS_CACHE_TTL', '5'))
+
+def readiness_fields(provider, instance_id, result):
+    """Structured log fields describing a readiness.ReadinessResult"""
+    return {'fields': {'provider': provider, 'instance': instance_id, 'ready': result.ready,
+                       'phases': result.phase_durations(), 'failed_phase': result.failed_phase,
+                       'elapsed': result.elapsed}}
+
+def _chunked(items, size):
+    """Yield successive lists of at most size items"""
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+class StatusCache:
+    """Short-TTL cache of instance power states, shared by a provider's methods
+    
+    Removes the duplicate lookups made by a CLI check followed by
+    start_instance's own check, and lets bulk listings answer later
+    per-instance lookups.
+    """
+    
+    def __init__(self, ttl=STATUS_CACHE_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def lookup(self, key, max_age=None):
+        """Return (True, state) for a fresh entry, (False, None) otherwise"""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or (self.clock() - entry[1]) > max_age:
+            return False, None
+        return True, entry[0]
+    
+    def set(self, key, state):
+        with self._lock:
+            self._entries[key] = (state, self.clock())
+    
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
 class CloudProvider(ABC):
     """Base class for cloud providers"""
     
+    # Label used in logs and metrics
+    provider_name = None
+    
     @abstractmethod
     def start_instance(self, instance_id, **kwargs):
         """Start an instance"""
@@ -20,18 +79,40 @@ class CloudProvider(ABC):
     
     @abstractmethod
     def check_instance_status(self, instance_id, **kwargs):
-        """Check the status of an instance"""
+        """Check the status of an instance; max_age=0 bypasses any status cache"""
         pass
     
     @abstractmethod
     def wait_for_running_status(self, instance_id, **kwargs):
         """Wait for the instance to be in running state"""
         pass
+    
+    # States from which an instance will not reach running without intervention
+    running_failure_states = ()
+    
+    def wait_for_ready(self, instance_id, timeout=300, host=None, training=False, probes=None,
+                       settle=SETTLE_SECONDS, **kwargs):
+        """Wait until the instance is running and, if host is given, ComfyUI answers
+        
+        Probes run in order: cloud power state, then TCP/HTTP checks against
+        host, then any extra probes. With neither host nor probes, waits
+        settle seconds after running instead. Returns a
+        readiness.ReadinessResult with the time-to-ready of each phase.
+        """
+        phases = [CloudStateProbe(self, instance_id, 'running', failure_states=self.running_failure_states, **kwargs)]
+        phases.extend(service_probes(host, training, probes, settle))
+        wait_started = time.time()
+        result = wait_until_ready(phases, timeout=timeout)
+        record_readiness(self.provider_name, instance_id, result, wait_started)
+        return result
 
+@instrument('azure')
 class AzureProvider(CloudProvider):
     """Azure cloud provider implementation"""
     
-    def __init__(self):
+    provider_name = 'azure'
+    
+    def __init__(self, resource_group=None):
         from azure.identity import ClientSecretCredential
         from azure.mgmt.compute import ComputeManagementClient
         
@@ -40,74 +121,162 @@ class AzureProvider(CloudProvider):
         self.tenant_id = os.getenv('AZURE_TENANT_ID')
         self.secret = os.getenv('AZURE_CLIENT_SECRET')
         self.subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
-        self.default_resource_group = os.getenv('AZURE_RESOURCE_GROUP', 'TRI3D_ML')
+        self.default_resource_group = resource_group or os.getenv('AZURE_RESOURCE_GROUP', 'TRI3D_ML')
+        self.status_cache = StatusCache()
         
-        print(f"[AZURE DEBUG] Initializing Azure provider with resource group: {self.default_resource_group}")
-        print(f"[AZURE DEBUG] Client ID present: {bool(self.client_id)}")
-        print(f"[AZURE DEBUG] Tenant ID present: {bool(self.tenant_id)}")
-        print(f"[AZURE DEBUG] Secret present: {bool(self.secret)}")
-        print(f"[AZURE DEBUG] Subscription ID present: {bool(self.subscription_id)}")
+        logger.debug(f"Initializing Azure provider with resource group: {self.default_resource_group}")
+        logger.debug(f"Client ID present: {bool(self.client_id)}")
+        logger.debug(f"Tenant ID present: {bool(self.tenant_id)}")
+        logger.debug(f"Secret present: {bool(self.secret)}")
+        logger.debug(f"Subscription ID present: {bool(self.subscription_id)}")
         
         # Initialize Azure client
         try:
             self.credential = ClientSecretCredential(self.tenant_id, self.client_id, self.secret)
-            self.compute_client = ComputeManagementClient(self.credential, self.subscription_id)
-            print(f"[AZURE DEBUG] Successfully initialized Azure compute client")
+            # Retries are left to the governor, shared by every client of the subscription
+            self.compute_client = ComputeManagementClient(self.credential, self.subscription_id, retry_total=0)
+            self.governor = get_governor('azure', self.subscription_id)
+            logger.debug("Successfully initialized Azure compute client")
         except Exception as e:
-            print(f"[AZURE DEBUG] Error initializing Azure client: {e}")
+            logger.error(f"Error initializing Azure client: {e}")
             raise
     
-    def check_instance_status(self, instance_id, resource_group=None, **kwargs):
-        """Check the status of an Azure VM"""
+    @staticmethod
+    def _cache_key(resource_group, instance_id):
+        # Azure resource group and VM names are case-insensitive
+        return (resource_group.lower(), instance_id.lower())
+    
+    @staticmethod
+    def _power_state(instance_view):
+        """Extract the power state from a VM instance view"""
+        for status in (instance_view.statuses or []) if instance_view else []:
+            if status.code.startswith('PowerState/'):
+                return status.code.split('/')[-1]
+        return None
+    
+    def check_instance_status(self, instance_id, resource_group=None, max_age=None, **kwargs):
+        """Check the status of an Azure VM
+        
+        Answers from the status cache when the state was looked up less than
+        max_age seconds ago (default: the cache TTL; 0 forces a fresh call).
+        """
         resource_group = resource_group or self.default_resource_group
-        print(f"[AZURE DEBUG] Checking status of VM {instance_id} in resource group {resource_group}")
+        cache_key = self._cache_key(resource_group, instance_id)
+        hit, power_state = self.status_cache.lookup(cache_key, max_age)
+        if hit:
+            logger.debug(f"VM {instance_id} power state (cached): {power_state}")
+            return power_state
+        
+        logger.debug(f"Checking status of VM {instance_id} in resource group {resource_group}")
         try:
-            vm_instance_view = self.compute_client.virtual_machines.get(
+            vm_instance_view = self.governor.call(
+                'get',
+                self.compute_client.virtual_machines.get,
                 resource_group, 
                 instance_id, 
                 expand='instanceView'
             )
-            statuses = vm_instance_view.instance_view.statuses
-            for status in statuses:
-                if status.code.startswith('PowerState/'):
-                    power_state = status.code.split('/')[-1]
-                    print(f"[AZURE DEBUG] VM {instance_id} power state: {power_state}")
-                    return power_state
-            print(f"[AZURE DEBUG] No power state found for VM {instance_id}")
-            return None
+            power_state = self._power_state(vm_instance_view.instance_view)
+            if power_state is None:
+                logger.debug(f"No power state found for VM {instance_id}")
+            else:
+                logger.debug(f"VM {instance_id} power state: {power_state}")
+            self.status_cache.set(cache_key, power_state)
+            return power_state
         except Exception as e:
-            print(f"[AZURE DEBUG] Error checking VM status: {e}")
+            logger.debug(f"Error checking VM status: {e}")
             raise
     
+    def list_instance_statuses(self, resource_group=None):
+        """Return {vm name: power state} for every VM in a resource group
+        
+        Fetches all instance views in one paged list call instead of a GET
+        per VM, and primes the status cache with the results.
+        """
+        resource_group = resource_group or self.default_resource_group
+        logger.debug(f"Listing VM power states in resource group {resource_group}")
+        statuses = {}
+        vms = self.governor.call(
+            'list', lambda: list(self.compute_client.virtual_machines.list(resource_group, expand='instanceView')))
+        for vm in vms:
+            power_state = self._power_state(vm.instance_view)
+            statuses[vm.name] = power_state
+            self.status_cache.set(self._cache_key(resource_group, vm.name), power_state)
+        return statuses
+    
+    def list_instances(self, resource_group=None, **kwargs):
+        """Return name, size, location, tags and power state of every VM in a resource group
+        
+        Used by the inventory; primes the status cache like list_instance_statuses.
+        """
+        resource_group = resource_group or self.default_resource_group
+        logger.debug(f"Listing VMs in resource group {resource_group}")
+        instances = []
+        vms = self.governor.call(
+            'list', lambda: list(self.compute_client.virtual_machines.list(resource_group, expand='instanceView')))
+        for vm in vms:
+            power_state = self._power_state(vm.instance_view)
+            self.status_cache.set(self._cache_key(resource_group, vm.name), power_state)
+            instances.append({
+                'identifier': vm.name,
+                'location': resource_group,
+                'region': vm.location,
+                'size': vm.hardware_profile.vm_size if vm.hardware_profile else None,
+                'state': power_state,
+                'tags': dict(vm.tags or {}),
+            })
+        return instances
+    
+    def list_all_instance_statuses(self):
+        """Return {(resource group, vm name): power state} for every VM in the subscription
+        
+        Uses list_all with statusOnly=true, which returns only the run-time
+        status of each VM, and primes the status cache with the results.
+        """
+        logger.debug("Listing VM power states in subscription")
+        statuses = {}
+        vms = self.governor.call('list_all', lambda: list(self.compute_client.virtual_machines.list_all(status_only='true')))
+        for vm in vms:
+            # /subscriptions/<id>/resourceGroups/<group>/providers/Microsoft.Compute/virtualMachines/<name>
+            resource_group = vm.id.split('/')[4]
+            power_state = self._power_state(vm.instance_view)
+            statuses[(resource_group, vm.name)] = power_state
+            self.status_cache.set(self._cache_key(resource_group, vm.name), power_state)
+        return statuses
+    
     def start_instance(self, instance_id, resource_group=None, **kwargs):
         """Start an Azure VM"""
         resource_group = resource_group or self.default_resource_group
-        print(f"[AZURE DEBUG] Starting instance {instance_id} in resource group {resource_group}")
+        logger.debug(f"Starting instance {instance_id} in resource group {resource_group}")
         
         try:
             vm_status = self.check_instance_status(instance_id, resource_group)
-            print(f"[AZURE DEBUG] Current VM status before starting: {vm_status}")
+            logger.debug(f"Current VM status before starting: {vm_status}")
             
             if vm_status in ['deallocated', 'stopped', 'failed']:
-                print(f"[AZURE DEBUG] Starting Azure VM: {instance_id}")
-                async_vm_start = self.compute_client.virtual_machines.begin_start(resource_group, instance_id)
-                print(f"[AZURE DEBUG] Begin_start operation initiated, waiting for completion...")
-                async_vm_start.wait()
-                print(f"[AZURE DEBUG] Azure VM {instance_id} started successfully")
+                logger.info(f"Starting Azure VM: {instance_id}")
+                record_start_requested('azure', instance_id)
+                # Starting a VM that is already starting is harmless, so the whole operation is retried
+                self.governor.call(
+                    'start',
+                    lambda: self.compute_client.virtual_machines.begin_start(resource_group, instance_id).wait(),
+                    kind='write')
+                self.status_cache.invalidate(self._cache_key(resource_group, instance_id))
+                logger.info(f"Azure VM {instance_id} started successfully")
                 return True
             elif vm_status == 'running':
-                print(f"[AZURE DEBUG] Azure VM {instance_id} is already running.")
+                logger.info(f"Azure VM {instance_id} is already running.")
                 return True
             elif vm_status == 'stopping':
                 error_message = f"Azure VM {instance_id} is currently stopping. Please wait for it to fully stop before starting."
-                print(f"[AZURE DEBUG] {error_message}")
+                logger.warning(error_message)
                 raise ValueError(error_message)
             else:
                 error_message = f"Azure VM {instance_id} is in a state that cannot be started: {vm_status}"
-                print(f"[AZURE DEBUG] {error_message}")
+                logger.warning(error_message)
                 raise ValueError(error_message)
         except Exception as e:
-            print(f"[AZURE DEBUG] Error in start_instance: {e}")
+            logger.debug(f"Error in start_instance: {e}")
             raise
     
     def stop_instance(self, instance_id, resource_group=None, **kwargs):
@@ -116,177 +285,362 @@ class AzureProvider(CloudProvider):
         vm_status = self.check_instance_status(instance_id, resource_group)
         
         if vm_status == 'running':
-            print(f"Deallocating Azure VM: {instance_id}")
-            async_vm_stop = self.compute_client.virtual_machines.begin_deallocate(resource_group, instance_id)
-            async_vm_stop.wait()
-            print(f"Azure VM {instance_id} deallocated.")
+            logger.info(f"Deallocating Azure VM: {instance_id}")
+            self.governor.call(
+                'deallocate',
+                lambda: self.compute_client.virtual_machines.begin_deallocate(resource_group, instance_id).wait(),
+                kind='write')
+            self.status_cache.invalidate(self._cache_key(resource_group, instance_id))
+            logger.info(f"Azure VM {instance_id} deallocated.")
             return True
         else:
-            print(f"Azure VM {instance_id} is not in running state. Current state: {vm_status}")
+            logger.info(f"Azure VM {instance_id} is not in running state. Current state: {vm_status}")
             return False
     
     def wait_for_running_status(self, instance_id, resource_group=None, timeout=300, **kwargs):
-        """Wait for the Azure VM to be in running state"""
+        """Wait for the Azure VM to be in running state
+        
+        Pass host='<ip or domain>' to also wait for ComfyUI to answer.
+        """
         resource_group = resource_group or self.default_resource_group
-        print(f"[AZURE DEBUG] Waiting for VM {instance_id} to reach running state (timeout: {timeout}s)")
+        logger.info(f"Waiting for VM {instance_id} to reach running state (timeout: {timeout}s)")
         
-        start_time = time.time()
-        while (time.time() - start_time) < timeout:
-            try:
-                status = self.check_instance_status(instance_id, resource_group)
-                print(f"[AZURE DEBUG] Current status while waiting: {status}, elapsed time: {time.time() - start_time:.1f}s")
-                
-                if status == 'running':
-                    print(f"[AZURE DEBUG] VM {instance_id} is now running")
-                    # Give the VM a moment to initialize services
-                    wait_time = 15
-                    print(f"[AZURE DEBUG] Waiting {wait_time}s for services to initialize...")
-                    time.sleep(wait_time)
-                    print(f"[AZURE DEBUG] VM {instance_id} should be ready for connections now")
-                    return True
-                print(f"[AZURE DEBUG] Waiting for Azure VM {instance_id} to start (Current status: {status})...")
-                time.sleep(10)
-            except Exception as e:
-                print(f"[AZURE DEBUG] Error checking status while waiting: {e}")
-                time.sleep(10)
+        result = self.wait_for_ready(instance_id, timeout=timeout, resource_group=resource_group, **kwargs)
+        if result.ready:
+            logger.info(f"VM {instance_id} is ready: {result.summary()}", extra=readiness_fields('azure', instance_id, result))
+            return True
         
-        print(f"[AZURE DEBUG] Timeout waiting for Azure VM {instance_id} to start")
+        if result.error:
+            logger.warning(f"Last error while waiting: {result.error}")
+        logger.warning(f"Timeout waiting for Azure VM {instance_id} to start: {result.summary()}",
+                       extra=readiness_fields('azure', instance_id, result))
         return False
 
+@instrument('aws')
 class AWSProvider(CloudProvider):
     """AWS cloud provider implementation"""
     
-    def __init__(self):
-        import boto3
-        
+    provider_name = 'aws'
+    
+    running_failure_states = ('shutting-down', 'terminated', 'stopping')
+    
+    def __init__(self, region=None, profile=None):
         # Load AWS credentials from environment variables
         # AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY are automatically loaded by boto3
-        self.region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
+        self.region = region or os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
+        self.profile = profile or os.getenv('AWS_PROFILE')
+        
+        # Sessions (one per profile) and clients (one per profile/region) are
+        # created lazily and reused, so credentials are resolved only once
+        self._sessions = {}
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self.status_cache = StatusCache()
         
         # Initialize AWS client
-        self.ec2 = boto3.resource('ec2', region_name=self.region)
-        self.ec2_client = boto3.client('ec2', region_name=self.region)
+        self.ec2_client = self._ec2_client()
+        self.ec2 = self._session(self.profile).resource('ec2', region_name=self.region)
     
-    def check_instance_status(self, instance_id, region=None, **kwargs):
-        """Check the status of an AWS EC2 instance"""
-        if region and region != self.region:
-            # Create a client for the specified region
-            import boto3
-            ec2_client = boto3.client('ec2', region_name=region)
-            response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        else:
-            response = self.ec2_client.describe_instances(InstanceIds=[instance_id])
+    def check_instance_status(self, instance_id, region=None, max_age=None, **kwargs):
+        """Check the status of an AWS EC2 instance
+        
+        Answers from the status cache when the state was looked up less than
+        max_age seconds ago (default: the cache TTL; 0 forces a fresh call).
+        """
+        cache_key = (region or self.region, instance_id)
+        hit, state = self.status_cache.lookup(cache_key, max_age)
+        if hit:
+            return state
+        
+        response = self._governor(region).call(
+            'describe_instances', self._ec2_client(region).describe_instances, InstanceIds=[instance_id])
         
         # Extract instance state
         try:
             state = response['Reservations'][0]['Instances'][0]['State']['Name']
+            self.status_cache.set(cache_key, state)
             return state
         except (IndexError, KeyError):
-            print(f"Error retrieving status for AWS instance {instance_id}")
+            logger.error(f"Error retrieving status for AWS instance {instance_id}")
             return None
     
     def start_instance(self, instance_id, region=None, **kwargs):
         """Start an AWS EC2 instance"""
-        if region and region != self.region:
-            # Create a client for the specified region
-            import boto3
-            ec2_client = boto3.client('ec2', region_name=region)
-            instance_status = self.check_instance_status(instance_id, region)
-        else:
-            ec2_client = self.ec2_client
-            instance_status = self.check_instance_status(instance_id)
+        ec2_client = self._ec2_client(region)
+        instance_status = self.check_instance_status(instance_id, region)
         
         if instance_status == 'stopped':
-            print(f"Starting AWS instance: {instance_id}")
-            response = ec2_client.start_instances(InstanceIds=[instance_id])
-            print(f"AWS instance {instance_id} starting...")
+            logger.info(f"Starting AWS instance: {instance_id}")
+            record_start_requested('aws', instance_id)
+            response = self._governor(region).call(
+                'start_instances', ec2_client.start_instances, InstanceIds=[instance_id], kind='write')
+            self.status_cache.invalidate((region or self.region, instance_id))
+            logger.info(f"AWS instance {instance_id} starting...")
             return True
         elif instance_status == 'running':
-            print(f"AWS instance {instance_id} is already running.")
+            logger.info(f"AWS instance {instance_id} is already running.")
             return True
         elif instance_status == 'stopping':
             error_message = f"AWS instance {instance_id} is currently stopping. Please wait for it to fully stop before starting."
-            print(error_message)
+            logger.warning(error_message)
             raise ValueError(error_message)
         else:
             error_message = f"AWS instance {instance_id} is in a state that cannot be started: {instance_status}"
-            print(error_message)
+            logger.warning(error_message)
             raise ValueError(error_message)
     
     def stop_instance(self, instance_id, region=None, **kwargs):
         """Stop an AWS EC2 instance"""
-        if region and region != self.region:
-            # Create a client for the specified region
-            import boto3
-            ec2_client = boto3.client('ec2', region_name=region)
-            instance_status = self.check_instance_status(instance_id, region)
-        else:
-            ec2_client = self.ec2_client
-            instance_status = self.check_instance_status(instance_id)
+        ec2_client = self._ec2_client(region)
+        instance_status = self.check_instance_status(instance_id, region)
         
         if instance_status == 'running':
-            print(f"Stopping AWS instance: {instance_id}")
-            response = ec2_client.stop_instances(InstanceIds=[instance_id])
-            print(f"AWS instance {instance_id} stopping...")
+            logger.info(f"Stopping AWS instance: {instance_id}")
+            response = self._governor(region).call(
+                'stop_instances', ec2_client.stop_instances, InstanceIds=[instance_id], kind='write')
+            self.status_cache.invalidate((region or self.region, instance_id))
+            logger.info(f"AWS instance {instance_id} stopping...")
             return True
         else:
-            print(f"AWS instance {instance_id} is not in running state. Current state: {instance_status}")
+            logger.info(f"AWS instance {instance_id} is not in running state. Current state: {instance_status}")
             return False
     
     def wait_for_running_status(self, instance_id, region=None, timeout=300, **kwargs):
-        """Wait for the AWS EC2 instance to be in running state"""
-        if region and region != self.region:
-            # Create a client for the specified region
-            import boto3
-            ec2_client = boto3.client('ec2', region_name=region)
-            waiter = ec2_client.get_waiter('instance_running')
-        else:
-            waiter = self.ec2_client.get_waiter('instance_running')
+        """Wait for the AWS EC2 instance to be in running state
         
-        try:
-            print(f"Waiting for AWS instance {instance_id} to be in running state...")
-            waiter.wait(
-                InstanceIds=[instance_id],
-                WaiterConfig={
-                    'Delay': 10,
-                    'MaxAttempts': timeout//10  # Convert timeout to number of attempts
-                }
-            )
-            print(f"AWS instance {instance_id} is now running")
-            # Give the instance some time to initialize services
-            time.sleep(15)
+        Pass host='<ip or domain>' to also wait for ComfyUI to answer.
+        """
+        logger.info(f"Waiting for AWS instance {instance_id} to be in running state...")
+        result = self.wait_for_ready(instance_id, timeout=timeout, region=region, **kwargs)
+        if result.ready:
+            logger.info(f"AWS instance {instance_id} is ready: {result.summary()}", extra=readiness_fields('aws', instance_id, result))
             return True
-        except Exception as e:
-            print(f"Error waiting for AWS instance {instance_id} to start: {e}")
-            return False
-            
+        logger.warning(f"Error waiting for AWS instance {instance_id} to start: {result.error or result.summary()}",
+                       extra=readiness_fields('aws', instance_id, result))
+        return False
+    
     def wait_for_stopped_status(self, instance_id, region=None, timeout=300, **kwargs):
         """Wait for the AWS EC2 instance to be in stopped state"""
-        if region and region != self.region:
-            # Create a client for the specified region
+        logger.info(f"Waiting for AWS instance {instance_id} to be fully stopped...")
+        probe = CloudStateProbe(self, instance_id, 'stopped', failure_states=('pending', 'terminated'), region=region)
+        result = wait_until_ready([probe], timeout=timeout)
+        if result.ready:
+            logger.info(f"AWS instance {instance_id} is now fully stopped ({result.elapsed:.1f}s)")
+            return True
+        logger.warning(f"Error waiting for AWS instance {instance_id} to stop: {result.error or result.summary()}")
+        return False
+    
+    def _session(self, profile=None):
+        """Return the boto3 session for a profile, creating it on first use
+        
+        Must be called with _clients_lock held or before the provider is
+        shared between threads; boto3 sessions are not thread-safe.
+        """
+        session = self._sessions.get(profile)
+        if session is None:
             import boto3
-            ec2_client = boto3.client('ec2', region_name=region)
-            waiter = ec2_client.get_waiter('instance_stopped')
-        else:
-            waiter = self.ec2_client.get_waiter('instance_stopped')
+            session = boto3.session.Session(profile_name=profile)
+            self._sessions[profile] = session
+        return session
+    
+    def _ec2_client(self, region=None, profile=None):
+        """Return the pooled EC2 client for a region/profile, creating it on first use"""
+        key = (profile or self.profile, region or self.region)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                from botocore.config import Config
+                # Retries are left to the governor, which also rate limits across clients
+                client = self._session(key[0]).client(
+                    'ec2', region_name=key[1], config=Config(retries={'total_max_attempts': 1}))
+                self._clients[key] = client
+            return client
+    
+    def _governor(self, region=None, profile=None):
+        """Return the governor shared by every client of an AWS account/region"""
+        return get_governor('aws', (profile or self.profile, region or self.region))
+    
+    def check_instances_status(self, instance_ids, region=None, **kwargs):
+        """Check the status of many AWS EC2 instances
         
+        Issues one DescribeInstances call per chunk of up to 1000 IDs and
+        returns a dict mapping each instance ID to its state name (None if
+        the instance was not returned). AWS rejects a whole call when one ID
+        does not exist, so such a chunk is bisected down to the unknown IDs,
+        which are logged and reported as None.
+        """
+        ec2_client = self._ec2_client(region)
+        states = {instance_id: None for instance_id in instance_ids}
+        unknown = []
+        for chunk in _chunked(list(states), AWS_MAX_INSTANCE_IDS_PER_CALL):
+            self._describe_states(ec2_client, region, chunk, states, unknown)
+        if unknown:
+            logger.warning(f"AWS instance(s) not found: {', '.join(unknown)}")
+        for instance_id, state in states.items():
+            if state is not None:
+                self.status_cache.set((region or self.region, instance_id), state)
+        return states
+    
+    def _describe_states(self, ec2_client, region, instance_ids, states, unknown):
+        """Fill states from DescribeInstances, splitting the IDs when some do not exist"""
+        from botocore.exceptions import ClientError
+        paginator = ec2_client.get_paginator('describe_instances')
         try:
-            print(f"Waiting for AWS instance {instance_id} to be fully stopped...")
-            waiter.wait(
-                InstanceIds=[instance_id],
-                WaiterConfig={
-                    'Delay': 10,
-                    'MaxAttempts': timeout//10  # Convert timeout to number of attempts
-                }
-            )
-            print(f"AWS instance {instance_id} is now fully stopped")
-            return True
-        except Exception as e:
-            print(f"Error waiting for AWS instance {instance_id} to stop: {e}")
-            return False
+            pages = self._governor(region).call('describe_instances',
+                                                lambda: list(paginator.paginate(InstanceIds=instance_ids)))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('InvalidInstanceID.NotFound', 'InvalidInstanceID.Malformed'):
+                raise
+            if len(instance_ids) == 1:
+                unknown.append(instance_ids[0])
+                return
+            middle = len(instance_ids) // 2
+            self._describe_states(ec2_client, region, instance_ids[:middle], states, unknown)
+            self._describe_states(ec2_client, region, instance_ids[middle:], states, unknown)
+            return
+        for page in pages:
+            for reservation in page.get('Reservations', []):
+                for instance in reservation.get('Instances', []):
+                    states[instance['InstanceId']] = instance['State']['Name']
 
-def get_cloud_provider(provider_name):
-    """Factory function to get the appropriate cloud provider"""
+    def list_instances(self, region=None, **kwargs):
+        """Return ID, type, tags and state of every EC2 instance in a region, for the inventory"""
+        region = region or self.region
+        ec2_client = self._ec2_client(region)
+        paginator = ec2_client.get_paginator('describe_instances')
+        pages = self._governor(region).call('describe_instances', lambda: list(paginator.paginate()))
+        instances = []
+        for page in pages:
+            for reservation in page.get('Reservations', []):
+                for instance in reservation.get('Instances', []):
+                    state = instance['State']['Name']
+                    if state == 'terminated':
+                        continue
+                    self.status_cache.set((region, instance['InstanceId']), state)
+                    instances.append({
+                        'identifier': instance['InstanceId'],
+                        'location': region,
+                        'region': region,
+                        'size': instance.get('InstanceType'),
+                        'state': state,
+                        'tags': {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])},
+                    })
+        return instances
+    
+    def start_instances(self, instance_ids, region=None, **kwargs):
+        """Start many AWS EC2 instances with as few StartInstances calls as possible
+        
+        Returns a dict mapping each instance ID to True if it was started or
+        is already running, False if it is in a state that cannot be started.
+        """
+        ec2_client = self._ec2_client(region)
+        states = self.check_instances_status(instance_ids, region)
+        
+        results = {}
+        to_start = []
+        for instance_id, state in states.items():
+            if state == 'stopped':
+                to_start.append(instance_id)
+            elif state == 'running':
+                logger.info(f"AWS instance {instance_id} is already running.")
+                results[instance_id] = True
+            else:
+                logger.warning(f"AWS instance {instance_id} is in a state that cannot be started: {state}")
+                results[instance_id] = False
+        
+        for chunk in _chunked(to_start, AWS_MAX_INSTANCE_IDS_PER_CALL):
+            logger.info(f"Starting {len(chunk)} AWS instance(s): {', '.join(chunk)}")
+            self._governor(region).call('start_instances', ec2_client.start_instances, InstanceIds=chunk, kind='write')
+            for instance_id in chunk:
+                record_start_requested('aws', instance_id)
+                self.status_cache.invalidate((region or self.region, instance_id))
+                results[instance_id] = True
+        return results
+    
+    def stop_instances(self, instance_ids, region=None, **kwargs):
+        """Stop many AWS EC2 instances with as few StopInstances calls as possible
+        
+        Returns a dict mapping each instance ID to True if a stop was issued,
+        False if the instance was not running.
+        """
+        ec2_client = self._ec2_client(region)
+        states = self.check_instances_status(instance_ids, region)
+        
+        results = {}
+        to_stop = []
+        for instance_id, state in states.items():
+            if state == 'running':
+                to_stop.append(instance_id)
+            else:
+                logger.info(f"AWS instance {instance_id} is not in running state. Current state: {state}")
+                results[instance_id] = False
+        
+        for chunk in _chunked(to_stop, AWS_MAX_INSTANCE_IDS_PER_CALL):
+            logger.info(f"Stopping {len(chunk)} AWS instance(s): {', '.join(chunk)}")
+            self._governor(region).call('stop_instances', ec2_client.stop_instances, InstanceIds=chunk, kind='write')
+            for instance_id in chunk:
+                self.status_cache.invalidate((region or self.region, instance_id))
+                results[instance_id] = True
+        return results
+    
+    def wait_for_instances_state(self, instance_ids, target_state, region=None, timeout=300, max_delay=10, **kwargs):
+        """Wait for many AWS EC2 instances to reach target_state
+        
+        Polls the whole set with one DescribeInstances per chunk per tick,
+        dropping instances from the poll set once they arrive. The poll delay
+        backs off from 1s up to max_delay. Returns a dict mapping each
+        instance ID to True if it reached target_state.
+        """
+        # States from which target_state can no longer be reached
+        failure_states = {
+            'running': {'shutting-down', 'terminated', 'stopping'},
+            'stopped': {'pending', 'shutting-down', 'terminated'},
+        }.get(target_state, {'terminated'})
+        
+        pending = set(instance_ids)
+        results = {instance_id: False for instance_id in instance_ids}
+        backoff = Backoff(max_delay=max_delay)
+        start_time = time.time()
+        while pending:
+            try:
+                states = self.check_instances_status(sorted(pending), region)
+            except Exception as e:
+                logger.warning(f"Error checking AWS instance states while waiting: {e}")
+                states = {}
+            for instance_id, state in states.items():
+                if state == target_state:
+                    results[instance_id] = True
+                    pending.discard(instance_id)
+                elif state in failure_states:
+                    logger.warning(f"AWS instance {instance_id} entered state {state} while waiting for {target_state}")
+                    pending.discard(instance_id)
+            if not pending:
+                break
+            if (time.time() - start_time) >= timeout:
+                logger.warning(f"Timeout waiting for AWS instances to reach {target_state}: {', '.join(sorted(pending))}")
+                break
+            logger.info(f"Waiting for {len(pending)} AWS instance(s) to reach {target_state}...")
+            time.sleep(min(backoff.next(), max(0, timeout - (time.time() - start_time))))
+        return results
+    
+    def wait_for_instances_running(self, instance_ids, region=None, timeout=300, **kwargs):
+        """Wait for many AWS EC2 instances to be in running state"""
+        return self.wait_for_instances_state(instance_ids, 'running', region, timeout)
+    
+    def wait_for_instances_stopped(self, instance_ids, region=None, timeout=300, **kwargs):
+        """Wait for many AWS EC2 instances to be in stopped state"""
+        return self.wait_for_instances_state(instance_ids, 'stopped', region, timeout)
+
+def get_cloud_provider(provider_name, **kwargs):
+    """Factory function to get the appropriate cloud provider
+    
+    Extra keyword arguments are passed to the provider constructor, e.g.
+    region='us-west-2' for AWS or resource_group='TRI3D_ML' for Azure.
+    Set CLOUD_PROVIDER_BACKEND=async to use async_cloud_providers instead.
+    """
     providers = {
         'azure': AzureProvider,
         'aws': AWSProvider
@@ -295,4 +649,9 @@ def get_cloud_provider(provider_name):
     if provider_name.lower() not in providers:
         raise ValueError(f"Unsupported cloud provider: {provider_name}")
     
-    return providers[provider_name.lower()]() 
\ No newline at end of file
+    # CLOUD_PROVIDER_BACKEND=async runs the asyncio providers behind a blocking facade
+    if os.getenv('CLOUD_PROVIDER_BACKEND', 'sync').lower() == 'async':
+        from async_cloud_providers import SyncCloudProvider, get_async_cloud_provider
+        return SyncCloudProvider(get_async_cloud_provider(provider_name, **kwargs))
+    
+    return providers[provider_name.lower()](**kwargs)
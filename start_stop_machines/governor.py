@@ -0,0 +1,227 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+
+from instrumentation import is_throttle, record_retry, record_throttle
+
+logger = logging.getLogger(__name__)
+
+# Sustained requests per second and burst size per provider account/region.
+# Below the published limits (EC2: 20/s describe, 5/s mutating; ARM: 25/s per
+# subscription) so that other tools sharing the account keep some headroom.
+DEFAULT_LIMITS = {
+    ('aws', 'read'): (15.0, 100),
+    ('aws', 'write'): (4.0, 50),
+    ('azure', 'read'): (15.0, 200),
+    ('azure', 'write'): (4.0, 50),
+}
+
+# Error codes and exception names worth retrying besides throttling
+TRANSIENT_CODES = {'InternalError', 'InternalFailure', 'ServiceUnavailable', 'Unavailable', 'RequestTimeout',
+                   'RequestTimeoutException', 'RetryableError'}
+TRANSIENT_EXCEPTIONS = {'EndpointConnectionError', 'ConnectionClosedError', 'ReadTimeoutError',
+                        'ConnectTimeoutError', 'ServiceRequestError', 'ServiceResponseError'}
+
+THROTTLE = 'throttle'
+TRANSIENT = 'transient'
+FATAL = 'fatal'
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while a provider scope keeps failing"""
+
+def classify(error):
+    """Return THROTTLE, TRANSIENT or FATAL for an exception raised by a provider SDK"""
+    if is_throttle(error):
+        return THROTTLE
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        # botocore ClientError
+        error_info = response.get('Error', {})
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        if error_info.get('Code') in TRANSIENT_CODES or status >= 500:
+            return TRANSIENT
+        return FATAL
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        # azure.core HttpResponseError
+        return TRANSIENT if status >= 500 or status == 408 else FATAL
+    if type(error).__name__ in TRANSIENT_EXCEPTIONS or isinstance(error, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+    return FATAL
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said so"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is None and isinstance(response, dict):
+        headers = response.get('ResponseMetadata', {}).get('HTTPHeaders')
+    if not headers:
+        return None
+    try:
+        return float(headers.get('Retry-After') or headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """Token bucket that hands out reservations, so waiting happens outside the lock"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returning the seconds to wait before using it"""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive retryable failures
+
+    While open, calls fail fast with CircuitOpenError. After reset_timeout
+    one trial call is let through; its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, failure_threshold=8, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.clock() - self.opened_at >= self.reset_timeout else 'open'
+
+    def before_call(self, name):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self.trial_running):
+                remaining = self.reset_timeout - (self.clock() - self.opened_at)
+                raise CircuitOpenError(f"{name}: too many failing API calls, retrying in {max(0, remaining):.0f}s")
+            if state == 'half-open':
+                self.trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+    def record_fatal(self):
+        # The API answered; a bad request says nothing about its health
+        with self._lock:
+            self.trial_running = False
+
+class Governor:
+    """Rate limits, retries and circuit-breaks the API calls of one provider account/region
+
+    Every provider instance for the same scope shares one Governor (see
+    get_governor), so concurrent operations draw from the same token
+    buckets and back off together.
+    """
+
+    def __init__(self, provider, scope=None, limits=None, max_attempts=5, base_delay=0.5, max_delay=20.0,
+                 breaker=None, clock=time.monotonic, sleep=time.sleep, rng=random.random):
+        self.provider = provider
+        self.scope = scope
+        limits = limits or {kind: DEFAULT_LIMITS[(provider, kind)] for kind in ('read', 'write')}
+        self.buckets = {kind: TokenBucket(rate, burst, clock) for kind, (rate, burst) in limits.items()}
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.sleep = sleep
+        self.rng = rng
+
+    def backoff(self, attempt, error):
+        """Full-jitter exponential delay, at least what the server asked for"""
+        delay = self.rng() * min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        requested = retry_after(error)
+        return max(delay, min(requested, self.max_delay)) if requested else delay
+
+    def _failed(self, operation, attempt, error):
+        """Record a failed attempt, returning the delay before retrying or None to give up"""
+        kind = classify(error)
+        if kind == FATAL:
+            self.breaker.record_fatal()
+            return None
+        self.breaker.record_failure()
+        if kind == THROTTLE:
+            record_throttle(self.provider, operation)
+        if attempt >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt, error)
+        record_retry(self.provider, operation, kind)
+        logger.debug(f"{self.provider} {operation} failed ({kind}: {error}), retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s")
+        return delay
+
+    def call(self, operation, fn, *args, kind='read', **kwargs):
+        """Call fn(*args, **kwargs) within the rate limit, retrying retryable errors"""
+        name = f"{self.provider} {operation}"
+        for attempt in range(1, self.max_attempts + 1):
+            self.breaker.before_call(name)
+            delay = self.buckets[kind].reserve()
+            if delay:
+                self.sleep(delay)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._failed(operation, attempt, e)
+                if delay is None:
+                    raise
+                self.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, operation, fn, *args, kind='read', **kwargs):
+        """Async variant of call for coroutine functions"""
+        name = f"{self.provider} {operation}"
+        for attempt in range(1, self.max_attempts + 1):
+            self.breaker.before_call(name)
+            delay = self.buckets[kind].reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._failed(operation, attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def get_governor(provider, scope=None):
+    """Return the process-wide Governor for a provider account/region"""
+    key = (provider, scope)
+    with _governors_lock:
+        governor = _governors.get(key)
+        if governor is None:
+            governor = _governors[key] = Governor(provider, scope)
+        return governor
@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import inspect
+import functools
+import threading
+
+# CLOUD_METRICS=prometheus:/path/cloud.prom writes Prometheus text format (e.g. for the
+# node_exporter textfile collector) at exit and at most every FLUSH_INTERVAL seconds;
+# CLOUD_METRICS=jsonl:/path/cloud-metrics.jsonl appends one JSON line per observation.
+# Unset, providers are not wrapped at all.
+METRICS_ENV = 'CLOUD_METRICS'
+FLUSH_INTERVAL = 10.0
+
+# CLOUD_LOG_LEVEL (DEBUG, INFO, ...) and CLOUD_LOG_FORMAT (text or json) configure the CLIs' logging
+LOG_LEVEL_ENV = 'CLOUD_LOG_LEVEL'
+LOG_FORMAT_ENV = 'CLOUD_LOG_FORMAT'
+
+# Seconds; covers single API calls as well as multi-minute waits for boot
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Error codes providers use to signal throttling
+THROTTLE_CODES = {'RequestLimitExceeded', 'Throttling', 'ThrottlingException', 'TooManyRequests',
+                  'TooManyRequestsException', 'SlowDown'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any fields passed as extra={'fields': {...}}"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging(verbose=False, stream=None):
+    """Set up logging for the CLIs
+
+    Text output is just the message, so the CLIs read as before; --verbose
+    (or CLOUD_LOG_LEVEL=DEBUG) adds the provider debug messages.
+    """
+    level = os.getenv(LOG_LEVEL_ENV, 'DEBUG' if verbose else 'INFO').upper()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if os.getenv(LOG_FORMAT_ENV, 'text').lower() == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(message)s'))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    # Keep SDK HTTP traces out of --verbose
+    for name in ('azure', 'urllib3', 'botocore', 'boto3'):
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in items) + '}'
+
+class Metrics:
+    """Counters, gauges and histograms with a Prometheus text or JSON-lines sink"""
+
+    def __init__(self, prometheus_path=None, jsonl_path=None, clock=time.time):
+        self.prometheus_path = prometheus_path
+        self.jsonl_path = jsonl_path
+        self.clock = clock
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def _emit(self, kind, name, labels, value):
+        if self.jsonl_path:
+            line = json.dumps({'time': self.clock(), 'type': kind, 'metric': name, 'labels': labels, 'value': value})
+            with open(self.jsonl_path, 'a') as f:
+                f.write(line + '\n')
+        if self.prometheus_path and self.clock() - self._last_flush >= FLUSH_INTERVAL:
+            self.write_prometheus()
+
+    def inc(self, name, labels, amount=1, help=None):
+        with self._lock:
+            key = (name, _label_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self.help.setdefault(name, help)
+        self._emit('counter', name, labels, amount)
+
+    def set(self, name, labels, value, help=None):
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+            self.help.setdefault(name, help)
+        self._emit('gauge', name, labels, value)
+
+    def get(self, name, labels):
+        """Current value of a gauge, or None"""
+        with self._lock:
+            return self.gauges.get((name, _label_key(labels)))
+
+    def observe(self, name, labels, value, help=None, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            key = (name, _label_key(labels))
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+            self.help.setdefault(name, help)
+        self._emit('histogram', name, labels, value)
+
+    def render_prometheus(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for kind, series in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in series}):
+                    if self.help.get(name):
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name == name:
+                            lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                if self.help.get(name):
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for (series_name, labels), histogram in sorted(self.histograms.items()):
+                    if series_name != name:
+                        continue
+                    for bound, count in zip(histogram['buckets'], histogram['counts']):
+                        lines.append(f"{name}_bucket{_format_labels(labels, {'le': bound})} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self):
+        if not self.prometheus_path:
+            return
+        self._last_flush = self.clock()
+        tmp = f"{self.prometheus_path}.tmp-{os.getpid()}"
+        with open(tmp, 'w') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, self.prometheus_path)
+
+def metrics_from_env():
+    """Build the Metrics configured by CLOUD_METRICS, or None"""
+    spec = os.getenv(METRICS_ENV)
+    if not spec:
+        return None
+    kind, _, path = spec.partition(':')
+    if kind == 'prometheus' and path:
+        metrics = Metrics(prometheus_path=path)
+        atexit.register(metrics.write_prometheus)
+        return metrics
+    if kind == 'jsonl' and path:
+        return Metrics(jsonl_path=path)
+    logging.getLogger(__name__).warning(f"Ignoring {METRICS_ENV}={spec}, expected prometheus:PATH or jsonl:PATH")
+    return None
+
+# The process-wide registry; None when metrics are disabled
+METRICS = metrics_from_env()
+
+def is_throttle(error):
+    """Whether an exception is the provider telling us to slow down"""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        # botocore ClientError
+        code = response.get('Error', {}).get('Code')
+        return code in THROTTLE_CODES
+    # azure.core HttpResponseError
+    return getattr(error, 'status_code', None) == 429
+
+def record_retry(provider, operation, reason):
+    if METRICS:
+        METRICS.inc('cloud_api_retries_total', {'provider': provider, 'operation': operation, 'reason': reason},
+                    help='Provider API calls retried')
+
+def record_throttle(provider, operation):
+    if METRICS:
+        METRICS.inc('cloud_api_throttles_total', {'provider': provider, 'operation': operation},
+                    help='Provider API calls rejected with a throttling error')
+
+def record_start_requested(provider, instance_id):
+    """Remember when a start was requested, for the boot-to-running duration"""
+    if METRICS:
+        METRICS.set('cloud_instance_start_requested_timestamp_seconds', {'provider': provider, 'instance': instance_id},
+                    METRICS.clock(), help='Time of the last start request for an instance')
+
+def record_readiness(provider, instance_id, result, wait_started):
+    """Record boot-to-running and running-to-ready from a readiness.ReadinessResult
+
+    Boot-to-running is measured from the last start request when there was
+    one in this process, otherwise from the start of the wait. Running-to-
+    ready covers the probes after the cloud state (e.g. ComfyUI answering).
+    """
+    if not METRICS or not result.ready or not result.phases:
+        return
+    cloud_name, running_at = result.phases[0]
+    if not cloud_name.startswith('cloud:'):
+        return
+    labels = {'provider': provider, 'instance': instance_id}
+    requested = METRICS.get('cloud_instance_start_requested_timestamp_seconds', labels)
+    wall_running = wait_started + running_at
+    boot_to_running = wall_running - requested if requested and requested <= wall_running else running_at
+    METRICS.observe('cloud_instance_boot_to_running_seconds', {'provider': provider}, boot_to_running,
+                    help='Start request to cloud running state')
+    METRICS.set('cloud_instance_last_boot_to_running_seconds', labels, boot_to_running)
+    if len(result.phases) > 1:
+        running_to_ready = result.elapsed - running_at
+        METRICS.observe('cloud_instance_running_to_ready_seconds', {'provider': provider}, running_to_ready,
+                        help='Cloud running state to every readiness probe passing')
+        METRICS.set('cloud_instance_last_running_to_ready_seconds', labels, running_to_ready)
+
+def _status(result):
+    return 'false' if result is False else 'ok'
+
+def _record_call(provider, operation, started, status):
+    # Throttles are counted by the governor, once per throttled API request
+    labels = {'provider': provider, 'operation': operation, 'status': status}
+    METRICS.observe('cloud_operation_duration_seconds', labels, time.monotonic() - started,
+                    help='Duration of CloudProvider methods')
+    METRICS.inc('cloud_operations_total', labels, help='CloudProvider method calls by outcome')
+
+def _wrap(method, provider, operation):
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            started = time.monotonic()
+            try:
+                result = await method(self, *args, **kwargs)
+            except Exception as e:
+                _record_call(provider, operation, started, type(e).__name__)
+                raise
+            _record_call(provider, operation, started, _status(result))
+            return result
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception as e:
+            _record_call(provider, operation, started, type(e).__name__)
+            raise
+        _record_call(provider, operation, started, _status(result))
+        return result
+    return wrapper
+
+def instrument(provider):
+    """Class decorator timing and counting every public method defined on the class
+
+    Returns the class untouched when metrics are disabled, so there is no
+    overhead at all unless CLOUD_METRICS is set.
+    """
+    def decorate(cls):
+        if METRICS is None:
+            return cls
+        for name, method in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.isfunction(method):
+                setattr(cls, name, _wrap(method, provider, name))
+        return cls
+    return decorate
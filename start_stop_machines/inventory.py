@@ -0,0 +1,332 @@
+import os
+import sys
+import json
+import time
+import fnmatch
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+load_dotenv()
+
+from instrumentation import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Where the index lives and which resource groups/regions a plain `sync` covers,
+# e.g. CLOUD_INVENTORY_SOURCES=azure:TRI3D_ML,azure:TRI3D_EAST,aws:us-west-2
+DB_ENV = 'CLOUD_INVENTORY_DB'
+SOURCES_ENV = 'CLOUD_INVENTORY_SOURCES'
+DEFAULT_DB = os.path.expanduser('~/.cache/cloud-inventory.db')
+
+# Selector keys matched against columns; any other key is a tag
+FIELDS = ('provider', 'location', 'region', 'size', 'state')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    provider TEXT NOT NULL,
+    location TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    region TEXT,
+    size TEXT,
+    state TEXT,
+    tags TEXT NOT NULL DEFAULT '{}',
+    first_seen REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (provider, location, identifier)
+);
+CREATE INDEX IF NOT EXISTS instances_state ON instances (state);
+CREATE TABLE IF NOT EXISTS sources (
+    provider TEXT NOT NULL,
+    location TEXT NOT NULL,
+    synced REAL NOT NULL,
+    instances INTEGER NOT NULL,
+    PRIMARY KEY (provider, location)
+);
+"""
+
+def print_usage():
+    print("Usage: python inventory.py sync [--source PROVIDER:LOCATION ...] [--max-age S] [--record FILE] [--replay FILE] [--db PATH] [--verbose]")
+    print("       python inventory.py list [SELECTOR] [--json] [--db PATH]")
+    print("  --source:   Optional - Resource group (azure:TRI3D_ML) or region (aws:us-west-2) to sync, repeatable")
+    print("              (default $CLOUD_INVENTORY_SOURCES or the default Azure resource group)")
+    print("  --max-age:  Optional - Skip sources synced less than S seconds ago")
+    print("  --record:   Optional - Save the provider listings to FILE for later --replay")
+    print("  --replay:   Optional - Sync from a recorded FILE instead of the cloud APIs")
+    print("  --db PATH:  Optional - Index location (default $CLOUD_INVENTORY_DB or ~/.cache/cloud-inventory.db)")
+    print("  SELECTOR:   Comma-separated key=value, key!=value or key terms, e.g. gpu=a100,role=comfy,state=deallocated")
+    print("              Values may use | for alternatives and * wildcards; keys other than")
+    print(f"              {', '.join(FIELDS)} and name match tags")
+    sys.exit(1)
+
+def parse_source(spec):
+    """Parse PROVIDER:LOCATION into a (provider, location) pair"""
+    provider_name, _, location = spec.strip().partition(':')
+    if not provider_name or not location:
+        raise ValueError(f"Invalid source: {spec}, expected e.g. azure:TRI3D_ML or aws:us-west-2")
+    return provider_name.lower(), location
+
+def default_sources():
+    spec = os.getenv(SOURCES_ENV)
+    if spec:
+        return [parse_source(part) for part in spec.split(',') if part.strip()]
+    return [('azure', os.getenv('AZURE_RESOURCE_GROUP', 'TRI3D_ML'))]
+
+def parse_selector(selector):
+    """Parse a selector into (key, negate, patterns) terms; patterns is None for a bare key"""
+    terms = []
+    for part in (selector or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '!=' in part:
+            key, value = part.split('!=', 1)
+            negate = True
+        elif '=' in part:
+            key, value = part.split('=', 1)
+            negate = False
+        else:
+            key, value, negate = part, None, False
+        key = key.strip().lower()
+        if not key:
+            raise ValueError(f"Invalid selector term: {part}")
+        patterns = None if value is None else [pattern.strip().lower() for pattern in value.split('|')]
+        terms.append((key, negate, patterns))
+    return terms
+
+def _values(instance, key):
+    if key in FIELDS:
+        return [instance[key]]
+    if key == 'name':
+        return [instance['identifier'], instance['tags'].get('Name')]
+    return [value for tag, value in instance['tags'].items() if tag.lower() == key]
+
+def matches(instance, terms):
+    """Whether an instance dict satisfies every selector term"""
+    for key, negate, patterns in terms:
+        values = [str(value).lower() for value in _values(instance, key) if value is not None]
+        if patterns is None:
+            found = bool(values)
+        else:
+            found = any(fnmatch.fnmatchcase(value, pattern) for value in values for pattern in patterns)
+        if found == negate:
+            return False
+    return True
+
+class ReplayProvider:
+    """Serves list_instances from a file written by `sync --record`"""
+
+    def __init__(self, recording, provider_name):
+        self.recording = recording
+        self.provider_name = provider_name
+
+    def list_instances(self, location=None, **kwargs):
+        key = f"{self.provider_name}:{location}"
+        if key not in self.recording:
+            raise ValueError(f"No recorded listing for {key}")
+        return self.recording[key]
+
+class Inventory:
+    """Local SQLite index of instances, tags, sizes and power states
+
+    sync() lists each source (an Azure resource group or AWS region) with
+    one paged call and upserts the results; rows only change when the
+    instance did, and instances gone from a source are dropped. Sources
+    synced within max_age are skipped, so frequent syncs stay cheap.
+    """
+
+    def __init__(self, path=None, factory=None, clock=time.time, max_workers=8):
+        self.path = path or os.getenv(DB_ENV, DEFAULT_DB)
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        self.factory = factory
+        self.clock = clock
+        self.max_workers = max_workers
+        self.providers = {}
+        self._lock = threading.Lock()
+
+    def provider(self, name):
+        with self._lock:
+            if name not in self.providers:
+                factory = self.factory
+                if factory is None:
+                    from cloud_providers import get_cloud_provider
+                    factory = get_cloud_provider
+                self.providers[name] = factory(name)
+            return self.providers[name]
+
+    def last_synced(self, provider_name, location):
+        row = self.db.execute('SELECT synced FROM sources WHERE provider = ? AND location = ?',
+                              (provider_name, location)).fetchone()
+        return row['synced'] if row else None
+
+    def _list(self, source):
+        provider_name, location = source
+        return self.provider(provider_name).list_instances(location)
+
+    def sync(self, sources=None, max_age=None, record=None):
+        """Refresh the index from the providers, returning per-source change counts
+
+        With record set to a dict, the raw listings are stored in it keyed
+        by "provider:location", ready to be saved for ReplayProvider.
+        """
+        sources = sources or default_sources()
+        now = self.clock()
+        due = []
+        summary = {}
+        for source in sources:
+            synced = self.last_synced(*source)
+            if max_age is not None and synced is not None and now - synced < max_age:
+                summary[source] = {'skipped': True}
+            else:
+                due.append(source)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(due) or 1))) as executor:
+            listings = {source: executor.submit(self._list, source) for source in due}
+        for source, future in listings.items():
+            try:
+                instances = future.result()
+            except Exception as e:
+                # Keep the previous rows; the next sync retries this source
+                logger.warning(f"Could not list {source[0]}:{source[1]}: {e}")
+                summary[source] = {'error': str(e)}
+                continue
+            if record is not None:
+                record[f"{source[0]}:{source[1]}"] = instances
+            summary[source] = self._apply(source, instances, self.clock())
+        return summary
+
+    def _apply(self, source, instances, now):
+        provider_name, location = source
+        existing = {row['identifier']: row for row in self.db.execute(
+            'SELECT * FROM instances WHERE provider = ? AND location = ?', (provider_name, location))}
+        counts = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+        with self.db:
+            for instance in instances:
+                values = (instance.get('region'), instance.get('size'), instance.get('state'),
+                          json.dumps(instance.get('tags') or {}, sort_keys=True))
+                row = existing.pop(instance['identifier'], None)
+                if row is None:
+                    self.db.execute('INSERT INTO instances VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (provider_name, location, instance['identifier'], *values, now, now))
+                    counts['added'] += 1
+                elif (row['region'], row['size'], row['state'], row['tags']) != values:
+                    self.db.execute('UPDATE instances SET region = ?, size = ?, state = ?, tags = ?, updated = ? '
+                                    'WHERE provider = ? AND location = ? AND identifier = ?',
+                                    (*values, now, provider_name, location, instance['identifier']))
+                    counts['changed'] += 1
+                else:
+                    counts['unchanged'] += 1
+            for identifier in existing:
+                self.db.execute('DELETE FROM instances WHERE provider = ? AND location = ? AND identifier = ?',
+                                (provider_name, location, identifier))
+                counts['removed'] += 1
+            self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)',
+                            (provider_name, location, now, len(instances)))
+        return counts
+
+    def set_state(self, provider_name, location, identifier, state):
+        """Record a power state observed elsewhere, e.g. after a start or stop"""
+        with self.db:
+            self.db.execute('UPDATE instances SET state = ?, updated = ? '
+                            'WHERE provider = ? AND location = ? AND identifier = ?',
+                            (state, self.clock(), provider_name, location, identifier))
+
+    def instances(self):
+        rows = self.db.execute('SELECT * FROM instances ORDER BY provider, location, identifier').fetchall()
+        return [dict(row, tags=json.loads(row['tags'])) for row in rows]
+
+    def select(self, selector):
+        """Return the indexed instances matching a selector such as gpu=a100,state=deallocated"""
+        terms = parse_selector(selector)
+        return [instance for instance in self.instances() if matches(instance, terms)]
+
+    def close(self):
+        self.db.close()
+
+def print_instances(instances):
+    for instance in instances:
+        tags = ','.join(f"{key}={value}" for key, value in sorted(instance['tags'].items()))
+        print(f"{instance['provider']:<7}{instance['location']:<20}{instance['identifier']:<32}"
+              f"{instance['size'] or '-':<28}{instance['state'] or '-':<14}{tags}")
+
+def main():
+    args = sys.argv[1:]
+    verbose = "--verbose" in args
+    args = [arg for arg in args if arg != "--verbose"]
+    configure_logging(verbose)
+    if not args or args[0] not in ('sync', 'list'):
+        print_usage()
+    command = args.pop(0)
+
+    sources = []
+    max_age = None
+    record_path = None
+    replay_path = None
+    db_path = None
+    as_json = False
+    selector = None
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--source':
+                sources.append(parse_source(args.pop(0)))
+            elif arg == '--max-age':
+                max_age = float(args.pop(0))
+            elif arg == '--record':
+                record_path = args.pop(0)
+            elif arg == '--replay':
+                replay_path = args.pop(0)
+            elif arg == '--db':
+                db_path = args.pop(0)
+            elif arg == '--json':
+                as_json = True
+            elif command == 'list' and selector is None and not arg.startswith('--'):
+                selector = arg
+            else:
+                print_usage()
+        parse_selector(selector)
+    except (IndexError, ValueError) as e:
+        print(f"Invalid arguments: {e}")
+        print_usage()
+
+    try:
+        factory = None
+        if replay_path:
+            with open(replay_path) as f:
+                recording = json.load(f)
+            factory = lambda name: ReplayProvider(recording, name)
+        inventory = Inventory(db_path, factory=factory)
+    except Exception as e:
+        print(f"Error opening inventory: {e}")
+        sys.exit(1)
+
+    if command == 'list':
+        instances = inventory.select(selector)
+        if as_json:
+            print(json.dumps(instances, indent=2))
+        else:
+            print_instances(instances)
+        sys.exit(0)
+
+    record = {} if record_path else None
+    summary = inventory.sync(sources or None, max_age=max_age, record=record)
+    for (provider_name, location), counts in summary.items():
+        if counts.get('skipped'):
+            print(f"{provider_name}:{location}: up to date")
+        elif 'error' in counts:
+            print(f"{provider_name}:{location}: ERROR {counts['error']}")
+        else:
+            print(f"{provider_name}:{location}: {counts['added']} added, {counts['changed']} changed, "
+                  f"{counts['removed']} removed, {counts['unchanged']} unchanged")
+    if record is not None:
+        with open(record_path, 'w') as f:
+            json.dump(record, f, indent=2)
+    sys.exit(1 if any('error' in counts for counts in summary.values()) else 0)
+
+if __name__ == "__main__":
+    main()
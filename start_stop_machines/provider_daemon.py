@@ -0,0 +1,337 @@
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import threading
+import http.client
+import socketserver
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+# Unix socket the daemon listens on and the CLIs try first; CLOUD_DAEMON=off
+# makes the CLIs run in-process without looking for a daemon
+SOCKET_ENV = 'CLOUD_DAEMON_SOCKET'
+DISABLE_ENV = 'CLOUD_DAEMON'
+DEFAULT_SOCKET = f"/tmp/cloud-provider-daemon-{os.getuid()}.sock"
+
+# Endpoint name -> CloudProvider method
+OPERATIONS = {
+    'status': 'check_instance_status',
+    'start': 'start_instance',
+    'stop': 'stop_instance',
+    'wait-running': 'wait_for_running_status',
+    'wait-stopped': 'wait_for_stopped_status',
+}
+
+# Settings that decide which account, subscription and defaults a provider acts on.
+# /health reports the daemon's values and the CLIs run in-process when theirs differ.
+# Secrets are left out; matching IDs are enough to know it is the same identity.
+ENVIRONMENT_VARS = {
+    'azure': ('AZURE_SUBSCRIPTION_ID', 'AZURE_TENANT_ID', 'AZURE_CLIENT_ID', 'AZURE_RESOURCE_GROUP',
+              'CLOUD_PROVIDER_BACKEND'),
+    'aws': ('AWS_PROFILE', 'AWS_ACCESS_KEY_ID', 'AWS_DEFAULT_REGION', 'CLOUD_PROVIDER_BACKEND'),
+}
+
+# Requested by the daemon at startup so the first call does not wait for AAD
+AZURE_MANAGEMENT_SCOPE = 'https://management.azure.com/.default'
+
+def print_usage():
+    print("Usage: python provider_daemon.py [--socket PATH] [--metrics-port PORT] [--preload azure,aws] [--verbose]")
+    print("  --socket PATH:       Optional - Unix socket to listen on (default $CLOUD_DAEMON_SOCKET or /tmp/cloud-provider-daemon-<uid>.sock)")
+    print("  --metrics-port PORT: Optional - Also serve GET /metrics and /health (read-only) on http://127.0.0.1:PORT")
+    print("  --preload NAMES:     Optional - Providers to create and authenticate at startup (default azure)")
+    print("  --verbose:           Optional - Enable verbose debug output")
+    sys.exit(1)
+
+def socket_path():
+    return os.getenv(SOCKET_ENV, DEFAULT_SOCKET)
+
+def environment():
+    """{provider: {variable: value}} of the ENVIRONMENT_VARS in this process"""
+    return {name: {variable: os.getenv(variable) for variable in variables}
+            for name, variables in ENVIRONMENT_VARS.items()}
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection to a Unix socket"""
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+class DaemonUnavailable(Exception):
+    """No daemon is listening; the caller should run in-process"""
+
+class RemoteProvider:
+    """CloudProvider lookalike that forwards calls to a running provider daemon
+
+    Exceptions raised by the provider in the daemon are re-raised here,
+    ValueError as ValueError (the CLIs report those specially) and anything
+    else as RuntimeError.
+    """
+
+    def __init__(self, provider_name, path=None):
+        self.provider_name = provider_name.lower()
+        self.path = path or socket_path()
+
+    def request(self, method, endpoint, payload=None):
+        connection = UnixHTTPConnection(self.path)
+        try:
+            try:
+                connection.connect()
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                raise DaemonUnavailable(f"No provider daemon on {self.path}: {e}")
+            body = json.dumps(payload).encode() if payload is not None else None
+            connection.request(method, endpoint, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            data = json.loads(response.read().decode() or 'null')
+        finally:
+            connection.close()
+        if response.status != 200:
+            error = data.get('error', f"HTTP {response.status}") if isinstance(data, dict) else f"HTTP {response.status}"
+            if isinstance(data, dict) and data.get('type') == 'ValueError':
+                raise ValueError(error)
+            raise RuntimeError(error)
+        return data
+
+    def ping(self):
+        return self.request('GET', '/health')
+
+    def _call(self, operation, instance_id, kwargs):
+        payload = {'provider': self.provider_name, 'instance_id': instance_id, 'kwargs': kwargs}
+        return self.request('POST', f"/{operation}", payload)['result']
+
+    def check_instance_status(self, instance_id, **kwargs):
+        return self._call('status', instance_id, kwargs)
+
+    def start_instance(self, instance_id, **kwargs):
+        return self._call('start', instance_id, kwargs)
+
+    def stop_instance(self, instance_id, **kwargs):
+        return self._call('stop', instance_id, kwargs)
+
+    def wait_for_running_status(self, instance_id, **kwargs):
+        return self._call('wait-running', instance_id, kwargs)
+
+    def wait_for_stopped_status(self, instance_id, **kwargs):
+        return self._call('wait-stopped', instance_id, kwargs)
+
+def connect_provider(provider_name):
+    """Return a RemoteProvider if a daemon answers, otherwise None"""
+    if os.getenv(DISABLE_ENV, '').lower() in ('0', 'off', 'false', 'no'):
+        return None
+    provider = RemoteProvider(provider_name)
+    try:
+        health = provider.ping()
+    except (DaemonUnavailable, OSError, RuntimeError, ValueError) as e:
+        logger.debug(f"Running in-process: {e}")
+        return None
+    expected = environment().get(provider.provider_name, {})
+    daemon_environment = (health.get('environment') or {}).get(provider.provider_name, {})
+    different = sorted(variable for variable, value in expected.items() if daemon_environment.get(variable) != value)
+    if different:
+        logger.info(f"Running in-process: the provider daemon on {provider.path} (pid {health.get('pid')}) "
+                    f"was started with different {', '.join(different)}")
+        return None
+    logger.info(f"Using provider daemon on {provider.path} (pid {health.get('pid')})")
+    return provider
+
+class ProviderDaemon:
+    """Holds one provider per cloud, with its clients, sessions and tokens, for the process lifetime"""
+
+    def __init__(self, factory=None):
+        if factory is None:
+            # Imported here so the thin clients importing this module skip the SDK imports
+            from cloud_providers import get_cloud_provider
+            factory = get_cloud_provider
+        self.factory = factory
+        self.providers = {}
+        self.started = time.time()
+        self.calls = 0
+        # Providers are created lazily from this environment, report it as it was at startup
+        self.environment = environment()
+        self._lock = threading.Lock()
+
+    def provider(self, name):
+        name = name.lower()
+        with self._lock:
+            provider = self.providers.get(name)
+            if provider is None:
+                provider = self.providers[name] = self.factory(name)
+        return provider
+
+    def preload(self, names):
+        """Create providers and fetch credentials ahead of the first request"""
+        for name in names:
+            start_time = time.time()
+            try:
+                provider = self.provider(name)
+                credential = getattr(provider, 'credential', None)
+                if credential is not None and hasattr(credential, 'get_token'):
+                    credential.get_token(AZURE_MANAGEMENT_SCOPE)
+            except Exception as e:
+                logger.warning(f"Could not preload {name} provider: {e}")
+                continue
+            logger.info(f"Preloaded {name} provider in {time.time() - start_time:.1f}s")
+
+    def call(self, operation, provider_name, instance_id, kwargs):
+        method = getattr(self.provider(provider_name), OPERATIONS[operation], None)
+        if method is None:
+            raise ValueError(f"{provider_name} does not support {operation}")
+        with self._lock:
+            self.calls += 1
+        start_time = time.time()
+        result = method(instance_id, **kwargs)
+        logger.info(f"{operation} {provider_name}:{instance_id} -> {result} ({time.time() - start_time:.1f}s)")
+        return result
+
+    def health(self):
+        with self._lock:
+            return {'pid': os.getpid(), 'uptime': time.time() - self.started, 'calls': self.calls,
+                    'providers': sorted(self.providers), 'environment': self.environment}
+
+def make_handler(daemon, read_only=False):
+    """Request handler for the daemon API
+
+    read_only serves GET /metrics and a /health without the environment and
+    rejects every operation: the TCP metrics listener is open to any local
+    user, unlike the 0600 Unix socket.
+    """
+    from instrumentation import METRICS
+
+    class DaemonHandler(BaseHTTPRequestHandler):
+        """POST /<operation> {"provider", "instance_id", "kwargs"}, GET /health and GET /metrics"""
+
+        def _reply(self, status, payload, content_type='application/json'):
+            body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                health = daemon.health()
+                if read_only:
+                    health.pop('environment', None)
+                self._reply(200, health)
+            elif self.path == '/metrics':
+                if METRICS is None:
+                    self._reply(404, {'error': 'metrics are disabled, set CLOUD_METRICS'})
+                else:
+                    self._reply(200, METRICS.render_prometheus(), 'text/plain; version=0.0.4')
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if read_only:
+                self._reply(403, {'error': 'operations are only served on the Unix socket'})
+                return
+            operation = self.path.lstrip('/')
+            if operation not in OPERATIONS:
+                self._reply(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                result = daemon.call(operation, body['provider'], body['instance_id'], body.get('kwargs') or {})
+            except KeyError as e:
+                self._reply(400, {'error': f"missing field {e}", 'type': 'ValueError'})
+            except Exception as e:
+                logger.debug(f"{operation} failed", exc_info=True)
+                self._reply(500, {'error': str(e), 'type': type(e).__name__})
+            else:
+                self._reply(200, {'result': result})
+
+        def log_message(self, format, *args):
+            pass
+
+    return DaemonHandler
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def serve_unix(path, handler):
+    """Bind the API to a Unix socket only the current user can use"""
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Left behind by a daemon that did not exit cleanly
+            os.unlink(path)
+        else:
+            raise RuntimeError(f"Another provider daemon is listening on {path}")
+        finally:
+            probe.close()
+    old_umask = os.umask(0o177)
+    try:
+        return UnixHTTPServer(path, handler)
+    finally:
+        os.umask(old_umask)
+
+def main():
+    args = sys.argv[1:]
+    verbose = "--verbose" in args
+    args = [arg for arg in args if arg != "--verbose"]
+    path = socket_path()
+    metrics_port = None
+    preload = ['azure']
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--socket':
+                path = args.pop(0)
+            elif arg == '--metrics-port':
+                metrics_port = int(args.pop(0))
+            elif arg == '--preload':
+                preload = [name.strip() for name in args.pop(0).split(',') if name.strip()]
+            else:
+                print_usage()
+    except (IndexError, ValueError) as e:
+        print(f"Invalid arguments: {e}")
+        print_usage()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    from instrumentation import configure_logging
+    configure_logging(verbose)
+
+    try:
+        daemon = ProviderDaemon()
+        handler = make_handler(daemon)
+        server = serve_unix(path, handler)
+    except Exception as e:
+        print(f"Error starting provider daemon: {e}")
+        sys.exit(1)
+    daemon.preload(preload)
+
+    if metrics_port is not None:
+        http_server = ThreadingHTTPServer(('127.0.0.1', metrics_port), make_handler(daemon, read_only=True))
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        print(f"Serving on http://127.0.0.1:{metrics_port}")
+    print(f"Provider daemon listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Provider daemon stopped")
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import socket
+import time
+import urllib.request
+import urllib.error
+
+# ComfyUI listens on 3000 and nginx (nginx-setup-20250205.sh) exposes it on 80,
+# with the Flask training service routed under /training
+COMFYUI_PORT = 3000
+NGINX_PORT = 80
+# Without a host to probe, services get this long once the power state is running
+SETTLE_SECONDS = 15
+
+class ProbeFailed(Exception):
+    """Raised by a probe when readiness can no longer be reached"""
+    pass
+
+class Backoff:
+    """Adaptive poll delay: fast at first, slower the longer we wait"""
+
+    def __init__(self, initial=1.0, factor=1.5, max_delay=10.0):
+        self.initial = initial
+        self.factor = factor
+        self.max_delay = max_delay
+        self.reset()
+
+    def reset(self):
+        self.delay = self.initial
+
+    def next(self):
+        """Return the next delay and grow it for the following call"""
+        delay = self.delay
+        self.delay = min(self.delay * self.factor, self.max_delay)
+        return delay
+
+class Probe:
+    """Base class for readiness probes
+
+    check() returns True once the condition holds, False (or raises) while it
+    does not yet, and raises ProbeFailed if it never will.
+    """
+    name = 'probe'
+
+    def check(self):
+        raise NotImplementedError
+
+    def poll_delay(self, delay):
+        """Delay before the next check, given the backoff's proposal"""
+        return delay
+
+class CloudStateProbe(Probe):
+    """Cloud power state of an instance, via CloudProvider.check_instance_status"""
+
+    def __init__(self, provider, instance_id, state='running', failure_states=None, **kwargs):
+        self.provider = provider
+        self.instance_id = instance_id
+        self.state = state
+        self.failure_states = set(failure_states or [])
+        self.kwargs = kwargs
+        self.name = f"cloud:{state}"
+        self.last_state = None
+
+    def check(self):
+        # Each poll must see the current state, not one cached by an earlier bulk listing
+        self.last_state = self.provider.check_instance_status(self.instance_id, **{'max_age': 0, **self.kwargs})
+        if self.last_state in self.failure_states:
+            raise ProbeFailed(f"Instance {self.instance_id} entered state {self.last_state} while waiting for {self.state}")
+        return self.last_state == self.state
+
+class TcpProbe(Probe):
+    """A TCP connect to host:port succeeds"""
+
+    def __init__(self, host, port, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.name = f"tcp:{port}"
+
+    def check(self):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout):
+            return True
+
+class HttpProbe(Probe):
+    """An HTTP GET returns one of the accepted status codes"""
+
+    def __init__(self, url, timeout=3.0, ok_statuses=None, name=None):
+        self.url = url
+        self.timeout = timeout
+        self.ok_statuses = ok_statuses or range(200, 400)
+        self.name = name or f"http:{url}"
+
+    def check(self):
+        try:
+            with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+                return response.status in self.ok_statuses
+        except urllib.error.HTTPError as e:
+            return e.code in self.ok_statuses
+
+class SettleProbe(Probe):
+    """Passes once seconds have elapsed since its first check
+
+    Stands in for service probes when there is no host to probe, as sshd,
+    nginx and ComfyUI are still starting when the power state turns running.
+    """
+
+    def __init__(self, seconds=SETTLE_SECONDS, clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self.name = 'settle'
+        self.started = None
+
+    def remaining(self):
+        if self.started is None:
+            return self.seconds
+        return max(0.0, self.seconds - (self.clock() - self.started))
+
+    def check(self):
+        if self.started is None:
+            self.started = self.clock()
+        return self.remaining() <= 0
+
+    def poll_delay(self, delay):
+        return min(delay, self.remaining())
+
+def comfyui_probes(host, port=NGINX_PORT, training=False, timeout=3.0):
+    """Probes for a ComfyUI node: TCP connect, then /system_stats, optionally /training
+
+    Any answer from the Flask app other than a 5xx counts for /training: nginx
+    only answers 502/504 there while the upstream on :5000 is down.
+    """
+    base_url = f"http://{host}:{port}"
+    probes = [
+        TcpProbe(host, port, timeout=timeout),
+        HttpProbe(f"{base_url}/system_stats", timeout=timeout, name='comfyui:/system_stats'),
+    ]
+    if training:
+        probes.append(HttpProbe(f"{base_url}/training", timeout=timeout,
+                                ok_statuses=range(200, 500), name='training:/training'))
+    return probes
+
+def service_probes(host=None, training=False, probes=None, settle=SETTLE_SECONDS):
+    """Probes to run once an instance is running
+
+    ComfyUI probes against host plus any extra probes; with neither, a
+    settle delay so callers do not race services that are still starting.
+    """
+    phases = comfyui_probes(host, training=training) if host else []
+    phases.extend(probes or [])
+    if not phases and settle:
+        phases.append(SettleProbe(settle))
+    return phases
+
+class ReadinessResult:
+    """Outcome of wait_until_ready with time-to-ready per phase"""
+
+    def __init__(self):
+        self.ready = False
+        self.phases = []
+        self.failed_phase = None
+        self.error = None
+        self.elapsed = 0.0
+
+    def phase_durations(self):
+        """Return {phase name: seconds spent in that phase}"""
+        durations = {}
+        previous = 0.0
+        for name, ready_at in self.phases:
+            durations[name] = ready_at - previous
+            previous = ready_at
+        return durations
+
+    def summary(self):
+        parts = [f"{name} +{seconds:.1f}s" for name, seconds in self.phase_durations().items()]
+        if self.failed_phase:
+            parts.append(f"{self.failed_phase} not ready")
+        return f"{', '.join(parts) or 'no phases'} (total {self.elapsed:.1f}s)"
+
+def wait_until_ready(probes, timeout=300, backoff=None, sleep=time.sleep, clock=time.monotonic):
+    """Run probes in order until all pass or the timeout expires
+
+    Each probe is a phase: it is polled with adaptive backoff until it passes,
+    then the next phase starts with a fresh backoff. Returns a ReadinessResult
+    recording when each phase became ready.
+    """
+    backoff = backoff or Backoff()
+    result = ReadinessResult()
+    start_time = clock()
+
+    for probe in probes:
+        backoff.reset()
+        while True:
+            try:
+                if probe.check():
+                    result.phases.append((probe.name, clock() - start_time))
+                    break
+            except ProbeFailed as e:
+                result.failed_phase = probe.name
+                result.error = e
+                result.elapsed = clock() - start_time
+                return result
+            except Exception as e:
+                result.error = e
+
+            remaining = timeout - (clock() - start_time)
+            if remaining <= 0:
+                result.failed_phase = probe.name
+                result.elapsed = clock() - start_time
+                return result
+            sleep(min(probe.poll_delay(backoff.next()), remaining))
+
+    result.ready = True
+    result.error = None
+    result.elapsed = clock() - start_time
+    return result
@@ -1,17 +1,24 @@
 import sys
 import os
+import logging
 import time
 from dotenv import load_dotenv
 load_dotenv()
 
-from cloud_providers import get_cloud_provider
+from instrumentation import configure_logging
+from provider_daemon import connect_provider
+
+logger = logging.getLogger(__name__)
 
 def print_usage():
-    print("Usage: python start_server.py <identifier> [cloud_provider] [resource_group/region] [--verbose]")
+    print("Usage: python start_server.py <identifier> [cloud_provider] [resource_group/region] [--host HOST] [--training] [--verbose]")
     print("  identifier:     Server name or instance ID")
     print("  cloud_provider: Optional - 'azure' or 'aws' (default is 'azure')")
     print("  resource_group: Optional - For Azure only, resource group name")
     print("  region:         Optional - AWS region or Azure location")
+    print("  --host HOST:    Recommended - Also wait until ComfyUI answers on HOST (via nginx on port 80);")
+    print("                  without it, waits a fixed 15s after the instance reports running")
+    print("  --training:     Optional - With --host, also wait for the /training endpoint")
     print("  --verbose:      Optional - Enable verbose debug output")
     sys.exit(1)
 
@@ -22,18 +29,34 @@ def main():
     
     # Check if verbose flag is provided
     verbose = "--verbose" in sys.argv
+    configure_logging(verbose)
     if verbose:
-        print(f"[VERBOSE] Running start_server.py with arguments: {sys.argv}")
-        print(f"[VERBOSE] Current working directory: {os.getcwd()}")
+        logger.debug(f"Running start_server.py with arguments: {sys.argv}")
+        logger.debug(f"Current working directory: {os.getcwd()}")
         # Remove verbose flag from args for further processing
         sys.argv.remove("--verbose")
     
+    # Readiness options for waiting on services after the instance is running
+    wait_kwargs = {}
+    if "--host" in sys.argv:
+        index = sys.argv.index("--host")
+        if index + 1 >= len(sys.argv):
+            print_usage()
+        wait_kwargs['host'] = sys.argv[index + 1]
+        del sys.argv[index:index + 2]
+    if "--training" in sys.argv:
+        wait_kwargs['training'] = True
+        sys.argv.remove("--training")
+    
+    if len(sys.argv) < 2:
+        print_usage()
+    
     instance_id = sys.argv[1]
     cloud_provider_name = sys.argv[2] if len(sys.argv) > 2 else 'azure'
     
     if verbose:
-        print(f"[VERBOSE] Instance ID: {instance_id}")
-        print(f"[VERBOSE] Cloud provider: {cloud_provider_name}")
+        logger.debug(f"Instance ID: {instance_id}")
+        logger.debug(f"Cloud provider: {cloud_provider_name}")
         
         # Debug environment variables
         azure_client_id = os.getenv('AZURE_CLIENT_ID')
@@ -41,35 +64,39 @@ def main():
         azure_subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
         azure_resource_group = os.getenv('AZURE_RESOURCE_GROUP')
         
-        print(f"[VERBOSE] AZURE_CLIENT_ID exists: {bool(azure_client_id)}")
-        print(f"[VERBOSE] AZURE_TENANT_ID exists: {bool(azure_tenant_id)}")
-        print(f"[VERBOSE] AZURE_SUBSCRIPTION_ID exists: {bool(azure_subscription_id)}")
-        print(f"[VERBOSE] AZURE_RESOURCE_GROUP exists: {bool(azure_resource_group)}")
+        logger.debug(f"AZURE_CLIENT_ID exists: {bool(azure_client_id)}")
+        logger.debug(f"AZURE_TENANT_ID exists: {bool(azure_tenant_id)}")
+        logger.debug(f"AZURE_SUBSCRIPTION_ID exists: {bool(azure_subscription_id)}")
+        logger.debug(f"AZURE_RESOURCE_GROUP exists: {bool(azure_resource_group)}")
     
     # Get additional parameters
     kwargs = {}
     if len(sys.argv) > 3 and cloud_provider_name.lower() == 'azure':
         kwargs['resource_group'] = sys.argv[3]
         if verbose:
-            print(f"[VERBOSE] Using resource group: {kwargs['resource_group']}")
+            logger.debug(f"Using resource group: {kwargs['resource_group']}")
     if len(sys.argv) > 3 and cloud_provider_name.lower() == 'aws':
         kwargs['region'] = sys.argv[3]
         if verbose:
-            print(f"[VERBOSE] Using region: {kwargs['region']}")
+            logger.debug(f"Using region: {kwargs['region']}")
     
     try:
         # Initialize cloud provider
         if verbose:
-            print(f"[VERBOSE] Initializing cloud provider: {cloud_provider_name}")
+            logger.debug(f"Initializing cloud provider: {cloud_provider_name}")
         
-        cloud_provider = get_cloud_provider(cloud_provider_name)
+        # A running provider_daemon.py already holds authenticated clients
+        cloud_provider = connect_provider(cloud_provider_name)
+        if cloud_provider is None:
+            from cloud_providers import get_cloud_provider
+            cloud_provider = get_cloud_provider(cloud_provider_name)
         
         if verbose:
-            print(f"[VERBOSE] Cloud provider initialized successfully")
+            logger.debug("Cloud provider initialized successfully")
         
         # Get current status to check for problematic states first
         if verbose:
-            print(f"[VERBOSE] Checking current instance status")
+            logger.debug("Checking current instance status")
         
         current_status = cloud_provider.check_instance_status(instance_id, **kwargs)
         print(f"Current status of {instance_id}: {current_status}")
@@ -81,16 +108,16 @@ def main():
         # Start the instance
         try:
             if verbose:
-                print(f"[VERBOSE] Attempting to start instance {instance_id}")
+                logger.debug(f"Attempting to start instance {instance_id}")
             
             started = cloud_provider.start_instance(instance_id, **kwargs)
             
             if started:
                 # Wait for instance to be in running state
                 if verbose:
-                    print(f"[VERBOSE] Instance start initiated, waiting for running status")
+                    logger.debug("Instance start initiated, waiting for running status")
                 
-                if cloud_provider.wait_for_running_status(instance_id, **kwargs):
+                if cloud_provider.wait_for_running_status(instance_id, **kwargs, **wait_kwargs):
                     print(f"Instance {instance_id} is now running and ready")
                     sys.exit(0)
                 else:
@@ -108,7 +135,7 @@ def main():
         print(f"Error starting instance: {e}")
         if verbose:
             import traceback
-            print(f"[VERBOSE] Exception traceback: {traceback.format_exc()}")
+            logger.debug(f"Exception traceback: {traceback.format_exc()}")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -1,9 +1,13 @@
 import sys
 import os
+import logging
 from dotenv import load_dotenv
 load_dotenv()
 
-from cloud_providers import get_cloud_provider
+from instrumentation import configure_logging
+from provider_daemon import connect_provider
+
+logger = logging.getLogger(__name__)
 
 def print_usage():
     print("Usage: python stop_server.py <identifier> [cloud_provider] [resource_group/region] [--verbose]")
@@ -21,9 +25,10 @@ def main():
     
     # Check if verbose flag is provided
     verbose = "--verbose" in sys.argv
+    configure_logging(verbose)
     if verbose:
-        print(f"[VERBOSE] Running stop_server.py with arguments: {sys.argv}")
-        print(f"[VERBOSE] Current working directory: {os.getcwd()}")
+        logger.debug(f"Running stop_server.py with arguments: {sys.argv}")
+        logger.debug(f"Current working directory: {os.getcwd()}")
         # Remove verbose flag from args for further processing
         sys.argv.remove("--verbose")
     
@@ -31,8 +36,8 @@ def main():
     cloud_provider_name = sys.argv[2] if len(sys.argv) > 2 else 'azure'
     
     if verbose:
-        print(f"[VERBOSE] Instance ID: {instance_id}")
-        print(f"[VERBOSE] Cloud provider: {cloud_provider_name}")
+        logger.debug(f"Instance ID: {instance_id}")
+        logger.debug(f"Cloud provider: {cloud_provider_name}")
         
         # Debug environment variables
         if cloud_provider_name.lower() == 'azure':
@@ -41,42 +46,46 @@ def main():
             azure_subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
             azure_resource_group = os.getenv('AZURE_RESOURCE_GROUP')
             
-            print(f"[VERBOSE] AZURE_CLIENT_ID exists: {bool(azure_client_id)}")
-            print(f"[VERBOSE] AZURE_TENANT_ID exists: {bool(azure_tenant_id)}")
-            print(f"[VERBOSE] AZURE_SUBSCRIPTION_ID exists: {bool(azure_subscription_id)}")
-            print(f"[VERBOSE] AZURE_RESOURCE_GROUP exists: {bool(azure_resource_group)}")
+            logger.debug(f"AZURE_CLIENT_ID exists: {bool(azure_client_id)}")
+            logger.debug(f"AZURE_TENANT_ID exists: {bool(azure_tenant_id)}")
+            logger.debug(f"AZURE_SUBSCRIPTION_ID exists: {bool(azure_subscription_id)}")
+            logger.debug(f"AZURE_RESOURCE_GROUP exists: {bool(azure_resource_group)}")
     
     # Get additional parameters
     kwargs = {}
     if len(sys.argv) > 3 and cloud_provider_name.lower() == 'azure':
         kwargs['resource_group'] = sys.argv[3]
         if verbose:
-            print(f"[VERBOSE] Using resource group: {kwargs['resource_group']}")
+            logger.debug(f"Using resource group: {kwargs['resource_group']}")
     if len(sys.argv) > 3 and cloud_provider_name.lower() == 'aws':
         kwargs['region'] = sys.argv[3]
         if verbose:
-            print(f"[VERBOSE] Using region: {kwargs['region']}")
+            logger.debug(f"Using region: {kwargs['region']}")
     
     try:
         # Initialize cloud provider
         if verbose:
-            print(f"[VERBOSE] Initializing cloud provider: {cloud_provider_name}")
+            logger.debug(f"Initializing cloud provider: {cloud_provider_name}")
         
-        cloud_provider = get_cloud_provider(cloud_provider_name)
+        # A running provider_daemon.py already holds authenticated clients
+        cloud_provider = connect_provider(cloud_provider_name)
+        if cloud_provider is None:
+            from cloud_providers import get_cloud_provider
+            cloud_provider = get_cloud_provider(cloud_provider_name)
         
         if verbose:
-            print(f"[VERBOSE] Cloud provider initialized successfully")
+            logger.debug("Cloud provider initialized successfully")
         
         # Check current status
         if verbose:
-            print(f"[VERBOSE] Checking current instance status")
+            logger.debug("Checking current instance status")
             
         status = cloud_provider.check_instance_status(instance_id, **kwargs)
         print(f"Instance {instance_id} current status: {status}")
         
         # Stop the instance
         if verbose:
-            print(f"[VERBOSE] Attempting to stop instance {instance_id}")
+            logger.debug(f"Attempting to stop instance {instance_id}")
             
         if cloud_provider.stop_instance(instance_id, **kwargs):
             print(f"Successfully initiated stop for instance {instance_id}")
@@ -84,7 +93,7 @@ def main():
             # For AWS, wait for the instance to fully stop before returning
             if cloud_provider_name.lower() == 'aws':
                 if verbose:
-                    print(f"[VERBOSE] Waiting for AWS instance to fully stop")
+                    logger.debug("Waiting for AWS instance to fully stop")
                     
                 print("Waiting for AWS instance to fully stop...")
                 if cloud_provider.wait_for_stopped_status(instance_id, **kwargs):
@@ -103,7 +112,7 @@ def main():
         print(f"Error stopping instance: {e}")
         if verbose:
             import traceback
-            print(f"[VERBOSE] Exception traceback: {traceback.format_exc()}")
+            logger.debug(f"Exception traceback: {traceback.format_exc()}")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,324 @@
+import sys
+import json
+import time
+import uuid
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+load_dotenv()
+
+from autoscaler import Node, http_get_json
+from batch_server import build_providers
+from instrumentation import configure_logging
+
+DEFAULT_POOL_SIZE = 1
+DEFAULT_API_PORT = 8089
+DEFAULT_WARMUP_TIMEOUT = 600
+# Seconds a node that failed to warm is left out of refills
+FAILURE_COOLDOWN = 300
+
+# Node states within the pool
+COLD = 'cold'
+WARMING = 'warming'
+WARM = 'warm'
+LEASED = 'leased'
+STOPPING = 'stopping'
+
+def print_usage():
+    print("Usage: python warm_pool.py <config.json> [--size N] [--warmup-workflow FILE] [--port PORT]")
+    print("  config.json:      Nodes as for autoscaler.py, optionally with a \"warm_pool\" section")
+    print("  --size N:         Optional - Number of idle warm nodes to keep (default 1)")
+    print("  --warmup-workflow Optional - ComfyUI API-format workflow run once on every node before it is leased")
+    print("  --port PORT:      Optional - Port of the local lease API (default 8089)")
+    sys.exit(1)
+
+def http_post_json(url, payload, timeout):
+    """POST payload as JSON and decode the JSON response"""
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode() or 'null')
+
+def run_workflow(node, workflow, timeout=DEFAULT_WARMUP_TIMEOUT, http_get=http_get_json, http_post=http_post_json,
+                 sleep=time.sleep, clock=time.monotonic):
+    """Queue a workflow on a node's ComfyUI and wait until it appears in /history"""
+    response = http_post(f"{node.base_url}/prompt", {'prompt': workflow, 'client_id': f"warm-pool-{uuid.uuid4()}"}, 30)
+    prompt_id = response['prompt_id']
+    deadline = clock() + timeout
+    while clock() < deadline:
+        history = http_get(f"{node.base_url}/history/{prompt_id}", 10) or {}
+        if prompt_id in history:
+            status = history[prompt_id].get('status', {})
+            if status.get('status_str') == 'error':
+                raise RuntimeError(f"Warm-up workflow failed on {node.name}")
+            return
+        sleep(2)
+    raise TimeoutError(f"Warm-up workflow did not finish on {node.name} within {timeout}s")
+
+class WarmPool:
+    """Keeps `size` nodes running, ComfyUI answering and warmed up, ready to lease
+
+    lease() hands out a warm node immediately (or blocks until one is
+    ready) and refills the pool in the background; release() returns a node,
+    deallocating it if the pool already holds `size` warm nodes.
+    """
+
+    def __init__(self, nodes, size=DEFAULT_POOL_SIZE, warmup_workflow=None, providers=None,
+                 warmup_timeout=DEFAULT_WARMUP_TIMEOUT, max_workers=4, warm=None, failure_cooldown=FAILURE_COOLDOWN,
+                 clock=time.monotonic):
+        self.nodes = {node.name: node for node in nodes}
+        self.size = size
+        self.warmup_workflow = warmup_workflow
+        self.warmup_timeout = warmup_timeout
+        self.providers = providers if providers is not None else build_providers([node.target for node in nodes])
+        # Bring a running node to the warm state; replaceable for testing
+        self.warm = warm or self._warm
+        self.states = {}
+        # Node name -> clock() until which it is not warmed again
+        self.failed_until = {}
+        self.failure_cooldown = failure_cooldown
+        self.clock = clock
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Reentrant, so refill() can run while lease() holds it
+        self._condition = threading.Condition(threading.RLock())
+
+    def provider(self, node):
+        return self.providers[node.target.group_key()]
+
+    def counts(self):
+        with self._condition:
+            counts = {state: 0 for state in (COLD, WARMING, WARM, LEASED, STOPPING)}
+            for state in self.states.values():
+                counts[state] += 1
+            return counts
+
+    def status(self):
+        with self._condition:
+            return {name: self.states[name] for name in self.nodes}
+
+    def initialize(self):
+        """Adopt up to `size` running nodes (the cheapest) into the pool, then fill it up
+
+        Running nodes beyond that are left alone, in case something else is
+        using them; the pool treats them as cold.
+        """
+        running = []
+        for node in sorted(self.nodes.values(), key=lambda node: node.hourly_cost):
+            try:
+                state = self.provider(node).check_instance_status(node.name, **node.target.call_kwargs())
+            except Exception as e:
+                print(f"Error checking status of {node.name}: {e}")
+                state = None
+            if state == 'running':
+                running.append(node)
+        with self._condition:
+            for node in self.nodes.values():
+                self.states[node.name] = COLD
+            for node in running[:self.size]:
+                self.states[node.name] = WARMING
+                self.executor.submit(self._warm_up, node, False)
+        for node in running[self.size:]:
+            print(f"{node.name} is running but the pool is full, not adopting it")
+        self.refill()
+
+    def _warm(self, node, start):
+        provider = self.provider(node)
+        kwargs = node.target.call_kwargs()
+        if start and not provider.start_instance(node.name, **kwargs):
+            raise RuntimeError(f"Failed to start {node.name}")
+        wait_kwargs = {'host': node.host} if node.host else {}
+        if not provider.wait_for_running_status(node.name, timeout=self.warmup_timeout, **kwargs, **wait_kwargs):
+            raise RuntimeError(f"{node.name} did not become ready")
+        if self.warmup_workflow and node.host:
+            # Loads the weights into VRAM and the page cache before the first real request
+            run_workflow(node, self.warmup_workflow, self.warmup_timeout)
+
+    def _warm_up(self, node, start):
+        start_time = time.time()
+        try:
+            self.warm(node, start)
+        except Exception as e:
+            print(f"Error warming {node.name}, skipping it for {self.failure_cooldown:.0f}s: {e}")
+            with self._condition:
+                self.states[node.name] = COLD
+                self.failed_until[node.name] = self.clock() + self.failure_cooldown
+                self._condition.notify_all()
+            return
+        print(f"{node.name} warm after {time.time() - start_time:.1f}s")
+        with self._condition:
+            self.states[node.name] = WARM
+            self.failed_until.pop(node.name, None)
+            self._condition.notify_all()
+
+    def refill(self, minimum=0):
+        """Start the cheapest cold nodes until max(size, minimum) nodes are warm or warming
+
+        Nodes that recently failed to warm are skipped until their cooldown ends.
+        """
+        with self._condition:
+            available = sum(1 for state in self.states.values() if state in (WARM, WARMING))
+            now = self.clock()
+            cold = sorted((self.nodes[name] for name, state in self.states.items()
+                           if state == COLD and self.failed_until.get(name, 0) <= now),
+                          key=lambda node: node.hourly_cost)
+            to_start = cold[:max(0, max(self.size, minimum) - available)]
+            for node in to_start:
+                self.states[node.name] = WARMING
+        for node in to_start:
+            print(f"Warming {node.name} to refill the pool")
+            self.executor.submit(self._warm_up, node, True)
+        return [node.name for node in to_start]
+
+    def lease(self, timeout=None):
+        """Take a warm node out of the pool, returning its Node or None on timeout
+
+        With an empty pool a cold node is warmed on demand and awaited.
+        Returns None at once when nothing is warm or warming and no cold
+        node can be warmed (all leased, stopping or cooling down after a
+        failure).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                warm = sorted((self.nodes[name] for name, state in self.states.items() if state == WARM),
+                              key=lambda node: node.hourly_cost)
+                if warm:
+                    node = warm[0]
+                    self.states[node.name] = LEASED
+                    break
+                if WARMING not in self.states.values() and not self.refill(minimum=1):
+                    # Every node is leased, stopping or failed recently
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+        self.refill()
+        return node
+
+    def release(self, name):
+        """Return a leased node, deallocating it if the pool is already full
+
+        Nodes still warming count towards the pool, since lease() already
+        started a replacement for this one.
+        """
+        node = self.nodes[name]
+        with self._condition:
+            if self.states.get(name) != LEASED:
+                raise ValueError(f"{name} is not leased")
+            available = sum(1 for state in self.states.values() if state in (WARM, WARMING))
+            keep = available < self.size
+            self.states[name] = WARM if keep else STOPPING
+            self._condition.notify_all()
+        if not keep:
+            self.executor.submit(self._stop, node)
+        return keep
+
+    def _stop(self, node):
+        try:
+            self.provider(node).stop_instance(node.name, **node.target.call_kwargs())
+        except Exception as e:
+            print(f"Error stopping {node.name}: {e}")
+        with self._condition:
+            self.states[node.name] = COLD
+            self._condition.notify_all()
+
+def make_handler(pool):
+    class LeaseHandler(BaseHTTPRequestHandler):
+        """POST /lease, POST /release {"name": ...} and GET /status"""
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def do_GET(self):
+            if self.path == '/status':
+                self._reply(200, {'size': pool.size, 'counts': pool.counts(), 'nodes': pool.status()})
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            try:
+                body = self._body()
+                if self.path == '/lease':
+                    node = pool.lease(body.get('timeout', 0))
+                    if node is None:
+                        self._reply(503, {'error': 'no warm node available'})
+                    else:
+                        self._reply(200, {'name': node.name, 'host': node.host, 'url': node.base_url})
+                elif self.path == '/release':
+                    kept = pool.release(body['name'])
+                    self._reply(200, {'name': body['name'], 'kept_warm': kept})
+                else:
+                    self._reply(404, {'error': 'not found'})
+            except (KeyError, ValueError) as e:
+                self._reply(400, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return LeaseHandler
+
+def main():
+    args = sys.argv[1:]
+    size = None
+    workflow_path = None
+    port = DEFAULT_API_PORT
+    config_path = None
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--size':
+                size = int(args.pop(0))
+            elif arg == '--warmup-workflow':
+                workflow_path = args.pop(0)
+            elif arg == '--port':
+                port = int(args.pop(0))
+            elif config_path is None and not arg.startswith('--'):
+                config_path = arg
+            else:
+                print_usage()
+    except (IndexError, ValueError) as e:
+        print(f"Invalid arguments: {e}")
+        print_usage()
+    if config_path is None:
+        print_usage()
+    configure_logging()
+
+    try:
+        with open(config_path) as f:
+            config = json.load(f)
+        settings = config.get('warm_pool', {})
+        workflow_path = workflow_path or settings.get('warmup_workflow')
+        workflow = None
+        if workflow_path:
+            with open(workflow_path) as f:
+                workflow = json.load(f)
+        pool = WarmPool([Node(node) for node in config['nodes']],
+                        size=size if size is not None else settings.get('size', DEFAULT_POOL_SIZE),
+                        warmup_workflow=workflow,
+                        warmup_timeout=settings.get('warmup_timeout', DEFAULT_WARMUP_TIMEOUT))
+    except Exception as e:
+        print(f"Error initializing warm pool: {e}")
+        sys.exit(1)
+
+    pool.initialize()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(pool))
+    print(f"Warm pool of {pool.size} serving lease API on http://127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Warm pool stopped; leased and warm nodes are left running")
+
+if __name__ == "__main__":
+    main()
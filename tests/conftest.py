@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The tools are run as scripts from their own directories, import them the same way
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('start_stop_machines', 'install_multi-gpu', 'install_scripts'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
@@ -0,0 +1,172 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from autoscaler import Autoscaler, Node
+
+class FakeProvider:
+    """In-memory power states; starts and stops complete immediately"""
+
+    def __init__(self, states):
+        self.states = dict(states)
+        self.started = []
+        self.stopped = []
+
+    def check_instance_status(self, name, **kwargs):
+        return self.states[name]
+
+    def start_instance(self, name, **kwargs):
+        self.started.append(name)
+        self.states[name] = 'running'
+        return True
+
+    def wait_for_running_status(self, name, timeout=300, **kwargs):
+        return True
+
+    def stop_instance(self, name, **kwargs):
+        self.stopped.append(name)
+        self.states[name] = 'deallocated'
+        return True
+
+class StubComfyUI:
+    """Answers /system_stats and /queue like ComfyUI, or 503 while not up"""
+
+    def __init__(self):
+        self.up = False
+        self.pending = 0
+        self.running = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if not stub.up:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                if self.path == '/queue':
+                    body = {'queue_pending': [[i] for i in range(stub.pending)],
+                            'queue_running': [[i] for i in range(stub.running)]}
+                else:
+                    body = {'system': {}, 'devices': []}
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def fleet():
+    servers = {name: StubComfyUI() for name in ('a', 'b', 'c')}
+    nodes = [Node({'name': name, 'host': '127.0.0.1', 'port': server.port, 'hourly_cost': cost})
+             for (name, server), cost in zip(servers.items(), (1.0, 2.0, 3.0))]
+    provider = FakeProvider({name: 'deallocated' for name in servers})
+    yield nodes, servers, provider
+    for server in servers.values():
+        server.close()
+
+def make_autoscaler(nodes, provider, clock, **policy):
+    policy = dict({'scale_up_cooldown': 60, 'scale_down_cooldown': 300, 'idle_cooldown': 100,
+                   'start_timeout': 600, 'http_timeout': 2}, **policy)
+    return Autoscaler(nodes, policy, providers={('azure', None): provider}, clock=clock)
+
+def settle(autoscaler):
+    """Wait for the start/stop operations submitted by the last tick"""
+    deadline = time.monotonic() + 10
+    while any(node.operation for node in autoscaler.nodes):
+        assert time.monotonic() < deadline, "operations did not finish"
+        time.sleep(0.01)
+
+def tick(autoscaler):
+    decision = autoscaler.tick()
+    settle(autoscaler)
+    return decision and (decision[0], decision[1].name)
+
+def test_booting_nodes_count_as_capacity(fleet):
+    nodes, servers, provider = fleet
+    clock = Clock()
+    autoscaler = make_autoscaler(nodes, provider, clock, min_running=1)
+
+    assert tick(autoscaler) == ('start', 'a')
+    servers['a'].up = True
+    servers['a'].pending = 3
+    clock.now += 60
+    assert tick(autoscaler) == ('start', 'b')
+
+    # b is running but ComfyUI is still loading: a + b cover 3 pending jobs
+    clock.now += 60
+    assert tick(autoscaler) is None
+    clock.now += 300
+    assert tick(autoscaler) is None
+    assert provider.started == ['a', 'b']
+
+    # Still not answering after start_timeout, it no longer counts
+    clock.now += 300
+    assert tick(autoscaler) == ('start', 'c')
+
+def test_running_unanswering_node_counts_from_first_sighting(fleet):
+    nodes, servers, provider = fleet
+    provider.states['a'] = provider.states['b'] = 'running'
+    servers['a'].up = True
+    servers['a'].pending = 3
+    clock = Clock()
+    autoscaler = make_autoscaler(nodes, provider, clock)
+
+    # b was started outside the autoscaler and is still booting
+    assert tick(autoscaler) is None
+    clock.now += 599
+    assert tick(autoscaler) is None
+    clock.now += 1
+    assert tick(autoscaler) == ('start', 'c')
+
+def test_scale_down_cooldown_spaces_out_stops(fleet):
+    nodes, servers, provider = fleet
+    for name in servers:
+        provider.states[name] = 'running'
+        servers[name].up = True
+    clock = Clock()
+    autoscaler = make_autoscaler(nodes, provider, clock)
+
+    assert tick(autoscaler) is None
+    clock.now += 100
+    assert tick(autoscaler) == ('stop', 'c')
+    clock.now += 100
+    assert tick(autoscaler) is None
+    clock.now += 200
+    assert tick(autoscaler) == ('stop', 'b')
+    assert provider.stopped == ['c', 'b']
+
+def test_scale_up_when_only_booting_capacity_is_overloaded(fleet):
+    nodes, servers, provider = fleet
+    clock = Clock()
+    autoscaler = make_autoscaler(nodes, provider, clock, min_running=1)
+
+    assert tick(autoscaler) == ('start', 'a')
+    servers['a'].up = True
+    servers['a'].pending = 5
+    clock.now += 60
+    assert tick(autoscaler) == ('start', 'b')
+    # 5 jobs are more than a and the booting b can take between them
+    clock.now += 60
+    assert tick(autoscaler) == ('start', 'c')
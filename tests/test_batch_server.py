@@ -0,0 +1,57 @@
+from batch_server import Target, run_batch
+from test_autoscaler import FakeProvider
+
+class AzureLikeProvider(FakeProvider):
+    """Deallocates running VMs only, as AzureProvider does"""
+
+    def stop_instance(self, name, **kwargs):
+        if self.states[name] != 'running':
+            return False
+        return super().stop_instance(name, **kwargs)
+
+class BulkProvider:
+    """AWS-style provider with the list-accepting methods"""
+
+    def __init__(self, states):
+        self.states = dict(states)
+
+    def check_instances_status(self, instance_ids, **kwargs):
+        return {instance_id: self.states.get(instance_id) for instance_id in instance_ids}
+
+    def stop_instances(self, instance_ids, **kwargs):
+        results = {}
+        for instance_id in instance_ids:
+            results[instance_id] = self.states.get(instance_id) == 'running'
+            if results[instance_id]:
+                self.states[instance_id] = 'stopping'
+        return results
+
+    def wait_for_instances_stopped(self, instance_ids, timeout=300, **kwargs):
+        for instance_id in instance_ids:
+            self.states[instance_id] = 'stopped'
+        return {instance_id: True for instance_id in instance_ids}
+
+    def start_instances(self, instance_ids, **kwargs):
+        raise NotImplementedError
+
+    def wait_for_instances_running(self, instance_ids, timeout=300, **kwargs):
+        raise NotImplementedError
+
+def outcomes(results):
+    return {result['target'].identifier: (result['ok'], result['message']) for result in results}
+
+def test_stop_counts_already_deallocated_vms_as_stopped():
+    provider = AzureLikeProvider({'a': 'running', 'b': 'deallocated', 'c': 'stopped'})
+    targets = [Target(name) for name in 'abc']
+    results = run_batch('stop', targets, providers={('azure', None): provider})
+    # A powered-off but still allocated VM is not what stop asks for
+    assert outcomes(results) == {'a': (True, 'stopped'), 'b': (True, 'already deallocated'),
+                                 'c': (False, 'not stopped (status: stopped)')}
+    assert provider.stopped == ['a']
+
+def test_bulk_stop_counts_already_stopped_instances_as_stopped():
+    provider = BulkProvider({'i-1': 'running', 'i-2': 'stopped', 'i-3': 'pending'})
+    targets = [Target(name, 'aws', 'us-west-2') for name in ('i-1', 'i-2', 'i-3')]
+    results = run_batch('stop', targets, providers={('aws', 'us-west-2'): provider})
+    assert outcomes(results) == {'i-1': (True, 'stopped'), 'i-2': (True, 'already stopped'),
+                                 'i-3': (False, 'not running (status: pending)')}
@@ -0,0 +1,116 @@
+import os
+import re
+
+import pytest
+
+import comfy_workers
+from comfy_workers import ConfigError, render, validate
+
+@pytest.fixture(autouse=True)
+def no_nginx(monkeypatch):
+    # Keep results independent of whether nginx is installed here
+    monkeypatch.setattr(comfy_workers, 'nginx_test', lambda site_path: None)
+
+def read(output_dir, name):
+    with open(os.path.join(output_dir, name)) as f:
+        return f.read()
+
+def write(output_dir, name, content):
+    with open(os.path.join(output_dir, name), 'w') as f:
+        f.write(content)
+
+@pytest.mark.parametrize('gpus', [1, 4, 8])
+def test_render_one_worker_per_gpu(tmp_path, gpus):
+    output_dir = str(tmp_path)
+    written = render('comfy.example.com', output_dir, gpus, base_port=3000, comfyui_dir='/opt/ComfyUI', user='render')
+    assert len(written) == gpus + 2
+
+    for index in range(gpus):
+        env = comfy_workers.read_env(os.path.join(output_dir, 'comfyui', f"worker-{index}.env"))
+        assert env == {'CUDA_VISIBLE_DEVICES': str(index), 'COMFYUI_PORT': str(3000 + index)}
+
+    unit = read(output_dir, comfy_workers.UNIT_FILE)
+    assert 'User=render' in unit
+    assert '--port ${COMFYUI_PORT} --temp-directory /opt/ComfyUI/workers/%i' in unit
+
+    site = read(output_dir, comfy_workers.NGINX_FILE)
+    upstream = re.search(r'upstream comfyui \{(.*?)\}', site, re.S).group(1)
+    assert 'least_conn;' in upstream
+    assert re.findall(r'127\.0\.0\.1:(\d+)', upstream) == [str(3000 + index) for index in range(gpus)]
+    assert 'server_name comfy.example.com;' in site
+    assert f"w{gpus - 1} comfyui_w{gpus - 1};" in site
+
+    checks = validate(output_dir)
+    assert checks[0] == f"{gpus} workers on ports 3000-{3000 + gpus - 1}, one GPU each"
+
+def test_sticky_upstreams_fail_over_to_the_others(tmp_path):
+    render('comfy.example.com', str(tmp_path), 3)
+    site = read(str(tmp_path), comfy_workers.NGINX_FILE)
+    sticky = re.search(r'upstream comfyui_w1 \{(.*?)\}', site, re.S).group(1)
+    assert 'server 127.0.0.1:3001 max_fails=2' in sticky
+    assert re.findall(r'127\.0\.0\.1:(\d+) backup', sticky) == ['3000', '3002']
+
+def test_worker_id_map_uses_the_last_upstream_address(tmp_path):
+    render('comfy.example.com', str(tmp_path), 2)
+    site = read(str(tmp_path), comfy_workers.NGINX_FILE)
+    serving = re.search(r'map \$upstream_addr \$comfyui_worker_id \{(.*?)\}', site, re.S).group(1)
+    patterns = {worker: pattern for pattern, worker in re.findall(r'"~(.*?)" (w\d+);', serving)}
+
+    def worker_for(upstream_addr):
+        found = [worker for worker, pattern in patterns.items() if re.search(pattern, upstream_addr)]
+        assert len(found) <= 1
+        return found[0] if found else ''
+
+    assert worker_for('127.0.0.1:3000') == 'w0'
+    assert worker_for('127.0.0.1:3000, 127.0.0.1:3001') == 'w1'
+    assert worker_for('127.0.0.1:3001 : 127.0.0.1:3000') == 'w0'
+    assert worker_for('127.0.0.1:13000') == ''
+
+def test_render_rejects_the_training_port(tmp_path):
+    with pytest.raises(ConfigError):
+        render('comfy.example.com', str(tmp_path), 4, base_port=4998)
+
+def break_env_numbering(output_dir):
+    os.rename(os.path.join(output_dir, 'comfyui', 'worker-1.env'), os.path.join(output_dir, 'comfyui', 'worker-5.env'))
+
+def break_gpu_pinning(output_dir):
+    write(output_dir, os.path.join('comfyui', 'worker-1.env'), "CUDA_VISIBLE_DEVICES=0\nCOMFYUI_PORT=3001\n")
+
+def break_ports(output_dir):
+    write(output_dir, os.path.join('comfyui', 'worker-1.env'), "CUDA_VISIBLE_DEVICES=1\nCOMFYUI_PORT=3005\n")
+
+def break_upstream(output_dir):
+    site = read(output_dir, comfy_workers.NGINX_FILE)
+    write(output_dir, comfy_workers.NGINX_FILE, site.replace('    least_conn;\n', '', 1))
+
+def break_braces(output_dir):
+    site = read(output_dir, comfy_workers.NGINX_FILE)
+    write(output_dir, comfy_workers.NGINX_FILE, site.rstrip().rstrip('}'))
+
+def break_unit(output_dir):
+    unit = read(output_dir, comfy_workers.UNIT_FILE)
+    write(output_dir, comfy_workers.UNIT_FILE, unit.replace('EnvironmentFile=', '#'))
+
+def drop_worker_from_upstream(output_dir):
+    site = read(output_dir, comfy_workers.NGINX_FILE)
+    write(output_dir, comfy_workers.NGINX_FILE, site.replace('    server 127.0.0.1:3002 max_fails=2 fail_timeout=10s;\n', '', 1))
+
+@pytest.mark.parametrize('breakage, message', [
+    (break_env_numbering, 'numbered 0..N-1'),
+    (break_gpu_pinning, 'CUDA_VISIBLE_DEVICES=0'),
+    (break_ports, 'not consecutive'),
+    (break_upstream, 'least_conn'),
+    (break_braces, "unclosed '{'"),
+    (break_unit, 'EnvironmentFile='),
+    (drop_worker_from_upstream, 'comfyui upstream serves'),
+])
+def test_validate_rejects_broken_output(tmp_path, breakage, message):
+    output_dir = str(tmp_path)
+    render('comfy.example.com', output_dir, 3)
+    breakage(output_dir)
+    with pytest.raises(ConfigError, match=re.escape(message)):
+        validate(output_dir)
+
+def test_validate_requires_rendered_files(tmp_path):
+    with pytest.raises(ConfigError, match='Missing'):
+        validate(str(tmp_path))
@@ -0,0 +1,182 @@
+import os
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import download_models
+from download_models import BandwidthLimiter, DownloadError, ModelFile, check_existing, download, fetch
+from model_cache import ModelCache
+
+BODY = os.urandom(3 * download_models.CHUNK_SIZE + 12345)
+SHA256 = hashlib.sha256(BODY).hexdigest()
+
+class ModelServer:
+    """Serves BODY at /model.bin with HEAD and Range support
+
+    truncate_at closes the connection after that many bytes of a response,
+    ignore_range answers range requests with the whole body.
+    """
+
+    def __init__(self, body=BODY):
+        self.body = body
+        self.truncate_at = None
+        self.ignore_range = False
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _headers(self):
+                start = 0
+                status = 200
+                range_header = self.headers.get('Range')
+                if range_header and not server.ignore_range:
+                    start = int(range_header.split('=', 1)[1].rstrip('-'))
+                    if start >= len(server.body):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f"bytes */{len(server.body)}")
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return None
+                    status = 206
+                self.send_response(status)
+                if status == 206:
+                    self.send_header('Content-Range', f"bytes {start}-{len(server.body) - 1}/{len(server.body)}")
+                self.send_header('Content-Length', str(len(server.body) - start))
+                self.end_headers()
+                return start
+
+            def do_HEAD(self):
+                server.requests.append(('HEAD', None))
+                self._headers()
+
+            def do_GET(self):
+                server.requests.append(('GET', self.headers.get('Range')))
+                start = self._headers()
+                if start is None:
+                    return
+                data = server.body[start:]
+                if server.truncate_at is not None:
+                    data = data[:server.truncate_at]
+                    self.close_connection = True
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/model.bin"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def server():
+    server = ModelServer()
+    yield server
+    server.close()
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(download_models, 'RETRY_DELAY', 0)
+
+def model_file(server, tmp_path, **entry):
+    return ModelFile(dict({'url': server.url, 'dest': 'vae/model.bin'}, **entry), str(tmp_path / 'models'))
+
+def test_download_verifies_and_stamps(server, tmp_path):
+    model = model_file(server, tmp_path, sha256=SHA256, size=len(BODY))
+    result = download(model, BandwidthLimiter())
+    assert result['status'] == 'downloaded' and result['verified']
+    assert result['bytes'] == len(BODY)
+    with open(model.dest, 'rb') as f:
+        assert f.read() == BODY
+    assert not os.path.exists(model.part_path)
+    assert check_existing(model) == (True, SHA256)
+
+    # A rerun trusts the stamp and downloads nothing
+    server.requests.clear()
+    assert download(model, BandwidthLimiter())['status'] == 'present'
+    assert server.requests == []
+
+def test_resume_from_part_file(server, tmp_path):
+    model = model_file(server, tmp_path, sha256=SHA256, size=len(BODY))
+    os.makedirs(os.path.dirname(model.dest))
+    offset = download_models.CHUNK_SIZE + 100
+    with open(model.part_path, 'wb') as f:
+        f.write(BODY[:offset])
+
+    assert fetch(model, BandwidthLimiter()) == (SHA256, len(BODY), len(BODY) - offset)
+    assert server.requests == [('GET', f"bytes={offset}-")]
+
+def test_resume_restarts_when_range_is_ignored(server, tmp_path):
+    server.ignore_range = True
+    model = model_file(server, tmp_path)
+    os.makedirs(os.path.dirname(model.dest))
+    with open(model.part_path, 'wb') as f:
+        f.write(b'stale bytes')
+
+    assert fetch(model, BandwidthLimiter()) == (SHA256, len(BODY), len(BODY))
+    with open(model.part_path, 'rb') as f:
+        assert f.read() == BODY
+
+def test_complete_part_file_is_not_downloaded_again(server, tmp_path):
+    model = model_file(server, tmp_path, size=len(BODY))
+    os.makedirs(os.path.dirname(model.dest))
+    with open(model.part_path, 'wb') as f:
+        f.write(BODY)
+    assert fetch(model, BandwidthLimiter()) == (SHA256, len(BODY), 0)
+
+def test_short_body_is_rejected_and_resumed(server, tmp_path):
+    server.truncate_at = 2 * download_models.CHUNK_SIZE
+    model = model_file(server, tmp_path)
+    with pytest.raises(DownloadError):
+        fetch(model, BandwidthLimiter())
+    assert os.path.getsize(model.part_path) == server.truncate_at
+    assert not os.path.exists(model.dest)
+
+    server.truncate_at = None
+    assert fetch(model, BandwidthLimiter())[0] == SHA256
+    assert server.requests[-1] == ('GET', f"bytes={2 * download_models.CHUNK_SIZE}-")
+
+def test_short_body_fails_the_download(server, tmp_path):
+    server.truncate_at = 1000
+    model = model_file(server, tmp_path)
+    result = download(model, BandwidthLimiter())
+    assert result['status'] == 'failed'
+    assert 'connection closed' in result['error']
+    assert not os.path.exists(model.dest)
+
+def test_bad_hash_discards_the_part_file(server, tmp_path):
+    model = model_file(server, tmp_path, sha256='0' * 64)
+    result = download(model, BandwidthLimiter())
+    assert result['status'] == 'failed'
+    assert 'sha256' in result['error']
+    assert not os.path.exists(model.dest)
+    assert not os.path.exists(model.part_path)
+    # Every attempt starts from scratch instead of resuming corrupt data
+    assert [request for request in server.requests if request[0] == 'GET'] == [('GET', None)] * download_models.MAX_RETRIES
+
+def test_truncated_existing_file_is_replaced(server, tmp_path):
+    model = model_file(server, tmp_path)
+    os.makedirs(os.path.dirname(model.dest))
+    with open(model.dest, 'wb') as f:
+        f.write(BODY[:1000])
+
+    keep, reason = check_existing(model)
+    assert not keep and 'size 1000' in reason
+    assert download(model, BandwidthLimiter())['status'] == 'downloaded'
+    assert os.path.getsize(model.dest) == len(BODY)
+
+def test_unpinned_file_installs_from_cache(server, tmp_path):
+    cache = ModelCache(str(tmp_path / 'cache'))
+    first = ModelFile({'url': server.url, 'dest': 'vae/model.bin'}, str(tmp_path / 'a'))
+    assert download(first, BandwidthLimiter(), cache)['status'] == 'downloaded'
+
+    second = ModelFile({'url': server.url, 'dest': 'vae/model.bin'}, str(tmp_path / 'b'))
+    result = download(second, BandwidthLimiter(), cache)
+    assert result['status'] == 'cached' and result['sha256'] == SHA256
+    with open(second.dest, 'rb') as f:
+        assert f.read() == BODY
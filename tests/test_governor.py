@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+
+from governor import (FATAL, THROTTLE, TRANSIENT, CircuitBreaker, CircuitOpenError, Governor, TokenBucket, classify,
+                      retry_after)
+
+class ClientError(Exception):
+    """Shaped like botocore's ClientError"""
+
+    def __init__(self, code, status=400, headers=None):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code},
+                         'ResponseMetadata': {'HTTPStatusCode': status, 'HTTPHeaders': headers or {}}}
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+class HttpResponseError(Exception):
+    """Shaped like azure.core's HttpResponseError"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = Response(headers or {})
+
+class EndpointConnectionError(Exception):
+    pass
+
+class FakeClient:
+    """Raises the scripted errors in order, then returns 'ok'"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def describe(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+    async def adescribe(self):
+        return self.describe()
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def make_governor(clock, **kwargs):
+    return Governor('aws', 'test', clock=clock, sleep=clock.sleep, rng=lambda: 1.0, **kwargs)
+
+def test_classify():
+    assert classify(ClientError('RequestLimitExceeded')) == THROTTLE
+    assert classify(ClientError('Throttling')) == THROTTLE
+    assert classify(HttpResponseError(429)) == THROTTLE
+    assert classify(ClientError('InternalError', status=500)) == TRANSIENT
+    assert classify(ClientError('Whatever', status=503)) == TRANSIENT
+    assert classify(HttpResponseError(502)) == TRANSIENT
+    assert classify(HttpResponseError(408)) == TRANSIENT
+    assert classify(EndpointConnectionError()) == TRANSIENT
+    assert classify(ConnectionResetError()) == TRANSIENT
+    assert classify(ClientError('InvalidInstanceID.NotFound')) == FATAL
+    assert classify(HttpResponseError(404)) == FATAL
+    assert classify(ValueError('bad')) == FATAL
+
+def test_retry_after():
+    assert retry_after(HttpResponseError(429, {'Retry-After': '7'})) == 7
+    assert retry_after(ClientError('Throttling', headers={'retry-after': '3'})) == 3
+    assert retry_after(ClientError('Throttling')) is None
+    assert retry_after(HttpResponseError(429, {'Retry-After': 'soon'})) is None
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=3, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Reservations queue up behind each other at the refill rate
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock.now += 10
+    # Refills up to the burst only
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.5)
+
+def test_circuit_breaker_transitions():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    for _ in range(2):
+        breaker.before_call('op')
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.before_call('op')
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call('op')
+
+    clock.now += 30
+    assert breaker.state == 'half-open'
+    breaker.before_call('op')
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call('op')
+    # A failed trial reopens it at once
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    clock.now += 30
+    breaker.before_call('op')
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.failures == 0
+
+def test_fatal_errors_do_not_open_the_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, clock=clock)
+    governor = make_governor(clock, breaker=breaker)
+    for _ in range(5):
+        with pytest.raises(ClientError):
+            governor.call('describe', FakeClient(ClientError('InvalidParameterValue')).describe)
+    assert breaker.state == 'closed'
+
+def test_call_retries_throttles_and_transient_errors():
+    clock = FakeClock()
+    governor = make_governor(clock)
+    client = FakeClient(ClientError('RequestLimitExceeded'), EndpointConnectionError(),
+                        HttpResponseError(503, {'Retry-After': '4'}))
+    assert governor.call('describe', client.describe) == 'ok'
+    assert client.calls == 4
+    # Full jitter with rng=1: 0.5, 1, 2, except where Retry-After asks for more
+    assert clock.sleeps == [0.5, 1.0, 4.0]
+    assert governor.breaker.failures == 0
+
+def test_call_raises_after_max_attempts():
+    clock = FakeClock()
+    governor = make_governor(clock, max_attempts=3)
+    client = FakeClient(*[ClientError('Throttling')] * 5)
+    with pytest.raises(ClientError):
+        governor.call('describe', client.describe)
+    assert client.calls == 3
+    assert clock.sleeps == [0.5, 1.0]
+
+def test_call_does_not_retry_fatal_errors():
+    clock = FakeClock()
+    governor = make_governor(clock)
+    client = FakeClient(ClientError('UnauthorizedOperation'))
+    with pytest.raises(ClientError):
+        governor.call('describe', client.describe)
+    assert client.calls == 1
+    assert clock.sleeps == []
+
+def test_call_fails_fast_while_the_circuit_is_open():
+    clock = FakeClock()
+    governor = make_governor(clock, max_attempts=2, breaker=CircuitBreaker(failure_threshold=2, clock=clock))
+    with pytest.raises(ClientError):
+        governor.call('describe', FakeClient(*[ClientError('InternalError', status=500)] * 2).describe)
+    client = FakeClient()
+    with pytest.raises(CircuitOpenError):
+        governor.call('describe', client.describe)
+    assert client.calls == 0
+
+def test_rate_limit_waits_between_calls():
+    clock = FakeClock()
+    governor = make_governor(clock, limits={'read': (2.0, 1), 'write': (1.0, 1)})
+    client = FakeClient()
+    for _ in range(3):
+        governor.call('describe', client.describe)
+    assert clock.sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+
+def test_acall_retries_then_raises():
+    clock = FakeClock()
+    governor = make_governor(clock, max_attempts=2)
+    delays = []
+
+    async def fake_sleep(seconds):
+        delays.append(seconds)
+
+    async def run(client):
+        original = asyncio.sleep
+        asyncio.sleep = fake_sleep
+        try:
+            return await governor.acall('get', client.adescribe)
+        finally:
+            asyncio.sleep = original
+
+    assert asyncio.run(run(FakeClient(HttpResponseError(429)))) == 'ok'
+    with pytest.raises(HttpResponseError):
+        asyncio.run(run(FakeClient(HttpResponseError(500), HttpResponseError(500))))
+    assert delays == [0.5, 0.5]
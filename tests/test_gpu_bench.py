@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+import gpu_bench
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gpu_bench')
+
+def read(name):
+    with open(os.path.join(DATA_DIR, name)) as f:
+        return f.read()
+
+def test_parse_nccl_with_root_column():
+    parsed = gpu_bench.parse_nccl(read('all_reduce_perf_root.log'))
+    assert len(parsed['rows']) == 7
+    assert len(parsed['devices']) == 8
+    assert parsed['devices'][3] == {'rank': 3, 'host': 'gpu-node-1', 'device': 3, 'bus_id': '0x4c',
+                                    'name': 'NVIDIA A100-SXM4-80GB'}
+    last = parsed['rows'][-1]
+    assert (last['size'], last['count'], last['type'], last['redop']) == (4294967296, 1073741824, 'float', 'sum')
+    assert last['out_of_place'] == {'time_us': 36012, 'algbw': 119.26, 'busbw': 208.71, 'wrong': 0}
+    assert parsed['avg_busbw'] == pytest.approx(69.5917)
+    assert parsed['peak_busbw'] == pytest.approx(208.84)
+    assert parsed['small_latency_us'] == pytest.approx(38.12)
+    assert parsed['out_of_bounds'] == 0
+
+def test_parse_nccl_without_root_column():
+    parsed = gpu_bench.parse_nccl(read('all_reduce_perf_noroot.log'))
+    assert [row['size'] for row in parsed['rows']] == [8, 16, 1048576, 134217728]
+    assert parsed['devices'][1]['host'] == 'a10-node-3'
+    assert parsed['devices'][1]['name'] == 'NVIDIA A10'
+    assert parsed['rows'][2]['in_place'] == {'time_us': 121.1, 'algbw': 8.66, 'busbw': 8.66, 'wrong': 0}
+    assert parsed['peak_busbw'] == pytest.approx(11.31)
+    assert parsed['small_latency_us'] == pytest.approx(14.62)
+
+def test_parse_nccl_without_validation():
+    parsed = gpu_bench.parse_nccl(read('all_reduce_perf_nocheck.log'))
+    assert len(parsed['rows']) == 4
+    assert all(row[prefix]['wrong'] is None for row in parsed['rows'] for prefix in ('out_of_place', 'in_place'))
+    assert parsed['devices'][0]['name'] == 'NVIDIA H100 80GB HBM3'
+    assert parsed['peak_busbw'] == pytest.approx(356.43)
+
+def test_parse_nccl_without_rows():
+    with pytest.raises(gpu_bench.BenchError):
+        gpu_bench.parse_nccl("# nThread 1 nGpus 2\n# Avg bus bandwidth    : 0\n")
+
+def test_parse_torch():
+    parsed = gpu_bench.parse_torch(read('torch_bench.log'))
+    assert [record['rank'] for record in parsed['matmul']] == [0, 1]
+    assert parsed['matmul_tflops_min'] == pytest.approx(268.04)
+    assert parsed['matmul_tflops_mean'] == pytest.approx((268.04 + 274.88) / 2)
+    assert parsed['all_reduce_peak_busbw'] == pytest.approx(195.19)
+    with pytest.raises(gpu_bench.BenchError):
+        gpu_bench.parse_torch("no results here\n")
+
+def test_percentile():
+    assert gpu_bench.percentile([4, 1, 3, 2], 0) == 1
+    assert gpu_bench.percentile([4, 1, 3, 2], 50) == 2.5
+    assert gpu_bench.percentile([4, 1, 3, 2], 100) == 4
+    assert gpu_bench.percentile([7], 10) == 7
+
+def result(host, gpus, device, busbw, latency):
+    return {'host': host, 'gpus': gpus,
+            'nccl': {'devices': [{'name': device}], 'avg_busbw': busbw, 'peak_busbw': busbw * 3,
+                     'small_latency_us': latency}}
+
+def test_compare_only_against_same_gpus():
+    latest = {f"a100-{i}": result(f"a100-{i}", 8, 'NVIDIA A100-SXM4-80GB', 70 + i, 38 + i) for i in range(4)}
+    latest['slow'] = result('slow', 8, 'NVIDIA A100-SXM4-80GB', 40, 60)
+    # Smaller machines must neither drag the fleet down nor count towards it
+    latest.update({f"a10-{i}": result(f"a10-{i}", 2, 'NVIDIA A10', 5, 14) for i in range(5)})
+
+    comparisons = {entry['metric']: entry for entry in gpu_bench.compare('slow', latest)}
+    assert comparisons['nccl_avg_busbw']['fleet_size'] == 4
+    assert comparisons['nccl_avg_busbw']['flagged']
+    assert comparisons['nccl_small_latency_us']['flagged']
+    assert not any(entry['flagged'] for entry in gpu_bench.compare('a100-2', latest))
+    assert not any(entry['flagged'] for entry in gpu_bench.compare('a10-0', latest))
+
+def test_compare_needs_a_fleet():
+    latest = {'a': result('a', 8, 'NVIDIA A100-SXM4-80GB', 70, 38),
+              'b': result('b', 8, 'NVIDIA A100-SXM4-80GB', 10, 90),
+              'c': result('c', 4, 'NVIDIA A100-SXM4-80GB', 70, 38),
+              'd': result('d', 4, 'NVIDIA A100-SXM4-80GB', 70, 38)}
+    comparisons = gpu_bench.compare('b', latest)
+    assert all(entry['fleet_size'] == 1 and 'threshold' not in entry and not entry['flagged']
+               for entry in comparisons)
+
+def test_fleet_key_falls_back_to_torch_device():
+    parsed = gpu_bench.parse_torch(read('torch_bench.log'))
+    assert gpu_bench.fleet_key({'gpus': 2, 'torch': parsed}) == (2, 'NVIDIA A100-SXM4-80GB')
+    assert gpu_bench.fleet_key({'gpus': 1}) == (1, None)
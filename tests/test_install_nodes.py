@@ -0,0 +1,41 @@
+import pytest
+
+from install_nodes import NodeRepo, Requirement, find_conflict, merge_requirements
+
+def entries(*lines):
+    return [(f"repo{index}", Requirement(line)) for index, line in enumerate(lines)]
+
+@pytest.mark.parametrize('lines', [
+    ('numpy<2', 'numpy>=2'),
+    ('numpy==1.26.4', 'numpy==1.26.3'),
+    ('numpy~=1.4.2', 'numpy>=1.5'),
+    ('numpy!=1.0', 'numpy==1.0'),
+    ('numpy>1', 'numpy<=1'),
+    ('numpy', 'numpy>=2,<3', 'numpy<1.20'),
+])
+def test_disjoint_requirements_conflict(lines):
+    assert 'allow no common version' in find_conflict(entries(*lines))
+
+@pytest.mark.parametrize('lines', [
+    ('numpy', 'numpy'),
+    ('numpy==1.26.4', 'numpy>=1.25'),
+    ('numpy>=1,<3', 'numpy>=2'),
+    ('numpy==1.2.*', 'numpy<1.3'),
+    ('torch>2.0,<2.0.1', 'torch'),
+    ('numpy===custom', 'numpy<1'),
+])
+def test_overlapping_requirements_pass(lines):
+    assert find_conflict(entries(*lines)) is None
+
+def test_merge_names_the_conflicting_repos(tmp_path):
+    repos = []
+    for name, requirements in (('nodes-a', 'numpy<2\nopencv-python\n'), ('nodes-b', 'numpy>=2\n'),
+                               ('nodes-c', 'numpy\n')):
+        repo = NodeRepo(f"https://github.com/example/{name}.git", clone_dir=str(tmp_path))
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'requirements.txt').write_text(requirements)
+        repos.append(repo)
+    merged, passthrough, conflicts = merge_requirements(repos)
+    assert merged == ['numpy<2,>=2', 'opencv-python']
+    assert conflicts == ['numpy: <2 from nodes-a and >=2 from nodes-b allow no common version '
+                         '(nodes-a wants numpy<2, nodes-b wants numpy>=2, nodes-c wants numpy)']
@@ -0,0 +1,154 @@
+import copy
+import json
+import os
+import sys
+
+import pytest
+
+import batch_server
+import inventory
+from inventory import Inventory, ReplayProvider, matches, parse_selector
+
+RECORDING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'inventory', 'recording.json')
+SOURCES = [('azure', 'TRI3D_ML'), ('aws', 'us-west-2')]
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def recording():
+    with open(RECORDING_PATH) as f:
+        return json.load(f)
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def index(recording, clock):
+    index = Inventory(':memory:', factory=lambda name: ReplayProvider(recording, name), clock=clock)
+    yield index
+    index.close()
+
+def names(instances):
+    return sorted(instance['identifier'] for instance in instances)
+
+def test_sync_indexes_every_source(index):
+    summary = index.sync(SOURCES)
+    assert summary[('azure', 'TRI3D_ML')] == {'added': 3, 'changed': 0, 'removed': 0, 'unchanged': 0}
+    assert summary[('aws', 'us-west-2')] == {'added': 1, 'changed': 0, 'removed': 0, 'unchanged': 0}
+    assert names(index.instances()) == ['a100-node-1', 'a100-node-2', 'i-0abc123', 't4-trainer']
+    assert index.last_synced('aws', 'us-west-2') == 1000.0
+
+def test_sync_diffs_against_the_index(index, recording, clock):
+    index.sync(SOURCES)
+    listing = recording['azure:TRI3D_ML']
+    listing[0]['state'] = 'deallocated'
+    listing[1]['tags']['owner'] = 'render'
+    listing.pop(2)
+    listing.append(dict(listing[0], identifier='a100-node-3', state='running'))
+    clock.now += 60
+
+    summary = index.sync(SOURCES)
+    assert summary[('azure', 'TRI3D_ML')] == {'added': 1, 'changed': 2, 'removed': 1, 'unchanged': 0}
+    assert summary[('aws', 'us-west-2')] == {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 1}
+    rows = {instance['identifier']: instance for instance in index.instances()}
+    assert 't4-trainer' not in rows
+    assert rows['a100-node-1']['state'] == 'deallocated'
+    assert rows['a100-node-1']['first_seen'] == 1000.0
+    assert rows['a100-node-1']['updated'] == 1060.0
+    assert rows['a100-node-2']['tags']['owner'] == 'render'
+    assert rows['i-0abc123']['updated'] == 1000.0
+
+def test_sync_skips_sources_within_max_age(index, clock):
+    index.sync(SOURCES)
+    clock.now += 30
+    summary = index.sync(SOURCES, max_age=60)
+    assert all(counts == {'skipped': True} for counts in summary.values())
+    clock.now += 31
+    summary = index.sync(SOURCES, max_age=60)
+    assert summary[('azure', 'TRI3D_ML')]['unchanged'] == 3
+
+def test_failed_listing_keeps_previous_rows(index):
+    index.sync(SOURCES)
+    summary = index.sync(SOURCES + [('aws', 'eu-west-1')])
+    assert 'No recorded listing for aws:eu-west-1' in summary[('aws', 'eu-west-1')]['error']
+    assert len(index.instances()) == 4
+
+def test_parse_selector():
+    assert parse_selector('gpu=a100|T4, state!=running,spot') == [
+        ('gpu', False, ['a100', 't4']),
+        ('state', True, ['running']),
+        ('spot', False, None),
+    ]
+    assert parse_selector(None) == []
+    with pytest.raises(ValueError):
+        parse_selector('=a100')
+
+def test_select_filters(index):
+    index.sync(SOURCES)
+    assert names(index.select('gpu=a100')) == ['a100-node-1', 'a100-node-2']
+    assert names(index.select('role=comfy,state=deallocated|stopped')) == ['a100-node-2', 'i-0abc123']
+    assert names(index.select('provider=aws')) == ['i-0abc123']
+    assert names(index.select('state!=running,provider!=aws')) == ['a100-node-2', 't4-trainer']
+    assert names(index.select('size=standard_nc*')) == ['a100-node-1', 'a100-node-2', 't4-trainer']
+    assert names(index.select('name=a10g-*')) == ['i-0abc123']
+    assert names(index.select('role=training')) == ['t4-trainer']
+    assert index.select('gpu=h100') == []
+
+def test_matches_tags_case_insensitively():
+    instance = {'provider': 'aws', 'location': 'us-west-2', 'region': 'us-west-2', 'size': 'g5.xlarge',
+                'state': 'stopped', 'identifier': 'i-1', 'tags': {'GPU': 'A10G'}}
+    assert matches(instance, parse_selector('gpu=a10g'))
+    assert not matches(instance, parse_selector('gpu!=a10g'))
+
+def test_record_then_replay(tmp_path, monkeypatch, capsys, recording):
+    replayed = tmp_path / 'replayed.json'
+    db = tmp_path / 'inventory.db'
+    monkeypatch.setattr(sys, 'argv', ['inventory.py', 'sync', '--replay', RECORDING_PATH, '--record', str(replayed),
+                                      '--db', str(db), '--source', 'azure:TRI3D_ML', '--source', 'aws:us-west-2'])
+    with pytest.raises(SystemExit) as exit_info:
+        inventory.main()
+    assert exit_info.value.code == 0
+    assert 'azure:TRI3D_ML: 3 added, 0 changed, 0 removed, 0 unchanged' in capsys.readouterr().out
+    with open(replayed) as f:
+        assert json.load(f) == recording
+
+    monkeypatch.setattr(sys, 'argv', ['inventory.py', 'list', 'gpu=a100', '--json', '--db', str(db)])
+    with pytest.raises(SystemExit):
+        inventory.main()
+    assert names(json.loads(capsys.readouterr().out)) == ['a100-node-1', 'a100-node-2']
+
+def test_replay_of_missing_source_fails(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['inventory.py', 'sync', '--replay', RECORDING_PATH,
+                                      '--db', str(tmp_path / 'inventory.db'), '--source', 'aws:eu-west-1'])
+    with pytest.raises(SystemExit) as exit_info:
+        inventory.main()
+    assert exit_info.value.code == 1
+    assert 'aws:eu-west-1: ERROR' in capsys.readouterr().out
+
+class Provider:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+def test_record_state_resolves_default_locations(index, monkeypatch):
+    index.sync(SOURCES)
+    batch_server.record_state(index, 'start', batch_server.Target('a100-node-2'),
+                              Provider(default_resource_group='TRI3D_ML'))
+    batch_server.record_state(index, 'start', batch_server.Target('i-0abc123', 'aws'), Provider(region='us-west-2'))
+    monkeypatch.setenv('AZURE_RESOURCE_GROUP', 'TRI3D_ML')
+    batch_server.record_state(index, 'stop', batch_server.Target('a100-node-1'))
+    states = {instance['identifier']: instance['state'] for instance in index.instances()}
+    assert states == {'a100-node-1': 'deallocated', 'a100-node-2': 'running', 'i-0abc123': 'running',
+                      't4-trainer': 'deallocated'}
+
+def test_select_targets(index):
+    index.sync(SOURCES)
+    targets = batch_server.select_targets(['gpu=a100', 'state=deallocated'], index)
+    assert sorted(str(target) for target in targets) == [
+        'azure:a100-node-1 (TRI3D_ML)', 'azure:a100-node-2 (TRI3D_ML)', 'azure:t4-trainer (TRI3D_ML)']
+    assert [target.call_kwargs() for target in targets][0] == {'resource_group': 'TRI3D_ML'}
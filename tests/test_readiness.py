@@ -0,0 +1,156 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from cloud_providers import CloudProvider
+from readiness import (Backoff, HttpProbe, ProbeFailed, SettleProbe, TcpProbe, comfyui_probes, service_probes,
+                       wait_until_ready)
+
+class StandIn:
+    """Local HTTP server answering each path with a scripted sequence of status codes"""
+
+    def __init__(self, responses):
+        self.responses = {path: list(statuses) for path, statuses in responses.items()}
+        self.requests = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.requests.append(self.path)
+                statuses = stand_in.responses.get(self.path, [404])
+                status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+                body = b'{}'
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stand_in():
+    servers = []
+
+    def start(responses):
+        server = StandIn(responses)
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.close()
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class FakeProvider(CloudProvider):
+    provider_name = 'fake'
+    running_failure_states = ('terminated',)
+
+    def __init__(self, states):
+        self.states = list(states)
+        self.calls = []
+
+    def check_instance_status(self, instance_id, **kwargs):
+        self.calls.append(kwargs)
+        return self.states.pop(0) if len(self.states) > 1 else self.states[0]
+
+    def start_instance(self, instance_id, **kwargs):
+        return True
+
+    def stop_instance(self, instance_id, **kwargs):
+        return True
+
+    def wait_for_running_status(self, instance_id, **kwargs):
+        return self.wait_for_ready(instance_id, **kwargs).ready
+
+def test_http_probe_statuses(stand_in):
+    server = stand_in({'/system_stats': [200], '/training': [404], '/down': [502]})
+    assert HttpProbe(f"{server.url}/system_stats").check()
+    assert not HttpProbe(f"{server.url}/down").check()
+    assert not HttpProbe(f"{server.url}/training").check()
+    assert HttpProbe(f"{server.url}/training", ok_statuses=range(200, 500)).check()
+
+def test_wait_until_ready_polls_until_comfyui_answers(stand_in):
+    server = stand_in({'/system_stats': [502, 502, 200], '/training': [504, 404]})
+    clock = FakeClock()
+    result = wait_until_ready(comfyui_probes('127.0.0.1', port=server.port, training=True), timeout=60,
+                              sleep=clock.sleep, clock=clock)
+    assert result.ready, result.error
+    assert [name for name, _ in result.phases] == [f"tcp:{server.port}", 'comfyui:/system_stats',
+                                                    'training:/training']
+    assert server.requests == ['/system_stats'] * 3 + ['/training'] * 2
+    # Two failed polls with a 1s then 1.5s backoff, then one for /training
+    assert result.phase_durations()['comfyui:/system_stats'] == pytest.approx(2.5)
+    assert result.elapsed == pytest.approx(3.5)
+
+def test_wait_until_ready_times_out(stand_in):
+    server = stand_in({'/system_stats': [503]})
+    clock = FakeClock()
+    result = wait_until_ready([HttpProbe(f"{server.url}/system_stats", name='comfyui')], timeout=10,
+                              backoff=Backoff(initial=2, factor=1), sleep=clock.sleep, clock=clock)
+    assert not result.ready
+    assert result.failed_phase == 'comfyui'
+    assert result.elapsed == pytest.approx(10)
+
+def test_tcp_probe_refused():
+    server = StandIn({})
+    port = server.port
+    server.close()
+    clock = FakeClock()
+    result = wait_until_ready([TcpProbe('127.0.0.1', port, timeout=0.5)], timeout=3, sleep=clock.sleep, clock=clock)
+    assert not result.ready
+    assert isinstance(result.error, OSError)
+
+def test_settle_probe_waits_exactly():
+    clock = FakeClock()
+    result = wait_until_ready([SettleProbe(15, clock=clock)], timeout=60, sleep=clock.sleep, clock=clock)
+    assert result.ready
+    assert result.elapsed == pytest.approx(15)
+
+def test_service_probes_settle_only_without_host_or_probes():
+    assert [probe.name for probe in service_probes()] == ['settle']
+    assert service_probes(settle=0) == []
+    assert [probe.name for probe in service_probes('node.example.com')] == ['tcp:80', 'comfyui:/system_stats']
+    extra = HttpProbe('http://127.0.0.1:1/', name='extra')
+    assert service_probes(probes=[extra]) == [extra]
+
+def test_wait_for_ready_against_stand_in(stand_in):
+    server = stand_in({'/system_stats': [502, 200]})
+    provider = FakeProvider(['starting', 'running'])
+    result = provider.wait_for_ready('vm-1', timeout=30,
+                                     probes=comfyui_probes('127.0.0.1', port=server.port), resource_group='rg')
+    assert result.ready, result.error
+    assert [name for name, _ in result.phases] == ['cloud:running', f"tcp:{server.port}", 'comfyui:/system_stats']
+    assert provider.calls == [{'max_age': 0, 'resource_group': 'rg'}] * 2
+
+def test_wait_for_ready_settles_without_host():
+    provider = FakeProvider(['running'])
+    result = provider.wait_for_ready('vm-1', timeout=30, settle=0.2)
+    assert result.ready
+    assert [name for name, _ in result.phases] == ['cloud:running', 'settle']
+    assert result.phase_durations()['settle'] >= 0.2
+
+def test_wait_for_ready_stops_on_failure_state():
+    provider = FakeProvider(['starting', 'terminated'])
+    result = provider.wait_for_ready('vm-1', timeout=30)
+    assert not result.ready
+    assert result.failed_phase == 'cloud:running'
+    assert isinstance(result.error, ProbeFailed)
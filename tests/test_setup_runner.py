@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+
+import pytest
+
+import setup_runner
+from setup_runner import STEPS
+
+APT_STEPS = ('nvidia', 'nginx', 'flask-training')
+
+STUB = """#!/bin/bash
+echo "$(basename "$0") $*"
+sleep 0.2
+{extra}
+"""
+
+# A stub that reports a sub-item the way the real scripts do through timeline.record_event
+EVENT_STUB = """
+python3 -c '
+import time
+from timeline import record_event
+record_event("repo", "ComfyUI-Manager", time.time() - 0.1, "ok")
+'
+"""
+
+def write_stubs(stub_dir, **extra):
+    stub_dir.mkdir(exist_ok=True)
+    for step in STEPS:
+        (stub_dir / step.script).write_text(STUB.format(extra=extra.get(step.name.replace('-', '_'), '')))
+
+def run(monkeypatch, tmp_path, *args):
+    output = tmp_path / 'timeline.json'
+    monkeypatch.setattr(sys, 'argv', ['setup_runner.py', 'comfy.example.com', '--stub-dir', str(tmp_path / 'stubs'),
+                                      '--stamp-dir', str(tmp_path / 'stamps'), '--output', str(output), *args])
+    status = 0
+    try:
+        setup_runner.main()
+    except SystemExit as e:
+        status = e.code
+    with open(output) as f:
+        return status, json.load(f)
+
+def by_name(timeline):
+    return {entry['name']: entry for entry in timeline['steps']}
+
+def test_steps_run_in_dependency_and_resource_order(tmp_path, monkeypatch, capsys):
+    write_stubs(tmp_path / 'stubs', nodes=EVENT_STUB)
+    status, timeline = run(monkeypatch, tmp_path)
+    assert status == 0
+    assert timeline['mode'] == 'stub' and timeline['ok']
+    steps = by_name(timeline)
+    assert set(steps) == {step.name for step in STEPS}
+    assert all(entry['status'] == 'ok' for entry in steps.values())
+
+    for name in ('nodes', 'models'):
+        assert steps[name]['start'] >= steps['comfyui']['end']
+    # The apt steps share the dpkg lock and never overlap
+    apt = sorted((steps[name] for name in APT_STEPS), key=lambda entry: entry['start'])
+    for before, after in zip(apt, apt[1:]):
+        assert after['start'] >= before['end']
+    # Independent steps do overlap
+    assert steps['comfyui']['start'] < apt[0]['end']
+
+    assert steps['nginx']['command'][-2:] == ['comfy.example.com', '--non-interactive']
+    assert [item['name'] for item in steps['nodes']['items']] == ['ComfyUI-Manager']
+
+    out = capsys.readouterr().out
+    assert '[nginx] nginx-setup-20250205.sh comfy.example.com --non-interactive' in out
+    assert 'Setup timeline for' in out and '(stub)' in out
+
+def test_checked_steps_are_stamped_and_skipped_on_rerun(tmp_path, monkeypatch):
+    write_stubs(tmp_path / 'stubs')
+    run(monkeypatch, tmp_path)
+    stamped = {name[:-len('.json')] for name in os.listdir(tmp_path / 'stamps')}
+    # flask-training has no check, so it is never stamped
+    assert stamped == {step.name for step in STEPS} - {'flask-training'}
+
+    status, timeline = run(monkeypatch, tmp_path)
+    assert status == 0
+    steps = by_name(timeline)
+    assert {name for name, entry in steps.items() if entry['status'] == 'cached'} == stamped
+    assert steps['flask-training']['status'] == 'ok'
+
+    status, timeline = run(monkeypatch, tmp_path, '--force', '--only', 'nginx')
+    assert [(entry['name'], entry['status']) for entry in timeline['steps']] == [('nginx', 'ok')]
+
+def test_changed_inputs_rerun_the_step_and_its_dependents(tmp_path, monkeypatch):
+    write_stubs(tmp_path / 'stubs')
+    run(monkeypatch, tmp_path)
+    (tmp_path / 'stubs' / 'comfy-install-venv-20250205.sh').write_text(STUB.format(extra='echo changed'))
+    _, timeline = run(monkeypatch, tmp_path)
+    reran = {name for name, entry in by_name(timeline).items() if entry['status'] == 'ok'}
+    assert reran == {'comfyui', 'nodes', 'models', 'flask-training'}
+
+def test_failed_step_skips_dependents_and_resumes(tmp_path, monkeypatch):
+    write_stubs(tmp_path / 'stubs', comfyui='exit 4')
+    status, timeline = run(monkeypatch, tmp_path)
+    assert status == 1 and not timeline['ok']
+    steps = by_name(timeline)
+    assert (steps['comfyui']['status'], steps['comfyui']['exit_status']) == ('failed', 4)
+    assert steps['nodes']['status'] == steps['models']['status'] == 'skipped'
+    assert all(steps[name]['status'] == 'ok' for name in APT_STEPS)
+
+    write_stubs(tmp_path / 'stubs')
+    status, timeline = run(monkeypatch, tmp_path)
+    assert status == 0
+    steps = by_name(timeline)
+    assert {name for name, entry in steps.items() if entry['status'] == 'cached'} == {'nvidia', 'nginx'}
+    assert all(steps[name]['status'] == 'ok' for name in ('comfyui', 'nodes', 'models'))
+
+def test_report_and_baseline_comparison(tmp_path, monkeypatch, capsys):
+    write_stubs(tmp_path / 'stubs')
+    _, timeline = run(monkeypatch, tmp_path)
+    baseline = dict(timeline, steps=[dict(entry, wall=entry['wall'] / 100) for entry in timeline['steps']])
+    baseline_path = tmp_path / 'baseline.json'
+    baseline_path.write_text(json.dumps(baseline))
+    folded = tmp_path / 'folded.txt'
+    capsys.readouterr()
+
+    monkeypatch.setattr(sys, 'argv', ['setup_runner.py', '--report', str(tmp_path / 'timeline.json'),
+                                      '--baseline', str(baseline_path), '--min-delta', '0', '--fail-on-regression',
+                                      '--folded', str(folded)])
+    with pytest.raises(SystemExit) as exit_info:
+        setup_runner.main()
+    assert exit_info.value.code == 3
+    out = capsys.readouterr().out
+    assert out.count('REGRESSION') == len(STEPS)
+    assert sorted(line.split(' ')[0] for line in folded.read_text().splitlines()) == sorted(
+        f"setup;{step.name}" for step in STEPS)
@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+
+from autoscaler import Node
+from test_autoscaler import Clock, FakeProvider
+from warm_pool import COLD, LEASED, STOPPING, WARM, WARMING, WarmPool, run_workflow
+
+class FlakyProvider(FakeProvider):
+    """FakeProvider whose starts of the nodes in `failing` fail"""
+
+    def __init__(self, states, failing=()):
+        super().__init__(states)
+        self.failing = set(failing)
+
+    def start_instance(self, name, **kwargs):
+        if name in self.failing:
+            self.started.append(name)
+            return False
+        return super().start_instance(name, **kwargs)
+
+def make_nodes(*names):
+    return [Node({'name': name, 'hourly_cost': cost}) for cost, name in enumerate(names, 1)]
+
+def make_pool(provider, size=1, names=('a', 'b', 'c'), **kwargs):
+    return WarmPool(make_nodes(*names), size=size, providers={('azure', None): provider}, **kwargs)
+
+def settle(pool):
+    """Wait for the warm-ups and stops running in the background"""
+    deadline = time.monotonic() + 10
+    while any(state in (WARMING, STOPPING) for state in pool.status().values()):
+        assert time.monotonic() < deadline, "pool did not settle"
+        time.sleep(0.01)
+
+def test_initialize_adopts_running_nodes_and_fills_up(capsys):
+    provider = FlakyProvider({'a': 'deallocated', 'b': 'running', 'c': 'running'})
+    pool = make_pool(provider, size=2)
+    pool.initialize()
+    settle(pool)
+    # b and c are adopted without a start; a stays cold since the pool is full
+    assert pool.status() == {'a': COLD, 'b': WARM, 'c': WARM}
+    assert provider.started == []
+
+    pool = make_pool(FlakyProvider({'a': 'running', 'b': 'running', 'c': 'deallocated'}), size=1)
+    pool.initialize()
+    settle(pool)
+    assert pool.status() == {'a': WARM, 'b': COLD, 'c': COLD}
+    assert 'b is running but the pool is full, not adopting it' in capsys.readouterr().out
+
+def test_lease_hands_out_the_cheapest_warm_node_and_refills():
+    provider = FlakyProvider({name: 'deallocated' for name in 'abc'})
+    pool = make_pool(provider, size=2)
+    pool.initialize()
+    settle(pool)
+    assert pool.status() == {'a': WARM, 'b': WARM, 'c': COLD}
+    assert provider.started == ['a', 'b']
+
+    assert pool.lease(timeout=5).name == 'a'
+    settle(pool)
+    assert pool.status() == {'a': LEASED, 'b': WARM, 'c': WARM}
+    assert pool.counts() == {COLD: 0, WARMING: 0, WARM: 2, LEASED: 1, STOPPING: 0}
+
+    # The pool is full again, so the returned node is deallocated
+    assert pool.release('a') is False
+    settle(pool)
+    assert pool.status() == {'a': COLD, 'b': WARM, 'c': WARM}
+    assert provider.stopped == ['a']
+
+    with pytest.raises(ValueError):
+        pool.release('a')
+
+def test_release_keeps_the_node_while_the_pool_is_short():
+    provider = FlakyProvider({'a': 'deallocated', 'b': 'deallocated'})
+    pool = make_pool(provider, size=2, names=('a', 'b'))
+    pool.initialize()
+    settle(pool)
+    assert [pool.lease(timeout=5).name, pool.lease(timeout=5).name] == ['a', 'b']
+    # Nothing left to warm or lease
+    assert pool.lease(timeout=5) is None
+    assert pool.release('b') is True
+    assert pool.status() == {'a': LEASED, 'b': WARM}
+    assert provider.stopped == []
+
+def test_lease_waits_for_a_node_warming_on_demand():
+    provider = FlakyProvider({'a': 'deallocated'})
+    gate = threading.Event()
+
+    def warm(node, start):
+        gate.wait(5)
+        provider.start_instance(node.name)
+
+    pool = make_pool(provider, size=0, names=('a',), warm=warm)
+    pool.initialize()
+    assert pool.status() == {'a': COLD}
+    threading.Timer(0.1, gate.set).start()
+    assert pool.lease(timeout=5).name == 'a'
+    assert provider.started == ['a']
+
+def test_failing_node_is_skipped_until_its_cooldown_ends():
+    clock = Clock()
+    provider = FlakyProvider({name: 'deallocated' for name in 'abc'}, failing={'a'})
+    pool = make_pool(provider, size=1, clock=clock, failure_cooldown=300)
+    pool.initialize()
+    settle(pool)
+    assert pool.status() == {'a': COLD, 'b': COLD, 'c': COLD}
+    assert pool.failed_until == {'a': 1300.0}
+
+    # The next refill moves on to the next cheapest node
+    assert pool.refill() == ['b']
+    settle(pool)
+    assert pool.lease(timeout=5).name == 'b'
+    settle(pool)
+    assert pool.status() == {'a': COLD, 'b': LEASED, 'c': WARM}
+    assert provider.started == ['a', 'b', 'c']
+
+    # a is retried once the cooldown is over, and cleared when it warms
+    provider.failing.clear()
+    assert pool.lease(timeout=5).name == 'c'
+    assert pool.refill() == []
+    clock.now += 300
+    assert pool.refill() == ['a']
+    settle(pool)
+    assert pool.status() == {'a': WARM, 'b': LEASED, 'c': LEASED}
+    assert pool.failed_until == {}
+
+def test_lease_gives_up_when_every_cold_node_is_cooling_down():
+    clock = Clock()
+    provider = FlakyProvider({'a': 'deallocated'}, failing={'a'})
+    pool = make_pool(provider, size=1, names=('a',), clock=clock)
+    pool.initialize()
+    settle(pool)
+    assert pool.lease(timeout=5) is None
+    assert provider.started == ['a']
+
+def test_run_workflow_waits_for_history():
+    node = Node({'name': 'a', 'host': '127.0.0.1', 'port': 8188})
+    posted = []
+    polls = iter([{}, {}, {'p1': {'status': {'status_str': 'success'}}}])
+
+    def http_post(url, payload, timeout):
+        posted.append((url, payload['prompt']))
+        return {'prompt_id': 'p1'}
+
+    run_workflow(node, {'1': {}}, http_get=lambda url, timeout: next(polls), http_post=http_post,
+                 sleep=lambda seconds: None)
+    assert posted == [('http://127.0.0.1:8188/prompt', {'1': {}})]
+
+    with pytest.raises(RuntimeError):
+        run_workflow(node, {}, http_get=lambda url, timeout: {'p1': {'status': {'status_str': 'error'}}},
+                     http_post=http_post, sleep=lambda seconds: None)